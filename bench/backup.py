@@ -0,0 +1,147 @@
+"""Benchmarks incremental backups on a generated world directory
+
+Compares a plain copy of the world with a full and an incremental backup, reports how long
+saving stays off (measured at the fake RCON server) and checks a restore round trip.
+
+Usage: python -m bench.backup [--regions 200] [--region-mb 4] [--change 0.05] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import filecmp
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from bench.fake_rcon import FakeRCONServer
+from utils.backup import BackupRepository
+from utils.rcon import RCONPool
+
+SECTOR = 4096
+
+
+def generate_world(world: str, regions: int, region_size: int, rng: random.Random) -> None:
+    for dim in ('region', 'DIM-1/region', 'DIM1/region'):
+        os.makedirs(os.path.join(world, dim), exist_ok=True)
+    for i in range(regions):
+        dim = ('region', 'DIM-1/region', 'DIM1/region')[i % 3]
+        path = os.path.join(world, dim, f'r.{i // 32}.{i % 32}.mca')
+        with open(path, 'wb') as f:
+            # Half random (already compressed chunk data), half zeros (unused sectors)
+            f.write(rng.randbytes(region_size // 2))
+            f.write(bytes(region_size - region_size // 2))
+    os.makedirs(os.path.join(world, 'playerdata'), exist_ok=True)
+    for i in range(20):
+        with open(os.path.join(world, 'playerdata', f'{i:08x}.dat'), 'wb') as f:
+            f.write(rng.randbytes(8 * 1024))
+    with open(os.path.join(world, 'level.dat'), 'wb') as f:
+        f.write(rng.randbytes(4 * 1024))
+    with open(os.path.join(world, 'session.lock'), 'wb') as f:
+        f.write(b'\xe2\x98\x83')
+
+
+def mutate_world(world: str, fraction: float, rng: random.Random) -> int:
+    """Rewrites a few sectors in a fraction of the region files, like a play session would"""
+    regions = [os.path.join(root, name) for root, _, files in os.walk(world) for name in files if name.endswith('.mca')]
+    changed = rng.sample(regions, max(1, int(len(regions) * fraction)))
+    for path in changed:
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            for _ in range(4):
+                f.seek(rng.randrange(size // SECTOR) * SECTOR)
+                f.write(rng.randbytes(SECTOR))
+    with open(os.path.join(world, 'level.dat'), 'wb') as f:
+        f.write(rng.randbytes(4 * 1024))
+    return len(changed)
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def same_tree(a: str, b: str) -> bool:
+    cmp = filecmp.dircmp(a, b, ignore=['session.lock'])
+    if cmp.left_only or cmp.right_only:
+        return False
+    _, mismatch, errors = filecmp.cmpfiles(a, b, cmp.common_files, shallow=False)
+    if mismatch or errors:
+        return False
+    return all(same_tree(os.path.join(a, d), os.path.join(b, d)) for d in cmp.common_dirs)
+
+
+def report(name: str, elapsed: float, size: int, extra: str = '') -> None:
+    print(f'{name:<28} {elapsed:>8.2f} s {size / 2 ** 20 / elapsed:>9.1f} MiB/s  {extra}')
+
+
+async def run(args) -> None:
+    tmp = tempfile.mkdtemp()
+    world = os.path.join(tmp, 'world')
+    rng = random.Random(0)
+    generate_world(world, args.regions, args.region_mb * 2 ** 20, rng)
+    size = dir_size(world)
+    print(f'World: {args.regions} region files, {size / 2 ** 20:.0f} MiB')
+
+    # Time saving is off as seen by the server: from save-off until save-on arrives
+    server = await FakeRCONServer().start()
+    marks = {}
+    server.commands['save-off'] = lambda _: marks.__setitem__('off', time.perf_counter()) or 'Automatic saving is now disabled'
+    server.commands['save-on'] = lambda _: marks.__setitem__('on', time.perf_counter()) or 'Automatic saving is now enabled'
+    server.commands['save-all'] = lambda _: 'Saved the game'
+    rcon = RCONPool(server.host, server.port, server.password)
+    repo = BackupRepository(os.path.join(tmp, 'backups'), workers=args.workers)
+
+    try:
+        start = time.perf_counter()
+        shutil.copytree(world, os.path.join(tmp, 'copy'))
+        report('plain copy (saving off)', time.perf_counter() - start, size)
+        shutil.rmtree(os.path.join(tmp, 'copy'))
+
+        start = time.perf_counter()
+        full = await repo.backup(world, rcon=rcon)
+        report('full backup', time.perf_counter() - start, size,
+                f'saving off {marks["on"] - marks["off"]:.2f}s, stored {full["stats"]["written"] / 2 ** 20:.0f} MiB')
+
+        changed = mutate_world(world, args.change, rng)
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        incremental = await repo.backup(world, rcon=rcon)
+        report(f'incremental ({changed} changed)', time.perf_counter() - start, size,
+               f'saving off {marks["on"] - marks["off"]:.2f}s, stored {incremental["stats"]["written"] / 2 ** 20:.1f} MiB')
+
+        start = time.perf_counter()
+        unchanged = await repo.backup(world, rcon=rcon)
+        report('no changes', time.perf_counter() - start, size, f'snapshot written: {unchanged is not None}')
+
+        store = dir_size(repo.root)
+        print(f'{"":<28} repository {store / 2 ** 20:.0f} MiB for 2 snapshots of {size / 2 ** 20:.0f} MiB')
+
+        target = os.path.join(tmp, 'restored')
+        start = time.perf_counter()
+        await repo.restore(incremental['name'], target)
+        report('restore', time.perf_counter() - start, size, f'identical: {same_tree(world, target)}')
+
+        start = time.perf_counter()
+        removed, deleted = await repo.prune(keep_last=1)
+        print(f'{"prune (keep 1)":<28} {time.perf_counter() - start:>8.2f} s removed {len(removed)} snapshots, '
+              f'{deleted} chunks')
+    finally:
+        repo.close()
+        await rcon.close()
+        await server.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--regions', type=int, default=200)
+    parser.add_argument('--region-mb', type=int, default=4)
+    parser.add_argument('--change', type=float, default=0.05, help='fraction of region files changed between backups')
+    parser.add_argument('--workers', type=int, default=None)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
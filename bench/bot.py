@@ -0,0 +1,244 @@
+"""Offline benchmark of main.Bot: fake Discord gateway/HTTP, fake RCON server and a dummy server process
+
+Replays scripted traffic and reports throughput, command latency (message in to first
+response) and event loop lag per scenario.
+
+Usage: python -m bench.bot [--users 40] [--rounds 5] [--flood 5000] [--http-latency 0.05]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+from collections import deque
+from typing import Dict, List
+
+import psutil
+
+from bench.fake_discord import connect, install, message_create, press_confirm
+from bench.fake_rcon import FakeRCONServer
+
+DUMMY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dummy_server.py')
+OWNER_ID = 1000
+OUTSIDER_ID = 5000
+
+
+def make_config(server_dir: str, data_dir: str, rcon: FakeRCONServer, whitelist: List[int]) -> types.ModuleType:
+    config = types.ModuleType('config')
+    config.BOT_TOKEN = 'fake-token'
+    config.WHITELIST = whitelist
+    config.PREFIX = 'uwu pls '
+    config.MODPACK_NAME = 'Benchmark'
+    config.SERVER_DIR = server_dir
+    config.OWNER_ID = OWNER_ID
+    config.SERVER_IP = '127.0.0.1'
+    config.EXTERNAL_IP = '127.0.0.1'
+    config.RCON_PORT = rcon.port
+    config.RCON_PASS = rcon.password
+    config.DATA_DIR = data_dir
+    config.SERVER_COMMAND = [sys.executable, DUMMY, '--load-time', '1', '--mods', '50']
+    config.SERVER_PROCESS_NAMES = (psutil.Process().name(),)
+    config.METRICS_PORT = None
+    config.PREFIX_COMMANDS = True
+    return config
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Harness:
+    def __init__(self, bot, http, rcon: FakeRCONServer):
+        self.bot = bot
+        self.http = http
+        self.rcon = rcon
+        # channel id -> time the pending command was sent
+        self.pending: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.lags: List[float] = []
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.confirming: set = set()
+        http.on_send.append(self.on_send)
+
+    @staticmethod
+    def channel_for(user_id: int) -> int:
+        return user_id + 1
+
+    def on_send(self, payload: dict) -> None:
+        channel_id = int(payload['channel_id'])
+        start = self.pending.pop(channel_id, None)
+        if start is not None:
+            self.latencies.append(time.perf_counter() - start)
+
+        waiter = self.waiters.get(channel_id)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(payload)
+
+        if channel_id in self.confirming and payload.get('components'):
+            # The view is stored once send() returns, press the button right after that
+            asyncio.get_running_loop().call_later(0.01, press_confirm, self.bot, int(payload['id']))
+
+    def send(self, user_id: int, content: str) -> None:
+        channel_id = self.channel_for(user_id)
+        self.pending[channel_id] = time.perf_counter()
+        message_create(self.bot, channel_id, user_id, content)
+
+    async def wait_for_message(self, user_id: int, check, timeout: float = 60) -> dict:
+        channel_id = self.channel_for(user_id)
+        deadline = time.perf_counter() + timeout
+        while True:
+            fut = self.waiters[channel_id] = asyncio.get_running_loop().create_future()
+            payload = await asyncio.wait_for(fut, deadline - time.perf_counter())
+            if check(payload):
+                return payload
+
+    async def wait_until(self, predicate, timeout: float = 60) -> None:
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            if time.perf_counter() > deadline:
+                raise TimeoutError
+            await asyncio.sleep(0.01)
+
+    async def drain(self, timeout: float = 60) -> None:
+        await self.wait_until(lambda: not self.pending, timeout)
+
+    async def monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.lags.clear()
+
+    def report(self, name: str, commands: int, elapsed: float) -> None:
+        print(f'{name:<28} {commands:>6} msgs {commands / elapsed:>9.1f}/s   '
+              f'p50 {percentile(self.latencies, 0.5) * 1000:>8.1f} ms   p99 {percentile(self.latencies, 0.99) * 1000:>8.1f} ms   '
+              f'loop lag p99 {percentile(self.lags, 0.99) * 1000:>6.1f} ms max {max(self.lags, default=0) * 1000:>6.1f} ms')
+
+
+async def run(args) -> None:
+    server_dir = tempfile.mkdtemp()
+    data_dir = tempfile.mkdtemp()
+    users = [OWNER_ID + i for i in range(args.users)]
+    rcon = await FakeRCONServer(password='benchmark').start()
+    rcon.commands['forge'] = lambda _: 'Overall: Mean tick time: 10.000 ms. Mean TPS: 20.000'
+    sys.modules['config'] = make_config(server_dir, data_dir, rcon, users)
+
+    from main import Bot
+    from extensions.logger import MESSAGE_LIMIT, pack_lines
+
+    # Sanity check that a console line of any length fits in a message and is consumed
+    for length in range(MESSAGE_LIMIT - 16, MESSAGE_LIMIT + 2):
+        lines = deque(['x' * length, 'y'])
+        content = pack_lines(lines)
+        assert len(content) <= MESSAGE_LIMIT and len(lines) < 2, length
+
+    bot = Bot()
+    http = install(bot, owner_id=OWNER_ID, latency=args.http_latency)
+    start = time.perf_counter()
+    gateway = await connect(bot)
+    print(f'Login and eager extensions took {(time.perf_counter() - start) * 1000:.0f} ms')
+    while bot.loader.pending:
+        await asyncio.sleep(0.01)
+    print(f'Background extensions loaded {(time.perf_counter() - start) * 1000:.0f} ms after login')
+    for name, (elapsed, delta) in bot.loader.stats.items():
+        print(f'    {name:<24} {elapsed * 1000:>6.0f} ms {delta / 2 ** 20:>+6.1f} MiB')
+
+    harness = Harness(bot, http, rcon)
+    lag_task = asyncio.create_task(harness.monitor_lag())
+    server = bot.get_cog('Server').default
+
+    def rcon_stop(_: str) -> str:
+        asyncio.get_running_loop().create_task(server.launcher.write('stop'))
+        return 'Stopping the server'
+    rcon.commands['stop'] = rcon_stop
+
+    try:
+        # Everyone asks to start the server at once, each of them confirms when prompted
+        harness.reset()
+        harness.confirming.update(harness.channel_for(u) for u in users[:args.starters])
+        start = time.perf_counter()
+        for user_id in users[:args.starters]:
+            harness.send(user_id, 'uwu pls start')
+        await harness.drain()
+        await harness.wait_until(lambda: any(status == 'online' for status, _ in gateway.presences), timeout=120)
+        harness.report(f'start burst (x{args.starters})', args.starters, time.perf_counter() - start)
+        print(f'{"":<28} server online {time.perf_counter() - start:.2f}s after the first start')
+        harness.confirming.clear()
+
+        # Bursts of list and uptime from every whitelisted user
+        rcon.players = ['Steve', 'Alex']
+        harness.reset()
+        start = time.perf_counter()
+        sent = 0
+        for _ in range(args.rounds):
+            for i, user_id in enumerate(users):
+                harness.send(user_id, 'uwu pls list' if i % 2 else 'uwu pls uptime')
+                sent += 1
+            await harness.drain()
+        harness.report('list/uptime bursts', sent, time.perf_counter() - start)
+        rcon.players = []
+        # What the log watcher would dispatch when they log off
+        bot.dispatch('player_leave', 'Steve')
+        bot.dispatch('player_leave', 'Alex')
+
+        # Messages from users who are not whitelisted, followed by one whitelisted command
+        harness.reset()
+        start = time.perf_counter()
+        for i in range(args.flood):
+            message_create(bot, harness.channel_for(OUTSIDER_ID), OUTSIDER_ID + i, 'uwu pls start')
+        harness.send(OWNER_ID, 'uwu pls uptime')
+        await harness.drain()
+        harness.report('non-whitelisted flood', args.flood + 1, time.perf_counter() - start)
+
+        # Broadcast to every whitelisted user
+        harness.reset()
+        harness.confirming.add(harness.channel_for(OWNER_ID))
+        start = time.perf_counter()
+        harness.send(OWNER_ID, 'uwu pls broadcast Server maintenance tonight')
+        await harness.wait_for_message(OWNER_ID, lambda p: 'Total:' in p.get('content', ''), timeout=300)
+        harness.report(f'broadcast ({len(users)} users)', 1, time.perf_counter() - start)
+        print(f'{"":<28} broadcast finished in {time.perf_counter() - start:.2f}s')
+
+        # Stop the server
+        harness.reset()
+        start = time.perf_counter()
+        harness.send(OWNER_ID, 'uwu pls stop')
+        await harness.wait_until(lambda: not bot.server_status, timeout=120)
+        harness.report('stop', 1, time.perf_counter() - start)
+        print(f'{"":<28} server offline {time.perf_counter() - start:.2f}s after stop')
+        print(f'HTTP requests: {http.requests}, RCON commands: {len(rcon.received)}, '
+              f'RCON connections: {rcon.connections}')
+    finally:
+        lag_task.cancel()
+        if server is not None and server.launcher.running:
+            server.launcher.process.kill()
+        await bot.close()
+        await rcon.close()
+        shutil.rmtree(server_dir, ignore_errors=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--starters', type=int, default=5, help='users sending start at the same time')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--flood', type=int, default=5000)
+    parser.add_argument('--http-latency', type=float, default=0.0, help='simulated Discord REST latency')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""A stand-in for the modded server: prints Minecraft style startup output
+
+Writes the same lines to stdout and logs/latest.log in the working directory,
+then waits for `stop` on stdin. Point SERVER_COMMAND at it to try the launcher:
+
+    SERVER_COMMAND = [sys.executable, '/path/to/bench/dummy_server.py', '--load-time', '5']
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load-time', type=float, default=3.0)
+    parser.add_argument('--mods', type=int, default=20)
+    parser.add_argument('--crash', action='store_true', help='exit with an error instead of finishing loading')
+    args = parser.parse_args()
+
+    os.makedirs('logs', exist_ok=True)
+    if os.path.exists('logs/latest.log'):
+        os.replace('logs/latest.log', f'logs/{time.strftime("%Y-%m-%d")}-{int(time.time())}.log')
+    log = open('logs/latest.log', 'w', encoding='utf-8')
+
+    def out(thread: str, level: str, msg: str) -> None:
+        line = f'[{time.strftime("%H:%M:%S")}] [{thread}/{level}]: {msg}'
+        print(line, flush=True)
+        log.write(line + '\n')
+        log.flush()
+
+    start = time.perf_counter()
+    out('main', 'INFO', 'ModLauncher running: args [--launchTarget, forgeserver]')
+    out('main', 'INFO', f'Found {args.mods} mod files')
+    out('main', 'INFO', "Launching target 'forgeserver' with arguments []")
+    for i in range(args.mods):
+        time.sleep(args.load_time / max(args.mods, 1))
+        out('modloading-worker-0', 'INFO', f'Loading mod mod{i}')
+    if args.crash:
+        os.makedirs('crash-reports', exist_ok=True)
+        with open(f'crash-reports/crash-{time.strftime("%Y-%m-%d_%H.%M.%S")}-server.txt', 'w', encoding='utf-8') as f:
+            f.write('---- Minecraft Crash Report ----\n// Oops.\n\n'
+                    f'Time: {time.strftime("%Y-%m-%d %H:%M:%S")}\n'
+                    'Description: Exception in server tick loop\n\n'
+                    'java.lang.NullPointerException: Cannot invoke "Object.hashCode()" because "key" is null\n'
+                    '\tat java.util.concurrent.ConcurrentHashMap.get(ConcurrentHashMap.java:936)\n')
+        out('main', 'ERROR', 'Failed to start the minecraft server')
+        sys.exit(1)
+    out('Server thread', 'INFO', 'Starting minecraft server version 1.20.1')
+    out('Server thread', 'INFO', 'Preparing level "world"')
+    out('Server thread', 'INFO', f'Done ({time.perf_counter() - start:.3f}s)! For help, type "help"')
+
+    for line in sys.stdin:
+        command = line.strip()
+        if command == 'stop':
+            break
+        out('Server thread', 'INFO', f'Unknown or incomplete command: {command}')
+    out('Server thread', 'INFO', 'Stopping server')
+    out('Server thread', 'INFO', 'Saving worlds')
+    log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from typing import Any, Callable, List, Optional
+
+import discord
+from discord.http import HTTPClient, Route
+
+
+def user_payload(user_id: int, name: Optional[str] = None, *, bot: bool = False) -> dict:
+    return {'id': str(user_id), 'username': name or f'user{user_id}', 'discriminator': '0',
+            'global_name': None, 'avatar': None, 'bot': bot}
+
+
+class FakeHTTP(HTTPClient):
+    """Answers every REST call locally instead of talking to Discord
+
+    Sent messages are kept in `sent` and `on_send` callbacks are called with each of them,
+    `latency` simulates the round trip of a real request.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, *, bot_id: int, owner_id: int, latency: float = 0.0):
+        super().__init__(loop)
+        self.bot_id: int = bot_id
+        self.owner_id: int = owner_id
+        self.latency: float = latency
+        self.requests: int = 0
+        self.sent: List[dict] = []
+        # Called with every sent message payload, reactions as {'channel_id': ..., 'reaction': True}
+        self.on_send: List[Callable[[dict], None]] = []
+        self._ids = itertools.count()
+
+    def snowflake(self) -> int:
+        return discord.utils.time_snowflake(discord.utils.utcnow()) + next(self._ids) % 4096
+
+    def message_payload(self, channel_id: int, json: Optional[dict], **extra: Any) -> dict:
+        json = json or {}
+        payload = {
+            'id': str(self.snowflake()), 'channel_id': str(channel_id), 'author': user_payload(self.bot_id, 'Satuse', bot=True),
+            'content': json.get('content') or '', 'timestamp': discord.utils.utcnow().isoformat(),
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': [], 'embeds': [], 'pinned': False, 'type': 0, 'components': json.get('components', []),
+        }
+        payload.update(extra)
+        return payload
+
+    async def static_login(self, token: str) -> dict:
+        self.token = token
+        return user_payload(self.bot_id, 'Satuse', bot=True)
+
+    async def close(self) -> None:
+        pass
+
+    async def request(self, route: Route, **kwargs: Any) -> Any:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        method, path = route.method, route.path
+        json = kwargs.get('json')
+        if json is None and 'form' in kwargs:
+            json = {}
+        if method == 'POST' and path == '/channels/{channel_id}/messages':
+            payload = self.message_payload(route.channel_id, json)
+            self.sent.append(payload)
+            for callback in self.on_send:
+                callback(payload)
+            return payload
+        if method == 'PUT' and path.startswith('/channels/{channel_id}/messages/{message_id}/reactions/'):
+            for callback in self.on_send:
+                callback({'channel_id': str(route.channel_id), 'reaction': True})
+            return None
+        if method == 'PATCH' and path == '/channels/{channel_id}/messages/{message_id}':
+            return self.message_payload(route.channel_id, json, id=route.url.rsplit('/', 1)[1])
+        if method == 'POST' and path == '/users/@me/channels':
+            recipient = int(json['recipient_id'])
+            return {'id': str(recipient + 1), 'type': 1, 'recipients': [user_payload(recipient)]}
+        if method == 'GET' and path == '/users/{user_id}':
+            return user_payload(int(route.url.rsplit('/', 1)[1]))
+        if method == 'GET' and path == '/oauth2/applications/@me':
+            return {'id': str(self.bot_id), 'name': 'Satuse', 'description': '', 'icon': None, 'bot_public': False,
+                    'bot_require_code_grant': False, 'owner': user_payload(self.owner_id), 'verify_key': '',
+                    'flags': 0}
+        return None
+
+
+class FakeGateway:
+    """Stands in for the websocket, only presence changes are sent through it"""
+
+    def __init__(self):
+        self.presences: List[tuple] = []
+        self.latency: float = 0.0
+        self.open: bool = False
+
+    async def change_presence(self, *, activity=None, status=None, since=0.0) -> None:
+        self.presences.append((status, activity.name if activity else None))
+
+    def is_ratelimited(self) -> bool:
+        return False
+
+
+def install(bot: discord.Client, *, owner_id: int, latency: float = 0.0) -> FakeHTTP:
+    """Swaps the HTTP client of a bot for a FakeHTTP"""
+    http = FakeHTTP(asyncio.get_running_loop(), bot_id=1078131779543765052, owner_id=owner_id, latency=latency)
+    bot.http = http
+    bot._connection.http = http
+    return http
+
+
+async def connect(bot: discord.Client) -> FakeGateway:
+    """Logs in through the fake HTTP client and marks the bot as ready"""
+    await bot.login('fake-token')
+    gateway = FakeGateway()
+    bot.ws = gateway  # type: ignore
+    bot._ready.set()
+    bot.dispatch('ready')
+    return gateway
+
+
+def message_create(bot: discord.Client, channel_id: int, author_id: int, content: str) -> int:
+    """Feeds a MESSAGE_CREATE event through the normal gateway parser, returns the message ID"""
+    http: FakeHTTP = bot.http  # type: ignore
+    message_id = http.snowflake()
+    bot._connection.parse_message_create({
+        'id': str(message_id), 'channel_id': str(channel_id), 'author': user_payload(author_id),
+        'content': content, 'timestamp': discord.utils.utcnow().isoformat(), 'edited_timestamp': None,
+        'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+        'embeds': [], 'pinned': False, 'type': 0,
+    })
+    return message_id
+
+
+def press_confirm(bot: discord.Client, message_id: int, choice: bool = True) -> bool:
+    """Resolves the ConfirmView attached to a message as if its button was pressed"""
+    view = bot._connection._view_store._synced_message_views.get(message_id)
+    if view is None:
+        return False
+    view.choice = choice  # type: ignore
+    view.stop()
+    return True
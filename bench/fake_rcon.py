@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import struct
+from typing import Callable, Dict, Optional, Set
+
+from utils.rcon import (
+    MAX_RESPONSE_PAYLOAD,
+    SERVERDATA_AUTH,
+    SERVERDATA_AUTH_RESPONSE,
+    SERVERDATA_EXECCOMMAND,
+    SERVERDATA_RESPONSE_VALUE,
+    encode_packet,
+)
+
+# Vanilla reads each packet into a buffer of this size
+READ_SIZE = 1460
+
+
+class FakeRCONServer:
+    """A local RCON server that behaves like the vanilla Minecraft one
+
+    Packets on a connection are answered in order, long responses are split into packets of
+    4096 characters and packets of an unknown type get an `Unknown request` reply. Each packet has
+    to arrive in its own read, a read with more (or less) than one packet drops the connection.
+    """
+
+    def __init__(self, password: str = 'password', *, latency: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.password: str = password
+        self.latency: float = latency
+        self.host: str = host
+        self.port: int = port
+        self.players: list = []
+        self.max_players: int = 20
+        self.commands: Dict[str, Callable[[str], str]] = {
+            'list': self._list,
+            'stop': lambda _: 'Stopping the server',
+        }
+        self.received: list = []
+        self.connections: int = 0
+        # Connections dropped for sending more than one packet at once
+        self.dropped: int = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+    def _list(self, _: str) -> str:
+        return f'There are {len(self.players)} of a max of {self.max_players} players online: {", ".join(self.players)}'
+
+    def respond(self, command: str) -> str:
+        name = command.split(' ', 1)[0]
+        handler = self.commands.get(name)
+        if handler is None:
+            return f'Unknown or incomplete command, see below for error{command}<--[HERE]'
+        return handler(command)
+
+    async def start(self) -> FakeRCONServer:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        """Stops listening and drops every client, like a server shutdown"""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> FakeRCONServer:
+        return await self.start()
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._clients.add(writer)
+        authed = False
+        try:
+            while True:
+                # Like vanilla's RconClient: one read per packet, a read holding anything else ends the connection
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                if len(data) < 10:
+                    continue
+                length, request_id, packet_type = struct.unpack_from('<iii', data)
+                if length != len(data) - 4:
+                    self.dropped += 1
+                    break
+                body = data[12:-2].decode('utf-8', errors='replace')
+                if packet_type == SERVERDATA_AUTH:
+                    authed = body == self.password
+                    writer.write(encode_packet(request_id if authed else -1, SERVERDATA_AUTH_RESPONSE, ''))
+                elif packet_type == SERVERDATA_EXECCOMMAND:
+                    if not authed:
+                        writer.write(encode_packet(-1, SERVERDATA_AUTH_RESPONSE, ''))
+                        continue
+                    self.received.append(body)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    response = self.respond(body)
+                    # Split by characters, like vanilla
+                    for i in range(0, max(len(response), 1), MAX_RESPONSE_PAYLOAD):
+                        writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE,
+                                                   response[i:i + MAX_RESPONSE_PAYLOAD]))
+                else:
+                    writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, f'Unknown request {packet_type:x}'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import struct
+from typing import List, Optional, Set
+
+from utils.slp import SLPError, decode_string, decode_varint, encode_packet, encode_string, read_packet
+
+
+class FakeSLPServer:
+    """A local server that answers Server List Ping like a vanilla Minecraft server
+
+    Handshake, status request, then an optional ping that is echoed back as a pong.
+    """
+
+    def __init__(self, *, version: str = '1.20.1', protocol: int = 763, motd: str = 'A Minecraft Server',
+                 max_players: int = 20, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.version: str = version
+        self.protocol: int = protocol
+        self.motd: str = motd
+        self.max_players: int = max_players
+        self.players: List[str] = []
+        self.latency: float = latency
+        self.host: str = host
+        self.port: int = port
+        self.requests: int = 0
+        self.handshakes: list = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+    def status(self) -> dict:
+        return {
+            'version': {'name': self.version, 'protocol': self.protocol},
+            'players': {
+                'max': self.max_players,
+                'online': len(self.players),
+                # Vanilla sends at most 12 random players
+                'sample': [{'name': name, 'id': f'00000000-0000-0000-0000-{i:012x}'}
+                           for i, name in enumerate(self.players[:12])],
+            },
+            'description': {'text': '', 'extra': [{'text': self.motd, 'color': 'gold'}]},
+        }
+
+    async def start(self) -> FakeSLPServer:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> FakeSLPServer:
+        return await self.start()
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients.add(writer)
+        try:
+            packet_id, payload = await read_packet(reader)
+            if packet_id != 0x00:
+                return
+            _, pos = decode_varint(payload)
+            host, pos = decode_string(payload, pos)
+            port, = struct.unpack_from('>H', payload, pos)
+            next_state, _ = decode_varint(payload, pos + 2)
+            self.handshakes.append((host, port, next_state))
+            if next_state != 1:
+                return
+            while True:
+                packet_id, payload = await read_packet(reader)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if packet_id == 0x00:
+                    self.requests += 1
+                    writer.write(encode_packet(0x00, encode_string(json.dumps(self.status()))))
+                elif packet_id == 0x01:
+                    writer.write(encode_packet(0x01, payload))
+                    await writer.drain()
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, SLPError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
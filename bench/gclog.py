@@ -0,0 +1,125 @@
+"""Benchmarks following a generated multi-day G1 GC log
+
+Writes a log with a young collection every few seconds (and the odd mixed and full one), reads it
+from the start like the `jvm` cog does after a bot restart, then times following a minute of new
+lines at a time.
+
+Usage: python -m bench.gclog [--days 3] [--interval 4]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from utils.gclog import GCLogAnalyzer, heap_advice
+from utils.logwatch import LogFollower
+
+START = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def _line(uptime: float, tags: str, message: str) -> str:
+    stamp = (START + timedelta(seconds=uptime)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '+0000'
+    return f'[{stamp}][{uptime:.3f}s][info ][{tags:<12}] {message}\n'
+
+
+class LogWriter:
+    def __init__(self, path: str, rng: random.Random, interval: float):
+        self.path: str = path
+        self.rng: random.Random = rng
+        self.interval: float = interval
+        self.uptime: float = 1.0
+        self.gc: int = 0
+        self.heap: int = 1500
+        self.pauses: int = 0
+
+    def header(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(_line(0.01, 'gc', 'Using G1'))
+            f.write(_line(0.02, 'gc,init', 'Heap Max Capacity: 8G'))
+
+    def write(self, seconds: float) -> int:
+        """Appends `seconds` of collections, returns the number of lines written"""
+        lines = []
+        end = self.uptime + seconds
+        rng = self.rng
+        while self.uptime < end:
+            self.uptime += rng.expovariate(1 / self.interval)
+            self.heap += rng.randrange(800, 1600)
+            if self.heap > 7800:
+                kind, after, ms = 'Pause Full (G1 Compaction Pause)', 2100, rng.uniform(800, 2000)
+            elif self.heap > 5000 and rng.random() < 0.3:
+                kind, after, ms = 'Pause Young (Mixed) (G1 Evacuation Pause)', 2300, rng.uniform(20, 90)
+            else:
+                kind, after, ms = 'Pause Young (Normal) (G1 Evacuation Pause)', self.heap - rng.randrange(700, 1500), \
+                    rng.uniform(5, 40)
+            after = max(after, 1900)
+            lines.append(_line(self.uptime, 'gc', f'GC({self.gc}) {kind} {self.heap}M->{after}M(8192M) {ms:.3f}ms'))
+            # Concurrent cycle lines are logged too and have to be skipped
+            if rng.random() < 0.1:
+                lines.append(_line(self.uptime, 'gc', f'GC({self.gc}) Concurrent Mark Cycle {rng.uniform(100, 900):.3f}ms'))
+            self.gc += 1
+            self.pauses += 1
+            self.heap = after
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        return len(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=float, default=3)
+    parser.add_argument('--interval', type=float, default=4, help='average seconds between collections')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'gc.log')
+        writer = LogWriter(path, random.Random(0), args.interval)
+        writer.header()
+        start = time.perf_counter()
+        lines = writer.write(args.days * 86400)
+        print(f'Generated {args.days:g} days: {lines} lines, {os.path.getsize(path) / 2 ** 20:.1f} MiB '
+              f'in {time.perf_counter() - start:.1f}s')
+
+        analyzer = GCLogAnalyzer()
+        follower = LogFollower(path, from_start=True)
+        start = time.perf_counter()
+        for line in follower._read():
+            analyzer.feed(line)
+        elapsed = time.perf_counter() - start
+        assert analyzer.count == writer.pauses, (analyzer.count, writer.pauses)
+        print(f'{"catch up from the start":<40} {elapsed * 1000:>10.2f} ms  '
+              f'({analyzer.lines / elapsed / 1e6:.2f}M lines/s)')
+
+        costs = []
+        for _ in range(20):
+            new = writer.write(60)
+            start = time.perf_counter()
+            read = follower._read()
+            for line in read:
+                analyzer.feed(line)
+            costs.append(time.perf_counter() - start)
+            assert len(read) == new
+        costs.sort()
+        print(f'{"follow one more minute (p50)":<40} {costs[len(costs) // 2] * 1000:>10.3f} ms')
+        print(f'{"follow one more minute (max)":<40} {costs[-1] * 1000:>10.3f} ms')
+
+        start = time.perf_counter()
+        summary = analyzer.summary()
+        print(f'{"summary":<40} {(time.perf_counter() - start) * 1000:>10.2f} ms')
+        print(f'{summary["count"]} pauses ({summary["full"]} full), p50 {summary["p50"]:.1f} ms, '
+              f'p99 {summary["p99"]:.1f} ms, max {summary["max"]:.0f} ms, '
+              f'allocating {summary["alloc_rate"]:.0f} MB/s, live data {summary["live"]:.0f} MB')
+        for advice in heap_advice(summary):
+            print(f'- {advice}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Launches bench/dummy_server.py through ServerLauncher and reports readiness detection
+
+Usage: python -m bench.launcher [--load-time SECONDS] [--mods N]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from utils.launcher import ServerLauncher
+
+DUMMY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dummy_server.py')
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load-time', type=float, default=3.0)
+    parser.add_argument('--mods', type=int, default=2000)
+    args = parser.parse_args()
+
+    lines = 0
+
+    def on_line(_: str) -> None:
+        nonlocal lines
+        lines += 1
+
+    with tempfile.TemporaryDirectory() as cwd:
+        launcher = ServerLauncher([sys.executable, DUMMY, '--load-time', str(args.load_time), '--mods', str(args.mods)],
+                                  cwd, on_line=on_line)
+        start = time.perf_counter()
+        await launcher.start()
+        ready = await launcher.wait_ready(timeout=60)
+        elapsed = time.perf_counter() - start
+        print(f'Ready: {ready} after {elapsed:.3f}s (server reported {launcher.ready_time}s, '
+              f'{lines} lines drained) instead of a fixed 180s sleep')
+
+        await launcher.write('stop')
+        print(f'Exit code: {await launcher.wait()} after {lines} lines')
+
+        crashing = ServerLauncher([sys.executable, DUMMY, '--load-time', '0.5', '--crash'], cwd)
+        await crashing.start()
+        print(f'Crashing server ready: {await crashing.wait_ready(timeout=60)}, exit code {await crashing.wait()}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
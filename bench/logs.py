@@ -0,0 +1,95 @@
+"""Benchmarks the log reader on a generated server log
+
+Usage: python -m bench.logs [--size-mb 100]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from utils.logs import LogCursor, grep, log_files, tail
+
+MESSAGES = (
+    '[Server thread/INFO] [minecraft/DedicatedServer]: Player{n} joined the game',
+    '[Server thread/INFO] [minecraft/DedicatedServer]: Player{n} left the game',
+    '[Server thread/WARN] [minecraft/MinecraftServer]: Can\'t keep up! Is the server overloaded? Running {n}ms or 40 ticks behind',
+    '[Server thread/INFO] [minecraft/DedicatedServer]: <Player{n}> anyone got spare iron?',
+    '[modloading-worker-0/DEBUG] [ne.mi.fm.ModLoader/LOADING]: Dispatching event to mod{n}',
+    '[Server thread/ERROR] [minecraft/ChunkMap]: Failed to save chunk [{n}, -{n}]',
+)
+
+
+def generate(path: str, size: int) -> None:
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        written = 0
+        while written < size:
+            block = '\n'.join(
+                f'[{rng.randrange(24):02}:{rng.randrange(60):02}:{rng.randrange(60):02}] '
+                + rng.choice(MESSAGES).format(n=rng.randrange(1000))
+                for _ in range(10000)
+            ) + '\n'
+            f.write(block)
+            written += len(block)
+
+
+def timed(name: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f'{name:<40} {(time.perf_counter() - start) * 1000:>10.2f} ms')
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=100)
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp()
+    try:
+        latest = os.path.join(log_dir, 'latest.log')
+        timed(f'generate {args.size_mb} MB log', generate, latest, args.size_mb * 1024 * 1024)
+        with open(latest, 'rb') as src, gzip.open(os.path.join(log_dir, '2024-01-01-1.log.gz'), 'wb', compresslevel=1) as dst:
+            shutil.copyfileobj(src, dst)
+        # Forge's debug log repeats latest.log, searching it too would count every match twice
+        shutil.copy(latest, os.path.join(log_dir, 'debug.log'))
+
+        def naive_tail():
+            with open(latest, encoding='utf-8') as f:
+                return f.readlines()[-50:]
+
+        def naive_grep():
+            regex = re.compile('failed to save', re.IGNORECASE)
+            with open(latest, encoding='utf-8') as f:
+                return [line for line in f if regex.search(line)]
+
+        timed('naive: read whole file, last 50 lines', naive_tail)
+        timed('tail 50 lines', tail, latest, 50)
+
+        cursor = LogCursor(latest)
+        cursor.offset, cursor._inode = os.path.getsize(latest), os.stat(latest).st_ino
+        with open(latest, 'a', encoding='utf-8') as f:
+            f.write('[12:00:00] [Server thread/INFO]: Steve joined the game\n' * 100)
+        text, _ = timed('new lines since last call (100 lines)', cursor.read_new)
+        assert text.count('\n') == 100
+
+        naive = timed('naive: line by line grep latest.log', naive_grep)
+        matches, total = timed('grep latest.log', grep, [latest], 'failed to save')
+        assert total == len(naive)
+        _, total = timed('grep latest.log + 1 rotated .log.gz', grep, log_files(log_dir), 'failed to save')
+        assert total == 2 * len(naive)
+        print(f'{len(naive)} matches per file')
+        _, total = timed('grep latest.log, rare pattern', grep, [latest], r'Player999 joined')
+        print(f'{total} matches for the rare pattern')
+    finally:
+        shutil.rmtree(log_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Benchmarks importing player sessions from rotated logs and querying the session store
+
+Generates one gzipped log per day of play, imports them with one and with several processes,
+then times the `playtime`, `seen` and `peak` lookups against the filled store.
+
+Usage: python -m bench.sessions [--days 730] [--players 40] [--filler 2000] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from utils.logs import log_files
+from utils.sessions import SessionStore
+
+FILLER = '[{t}] [Server thread/WARN] [minecraft/MinecraftServer]: Can\'t keep up! Is the server overloaded? Running 2043ms or 40 ticks behind'
+
+
+def _clock(seconds: int) -> str:
+    return f'{seconds // 3600 % 24:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def generate(log_dir: str, days: int, players: int, filler: int, rng: random.Random) -> int:
+    """Writes a log per day, returns the number of sessions in them"""
+    total = 0
+    first = date(2024, 1, 1)
+    for d in range(days):
+        events = []
+        for p in rng.sample(range(players), rng.randrange(1, players)):
+            start = rng.randrange(8 * 3600, 20 * 3600)
+            events.append((start, f'Player{p} joined the game'))
+            events.append((start + rng.randrange(60, 4 * 3600), f'Player{p} left the game'))
+            total += 1
+        events += [(rng.randrange(86400 - 60), None) for _ in range(filler)]
+        events.sort(key=lambda e: e[0])
+        path = os.path.join(log_dir, f'{(first + timedelta(days=d)).isoformat()}-1.log.gz')
+        with gzip.open(path, 'wt', encoding='utf-8', compresslevel=1) as f:
+            for t, message in events:
+                if message is None:
+                    f.write(FILLER.format(t=_clock(t)) + '\n')
+                else:
+                    f.write(f'[{_clock(t)}] [Server thread/INFO] [minecraft/DedicatedServer]: {message}\n')
+            f.write(f'[{_clock(86399)}] [Server thread/INFO] [minecraft/DedicatedServer]: Stopping the server\n')
+    return total
+
+
+async def timed(name: str, coro):
+    start = time.perf_counter()
+    result = await coro
+    print(f'{name:<40} {(time.perf_counter() - start) * 1000:>10.2f} ms')
+    return result
+
+
+async def run(args) -> None:
+    tmp = tempfile.mkdtemp()
+    log_dir = os.path.join(tmp, 'logs')
+    os.makedirs(log_dir)
+    try:
+        start = time.perf_counter()
+        expected = generate(log_dir, args.days, args.players, args.filler, random.Random(0))
+        size = sum(os.path.getsize(p) for p in log_files(log_dir))
+        print(f'Generated {args.days} logs ({size / 2 ** 20:.0f} MiB gzipped, {expected} sessions) '
+              f'in {time.perf_counter() - start:.1f}s')
+
+        workers = args.workers or os.cpu_count() or 1
+        for count in sorted({1, workers}):
+            store = SessionStore(os.path.join(tmp, f'sessions-{count}.db'), workers=count)
+            await store.open()
+            files, imported = await timed(f'backfill, {count} processes',
+                                          store.backfill(log_files(log_dir), before=time.time()))
+            assert (files, imported) == (args.days, expected), (files, imported)
+            if count != workers:
+                await store.close()
+
+        db_size = sum(os.path.getsize(p) for p in (store.path, store.path + '-wal') if os.path.exists(p))
+        print(f'{"":<40} store {db_size / 2 ** 20:.1f} MiB')
+        week = time.mktime((date(2024, 1, 1) + timedelta(days=args.days - 7)).timetuple())
+        for _ in range(2):
+            await timed('playtime Player7 (total + last 7 days)', store.playtime('player7', since=week))
+        await timed('seen Player7', store.playtime('Player7'))
+        peaks = await timed('peak', store.peak(since=week))
+        await timed('backfill again (nothing new)', store.backfill(log_files(log_dir)[:50], before=time.time()))
+        print(f'all time peak {peaks["all_time"][1]} players on {peaks["all_time"][0]}, store has {await store.stats()}')
+        await store.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--players', type=int, default=40)
+    parser.add_argument('--filler', type=int, default=2000, help='unrelated log lines per day')
+    parser.add_argument('--workers', type=int, default=None)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
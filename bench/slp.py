@@ -0,0 +1,144 @@
+"""Server List Ping latency benchmark and StatusProbe checks against a local fake server
+
+Usage: python -m bench.slp [--pings N] [--callers N] [--latency SECONDS]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+
+from bench.fake_slp import FakeSLPServer
+from utils.slp import StatusProbe, server_list_ping
+
+
+def report(name: str, samples: list, elapsed: float) -> None:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+    print(f'{name:<28} {len(samples) / elapsed:>10.0f} req/s   p50 {p50:>7.3f} ms   p99 {p99:>7.3f} ms   '
+          f'mean {statistics.fmean(samples) * 1000:>7.3f} ms')
+
+
+def free_port() -> int:
+    """A port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def pings(server: FakeSLPServer, n: int) -> None:
+    samples = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        await server_list_ping(server.host, server.port)
+        samples.append(time.perf_counter() - t)
+    report('ping per request', samples, time.perf_counter() - start)
+
+
+async def probed(server: FakeSLPServer, n: int, callers: int) -> None:
+    probe = StatusProbe(server.host, server.port, ttl=60)
+    requests = server.requests
+    samples = []
+
+    async def one():
+        t = time.perf_counter()
+        await probe.get()
+        samples.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    for _ in range(n // callers):
+        probe.invalidate()
+        await asyncio.gather(*(one() for _ in range(callers)))
+    report(f'probe callers={callers}', samples, time.perf_counter() - start)
+    # Every round of concurrent callers shares a single ping
+    assert server.requests - requests == n // callers, server.requests - requests
+    assert probe.misses == n // callers and probe.hits == 0, (probe.misses, probe.hits)
+
+
+async def coalescing(server: FakeSLPServer, callers: int) -> None:
+    probe = StatusProbe(server.host, server.port, ttl=60)
+    requests = server.requests
+    results = await asyncio.gather(*(probe.get() for _ in range(callers)))
+    assert server.requests - requests == 1, server.requests - requests
+    assert all(r is results[0] for r in results)
+
+    # A cancelled caller does not cancel the ping the others are waiting on
+    probe.invalidate()
+    first = asyncio.ensure_future(probe.get())
+    second = asyncio.ensure_future(probe.get())
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second is not None
+    assert server.requests - requests == 2, server.requests - requests
+
+    # Within the ttl nothing is sent at all
+    await probe.get()
+    assert server.requests - requests == 2 and probe.hits == 1, (server.requests - requests, probe.hits)
+
+
+async def unreachable(timeout: float) -> None:
+    port = free_port()
+    try:
+        await server_list_ping('127.0.0.1', port, timeout=timeout)
+    except OSError:
+        pass
+    else:
+        raise AssertionError('ping to a closed port succeeded')
+
+    # Listening but never answering, like a server that is still loading the world
+    silent = await asyncio.start_server(lambda reader, writer: None, '127.0.0.1', 0)
+    silent_port = silent.sockets[0].getsockname()[1]
+    try:
+        start = time.perf_counter()
+        try:
+            await server_list_ping('127.0.0.1', silent_port, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError('ping to a silent server succeeded')
+        assert time.perf_counter() - start < timeout * 2
+    finally:
+        silent.close()
+        await silent.wait_closed()
+
+    # The probe turns both into None and caches that too
+    probe = StatusProbe('127.0.0.1', port, ttl=60, timeout=timeout)
+    assert await probe.get() is None
+    assert await probe.get() is None
+    assert probe.misses == 1 and probe.hits == 1, (probe.misses, probe.hits)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pings', type=int, default=500)
+    parser.add_argument('--callers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated server side latency per packet')
+    args = parser.parse_args()
+
+    async with FakeSLPServer(latency=args.latency) as server:
+        server.players = [f'Player{i}' for i in range(20)]
+
+        # Sanity check the parsed status
+        status = await server_list_ping(server.host, server.port)
+        assert status['online'] == 20 and status['max'] == server.max_players, status
+        assert len(status['sample']) == 12 and status['motd'] == server.motd, status
+        assert status['version'] == server.version and status['protocol'] == server.protocol, status
+        assert server.handshakes[-1] == (server.host, server.port, 1), server.handshakes[-1]
+
+        await pings(server, args.pings)
+        await probed(server, args.pings, args.callers)
+
+    # Enough latency that every caller arrives while the ping is in flight
+    async with FakeSLPServer(latency=max(args.latency, 0.05)) as server:
+        await coalescing(server, args.callers)
+
+    await unreachable(0.2)
+    print('Coalescing and unreachable checks passed')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Benchmarks the startup profiler on a generated Forge debug.log
+
+Usage: python -m bench.startup [--size-mb 300] [--mods 300]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from utils.startup import profile_file
+
+NOISE = (
+    '[{ts}] [modloading-worker-{w}/DEBUG] [ne.mi.re.ObjectHolderRegistry/REGISTRIES]: Applying holder lookups: {n}',
+    '[{ts}] [modloading-worker-{w}/TRACE] [ne.mi.fm.ModLoader/CORE]: Scanning class com/example/mod{n}/Block{n}',
+    '[{ts}] [main/DEBUG] [cp.mo.mo.TransformationServiceDecorator/MODLAUNCHER]: Transforming net/minecraft/world/Block{n}',
+    '[{ts}] [Server thread/DEBUG] [ne.mi.co.ForgeHooks/WP]: Gathering tags for registry {n}',
+)
+
+
+def generate(path: str, size: int, mods: int) -> float:
+    """Writes a debug.log with mods loading on 4 worker threads, returns the simulated startup time"""
+    rng = random.Random(0)
+    clock = 12 * 3600.0
+
+    def ts() -> str:
+        ms = int(clock * 1000)
+        return f'15Jan2024 {ms // 3600000 % 24:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02}.{ms % 1000:03}'
+
+    noise_per_mod = max(1, size // 110 // (mods + 1))
+    start = clock
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'[{ts()}] [main/INFO] [cp.mo.mo.Launcher/MODLAUNCHER]: ModLauncher running: args [--launchTarget, forgeserver]\n')
+        clock += 5
+        f.write(f'[{ts()}] [main/INFO] [cp.mo.mo.LaunchServiceHandler/MODLAUNCHER]: Launching target \'forgeserver\' with arguments []\n')
+        for i in range(mods):
+            w = i % 4
+            f.write(f'[{ts()}] [modloading-worker-{w}/DEBUG] [ne.mi.fm.ja.AutomaticEventSubscriber/LOADING]: '
+                    f'Attempting to inject @EventBusSubscriber classes into the eventbus for mod{i}\n')
+            lines = []
+            for _ in range(noise_per_mod):
+                clock += rng.random() * 0.0005
+                lines.append(rng.choice(NOISE).format(ts=ts(), w=w, n=rng.randrange(100000)))
+            f.write('\n'.join(lines) + '\n')
+        f.write(f'[{ts()}] [Server thread/INFO] [minecraft/DedicatedServer]: Starting minecraft server version 1.20.1\n')
+        clock += 10
+        f.write(f'[{ts()}] [Server thread/INFO] [minecraft/MinecraftServer]: Preparing level "world"\n')
+        clock += 30
+        f.write(f'[{ts()}] [Server thread/INFO] [minecraft/DedicatedServer]: Done (123.456s)! For help, type "help"\n')
+    return clock - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=300)
+    parser.add_argument('--mods', type=int, default=300)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'debug.log')
+    expected = generate(path, args.size_mb * 2 ** 20, args.mods)
+    size = os.path.getsize(path)
+    try:
+        start = time.perf_counter()
+        profile = profile_file(path)
+        elapsed = time.perf_counter() - start
+        print(f'profiled {size / 2 ** 20:.0f} MiB in {elapsed:.2f}s ({size / 2 ** 20 / elapsed:.0f} MiB/s)')
+        print(f'total {profile["total"]:.1f}s (generated {expected:.1f}s), '
+              f'{len(profile["mods"])} mods, phases: ' + ', '.join(f'{k} {v:.1f}s' for k, v in profile['phases'].items()))
+        for mod, seconds in list(profile['mods'].items())[:5]:
+            print(f'    {mod:<20} {seconds:>7.2f}s')
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import io
+import re
+import asyncio
 import logging
-import pathlib
-from typing import TYPE_CHECKING
+import os
+from typing import Optional, TYPE_CHECKING
 
 import aiohttp
 import discord
 from discord.ext import commands
 
+from utils.broadcast import Broadcaster, BroadcastJob
+from utils.common import DATA_DIR
+from utils.logs import LogCursor, grep, log_files, tail
 from config import SERVER_DIR, WHITELIST, EXTERNAL_IP
 
 if TYPE_CHECKING:
@@ -21,6 +27,41 @@ logging = logging.getLogger(__name__)
 class Admin(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.broadcaster: Broadcaster = Broadcaster(bot, DATA_DIR, bot.state)
+        self._log_cursor: Optional[LogCursor] = None
+        self._resume_task: Optional[asyncio.Task] = None
+
+    @property
+    def log_dir(self) -> str:
+        """Logs of the default server"""
+        server = self.bot.get_cog('Server')
+        return os.path.join(server.default.directory if server is not None else SERVER_DIR, 'logs')  # type: ignore
+
+    @property
+    def log_cursor(self) -> LogCursor:
+        path = os.path.join(self.log_dir, 'latest.log')
+        if self._log_cursor is None or self._log_cursor.path != path:
+            self._log_cursor = LogCursor(path)
+        return self._log_cursor
+
+    async def cog_load(self):
+        job = self.broadcaster.load_unfinished()
+        if job is not None:
+            logging.info(f'Resuming broadcast, {len(job.pending)} users left')
+            self._resume_task = asyncio.create_task(self.resume_broadcast(job))
+
+    async def cog_unload(self):
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+        if self.broadcaster.task is not None:
+            self.broadcaster.task.cancel()
+
+    async def resume_broadcast(self, job: BroadcastJob):
+        await self.bot.wait_until_ready()
+        try:
+            await self.broadcaster.start(job)
+        except Exception:
+            logging.exception('Resumed broadcast failed')
 
     async def cog_check(self, ctx: Context):
         if not await self.bot.is_owner(ctx.author):
@@ -28,18 +69,41 @@ class Admin(commands.Cog):
         return True
 
     @commands.command()
-    async def status(self, ctx: Context, status: bool):
+    async def status(self, ctx: Context, status: bool, instance: Optional[str] = None):
         """Change status of server"""
+        server = self.bot.get_cog('Server')
+        if server is None:
+            return await ctx.reply('The server extension is not loaded', mention_author=False)
+        target = await server.get_instance(ctx, instance)  # type: ignore
+        if target is None:
+            return
         if status:
-            self.bot.server_status = True
-            self.bot.server_start_time = discord.utils.utcnow()
-            await self.bot.set_online_status()
+            await target.set_online()
             await ctx.reply('Server status set to ON')
         else:
-            self.bot.server_status = False
-            await self.bot.set_offline_status()
+            await target.set_offline()
             await ctx.reply('Server status set to OFF')
 
+    @commands.command(name='sync')
+    async def sync_commands(self, ctx: Context):
+        """Sync slash commands with Discord"""
+        synced = await self.bot.tree.sync()
+        await ctx.reply(f'Synced {len(synced)} commands: {", ".join(c.name for c in synced)}', mention_author=False)
+
+    @commands.command(name='extensions')
+    async def extension_stats(self, ctx: Context):
+        """Show how long each extension took to load and how much memory it added"""
+        lines = [f'{"":<24} {"ms":>8} {"MiB":>7}']
+        for name, (elapsed, delta) in self.bot.loader.stats.items():
+            lines.append(f'{name[:24]:<24} {elapsed * 1000:>8.0f} {delta / 2 ** 20:>7.1f}')
+        not_loaded = [ext for ext in self.bot.loader.on_demand if ext not in self.bot.extensions]
+        msg = '```\n' + '\n'.join(lines) + '```'
+        if not_loaded:
+            msg += f'\nNot loaded yet: {", ".join(not_loaded)}'
+        if self.bot.loader.failed:
+            msg += f'\nFailed: {", ".join(self.bot.loader.failed)}'
+        await ctx.reply(msg, mention_author=False)
+
     @commands.command(name='shutdown')
     async def shutdown_bot(self, ctx: Context):
         if not await ctx.confirm_prompt('Shutdown?'):
@@ -47,17 +111,50 @@ class Admin(commands.Cog):
         await ctx.message.add_reaction('\U0001f620')
         await ctx.bot.close()
 
-    @commands.command(name='logs')
-    async def logs(self, ctx: Context):
-        cmd = self.bot.get_command('jsk cat')
-        if cmd is None:
-            return await ctx.reply('Command not found', mention_author=False)
+    async def send_log_text(self, ctx: Context, text: str, *, header: str = '', filename: str = 'latest.log'):
+        if not text:
+            return await ctx.reply(f'{header}Nothing to show', mention_author=False)
+        if len(header) + len(text) <= 1980:
+            return await ctx.reply(f'{header}```\n{text}```', mention_author=False)
+        file = discord.File(io.BytesIO(text.encode('utf-8')), filename=filename)
+        await ctx.reply(header or None, file=file, mention_author=False)
+
+    @commands.group(name='logs', invoke_without_command=True)
+    async def logs(self, ctx: Context, lines: int = 50):
+        """Show the last lines of the server log"""
+        log_file = self.log_cursor.path
+        if not os.path.isfile(log_file):
+            return await ctx.reply('Log file not found', mention_author=False)
+
+        text = '\n'.join(await asyncio.to_thread(tail, log_file, lines))
+        await self.send_log_text(ctx, text)
 
-        log_file = pathlib.Path(SERVER_DIR) / 'logs' / 'latest.log'
-        if not log_file.is_file():
+    @logs.command(name='new')
+    async def logs_new(self, ctx: Context):
+        """Show what was written to the server log since the last time"""
+        if not os.path.isfile(self.log_cursor.path):
             return await ctx.reply('Log file not found', mention_author=False)
 
-        await ctx.invoke(cmd, str(log_file)) # type: ignore
+        text, truncated = await asyncio.to_thread(self.log_cursor.read_new)
+        header = 'Only showing the last 1 MB\n' if truncated else ''
+        await self.send_log_text(ctx, text.rstrip('\n'), header=header)
+
+    @logs.command(name='grep')
+    async def logs_grep(self, ctx: Context, *, pattern: str):
+        """Search the current and rotated server logs"""
+        if not os.path.isdir(self.log_dir):
+            return await ctx.reply('Log directory not found', mention_author=False)
+
+        async with ctx.typing():
+            try:
+                matches, total = await asyncio.to_thread(grep, log_files(self.log_dir), pattern)
+            except re.error as e:
+                return await ctx.reply(f'Invalid pattern: {e}', mention_author=False)
+
+        header = f'{total} matches'
+        if total > len(matches):
+            header += f', showing the last {len(matches)}'
+        await self.send_log_text(ctx, '\n'.join(matches), header=f'{header}\n', filename='grep.log')
 
     @commands.command(name='message')
     async def dm_user(self, ctx: Context, user: discord.User, *, message: str):
@@ -66,59 +163,30 @@ class Admin(commands.Cog):
         await user.send(message)
         await ctx.tick(True)
 
-    async def do_broadcast(self, message, **kwargs):
-        success = []
-        failed = []
-        not_found = []
-        import asyncio
-        for user_id in WHITELIST:
-            try:
-                user = await self.bot.fetch_user(user_id)
-            except discord.NotFound:
-                logging.info(f'User {user_id} not found')
-                not_found.append(user_id)
-            except discord.HTTPException as e:
-                logging.error(f'Failed to fetch user {user_id} | {e}')
-                failed.append(user_id)
-            else:
-                await asyncio.sleep(30)
-                try:
-                    await user.send(message, **kwargs)
-                except discord.HTTPException as e:
-                    logging.error(f'Failed to send broadcast to {user} ({user_id}) | {e}')
-                    failed.append(user.mention)
-                else:
-                    logging.info(f'Sent broadcast to {user} ({user_id})')
-                    success.append(user.mention)
-        return success, failed, not_found
+    async def do_broadcast(self, ctx: Context, message: str, *, silent: bool = False):
+        if self.broadcaster.running:
+            await ctx.reply('A broadcast is already running', mention_author=False)
+            await ctx.tick(False)
+            return
+        progress = await ctx.send('Sending broadcast...')
+        job = BroadcastJob(message, list(WHITELIST), silent=silent,
+                           channel_id=ctx.channel.id, progress_message_id=progress.id)
+        self.broadcaster.start(job)
+        await ctx.tick(True)
 
     @commands.command()
     async def broadcast(self, ctx: Context, *, message: str):
         """Broadcast a message to all users"""
         if not await ctx.confirm_prompt(message):
             return
-        await ctx.send('Sending broadcast...')
-        success, failed, not_found = await self.do_broadcast(message)
-        await ctx.reply(f'Successfully sent to {len(success)} users: {", ".join(map(str, success))}\n'
-                        f'Failed to send to {len(failed)} users: {", ".join(map(str, failed))}\n'
-                        f'Not found {len(not_found)} users: {", ".join(map(str, not_found))}\n'
-                        f'Total: {len(success) + len(failed) + len(not_found)} users',
-                        mention_author=False)
-        await ctx.tick(True)
+        await self.do_broadcast(ctx, message)
 
     @commands.command(name='silentbroadcast')
     async def broadcast_silent(self, ctx: Context, *, message: str):
         """Broadcast a message to all users but as a silent message"""
         if not await ctx.confirm_prompt(message):
             return
-        await ctx.send('Sending broadcast...')
-        success, failed, not_found = await self.do_broadcast(message, silent=True)
-        await ctx.reply(f'Successfully sent to {len(success)} users: {", ".join(map(str, success))}\n'
-                        f'Failed to send to {len(failed)} users: {", ".join(map(str, failed))}\n'
-                        f'Not found {len(not_found)} users: {", ".join(map(str, not_found))}\n'
-                        f'Total: {len(success) + len(failed) + len(not_found)} users',
-                        mention_author=False)
-        await ctx.tick(True)
+        await self.do_broadcast(ctx, message, silent=True)
 
     @commands.command(name='checkip')
     async def check_ip(self, ctx: Context):
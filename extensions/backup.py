@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Optional, TYPE_CHECKING
+
+from discord.ext import commands, tasks
+
+import config
+from utils.backup import BackupRepository
+from utils.common import DATA_DIR, fmt_bytes
+from utils.instance import OFFLINE
+from config import SERVER_DIR
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+BACKUP_DIR: str = getattr(config, 'BACKUP_DIR', os.path.join(DATA_DIR, 'backups'))
+# World folder to back up, defaults to `world` in the default server's directory
+BACKUP_WORLD: Optional[str] = getattr(config, 'BACKUP_WORLD', None)
+# Hours between scheduled backups, None to only back up on command
+BACKUP_INTERVAL: Optional[float] = getattr(config, 'BACKUP_INTERVAL', 6)
+# Retention: the newest BACKUP_KEEP_LAST snapshots plus the newest one of each of the last BACKUP_KEEP_DAILY days
+BACKUP_KEEP_LAST: int = getattr(config, 'BACKUP_KEEP_LAST', 8)
+BACKUP_KEEP_DAILY: int = getattr(config, 'BACKUP_KEEP_DAILY', 7)
+# Processes used for hashing and compression, None for one per CPU
+BACKUP_WORKERS: Optional[int] = getattr(config, 'BACKUP_WORKERS', None)
+
+
+class Backup(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.repo: BackupRepository = BackupRepository(BACKUP_DIR, workers=BACKUP_WORKERS)
+        if BACKUP_INTERVAL:
+            self.backup_loop.change_interval(hours=BACKUP_INTERVAL)
+            self.backup_loop.start()
+
+    async def cog_unload(self):
+        self.backup_loop.cancel()
+        self.repo.close()
+
+    async def cog_check(self, ctx: Context):
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner
+        return True
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    @property
+    def world(self) -> str:
+        if BACKUP_WORLD is not None:
+            return BACKUP_WORLD
+        server = self.server
+        return os.path.join(server.directory if server is not None else SERVER_DIR, 'world')
+
+    async def run_backup(self) -> Optional[dict]:
+        server = self.server
+        # Autosave only needs pausing while the server is running
+        rcon = server.rcon if server is not None and self.bot.server_status else None
+        manifest = await self.repo.backup(self.world, rcon=rcon)
+        if manifest is not None:
+            removed, deleted = await self.repo.prune(keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY)
+            if removed:
+                logging.info(f'Pruned {len(removed)} backups and {deleted} unused chunks')
+        return manifest
+
+    @tasks.loop(hours=6)
+    async def backup_loop(self):
+        if not os.path.isdir(self.world):
+            return
+        try:
+            await self.run_backup()
+        except Exception:
+            logging.exception('Scheduled backup failed')
+
+    @backup_loop.before_loop
+    async def before_backup(self):
+        await self.bot.wait_until_ready()
+
+    @commands.group(name='backup', invoke_without_command=True)
+    async def backup(self, ctx: Context):
+        """Back up the world now"""
+        if self.repo.running:
+            return await ctx.reply('A backup is already running', mention_author=False)
+        world = self.world
+        if not os.path.isdir(world):
+            return await ctx.reply(f'World folder `{world}` not found', mention_author=False)
+
+        async with ctx.typing():
+            manifest = await self.run_backup()
+        if manifest is None:
+            return await ctx.reply('Nothing changed since the last backup', mention_author=False)
+        stats = manifest['stats']
+        await ctx.reply(f'Backup `{manifest["name"]}` done in {stats["duration"]:.1f}s\n'
+                        f'{stats["changed"]}/{stats["files"]} files changed ({fmt_bytes(stats["changed_size"])} '
+                        f'of {fmt_bytes(stats["size"])}), {fmt_bytes(stats["written"])} new data stored\n'
+                        f'Saving was paused for {stats["save_off"]:.2f}s',
+                        mention_author=False)
+
+    @backup.command(name='list')
+    async def backup_list(self, ctx: Context):
+        """List backups"""
+        names = self.repo.snapshots()
+        if not names:
+            return await ctx.reply('No backups yet', mention_author=False)
+        lines = []
+        for name in names[-20:]:
+            stats = self.repo.load_manifest(name)['stats']
+            lines.append(f'{name:<20} {stats["files"]:>6} files {fmt_bytes(stats["size"]):>10} '
+                         f'+{fmt_bytes(stats["written"]):>10}')
+        await ctx.reply('```\n' + '\n'.join(lines) + '```', mention_author=False)
+
+    @backup.command(name='restore')
+    async def backup_restore(self, ctx: Context, name: str):
+        """Replace the world with a backup, the current world is kept next to it"""
+        if name not in self.repo.snapshots():
+            return await ctx.reply(f'No backup named `{name}`', mention_author=False)
+        server = self.server
+        if server is not None:
+            await server.check_status()
+        # Also while it is shutting down and still saving, or someone is confirming a start
+        if server is not None and server.state != OFFLINE:
+            return await ctx.reply('Stop the server before restoring a backup', mention_author=False)
+        if not await ctx.confirm_prompt(f'Replace the world with backup `{name}`?'):
+            return await ctx.tick(False)
+
+        world = self.world
+        async with ctx.typing():
+            restored = f'{world}-restore-{name}'
+            await self.repo.restore(name, restored)
+            if os.path.exists(world):
+                stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+                os.replace(world, f'{world}-before-restore-{stamp}')
+            os.replace(restored, world)
+        logging.info(f'Restored backup {name} | {ctx.author}')
+        await ctx.reply(f'Restored backup `{name}`', mention_author=False)
+
+    @backup.command(name='prune')
+    async def backup_prune(self, ctx: Context):
+        """Delete backups outside the retention policy"""
+        async with ctx.typing():
+            removed, deleted = await self.repo.prune(keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY)
+        await ctx.reply(f'Removed {len(removed)} backups and {deleted} unused chunks', mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Backup(bot))
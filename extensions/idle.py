@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import time
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Set, TYPE_CHECKING
+
+import discord
+import psutil
+from discord.ext import commands, tasks
+
+import config
+from utils.common import fmt_bytes
+from utils.instance import ONLINE
+from utils.rcon import RCON_ERRORS
+from utils.telemetry import summarize
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+# Stop the server after nobody has been online for this many minutes, None to never stop it
+IDLE_SHUTDOWN: Optional[float] = getattr(config, 'IDLE_SHUTDOWN', None)
+# Minutes before the shutdown to post a warning
+IDLE_WARNING: float = getattr(config, 'IDLE_WARNING', 5)
+# Channel for idle warnings and shutdown notices
+IDLE_CHANNEL_ID: Optional[int] = getattr(config, 'IDLE_CHANNEL_ID', None)
+# Join/leave events keep the player count, `list` over RCON only double checks it this often (seconds)
+IDLE_RECONCILE_INTERVAL: float = getattr(config, 'IDLE_RECONCILE_INTERVAL', 60 * 10)
+# How often the idle timer is checked (seconds)
+IDLE_CHECK_INTERVAL = 30
+# Idle shutdowns kept in the state store
+IDLE_HISTORY = 50
+
+
+def _parse_players(players: str) -> Set[str]:
+    return {p.strip() for p in players.split(',') if p.strip()}
+
+
+def _dt(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class Idle(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.enabled: bool = IDLE_SHUTDOWN is not None
+        self.players: Set[str] = set()
+        self.empty_since: Optional[float] = None
+        self.warned: Optional[float] = None
+        self.last_reconcile: float = 0.0
+        self.idle_loop.start()
+
+    async def cog_unload(self):
+        self.idle_loop.cancel()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    @property
+    def history(self) -> List[dict]:
+        return self.bot.state.get('idle_shutdowns', [])
+
+    def reset(self):
+        self.players.clear()
+        self.empty_since = None
+        self.warned = None
+        self.last_reconcile = 0.0
+
+    async def notify(self, message: str):
+        if IDLE_CHANNEL_ID is None:
+            return
+        try:
+            await self.bot.get_partial_messageable(IDLE_CHANNEL_ID).send(message)
+        except discord.HTTPException as e:
+            logging.error(f'Failed to send idle notice | {e}')
+
+    @commands.Cog.listener()
+    async def on_player_join(self, player: str):
+        self.players.add(player)
+        if self.warned is not None:
+            await self.notify(f'{player} joined, the server will keep running.')
+        self.empty_since = None
+        self.warned = None
+
+    @commands.Cog.listener()
+    async def on_player_leave(self, player: str):
+        self.players.discard(player)
+        if not self.players and self.empty_since is None:
+            self.empty_since = time.time()
+
+    @commands.Cog.listener()
+    async def on_server_ready(self, ready_time: str):
+        self.reset()
+
+    @commands.Cog.listener()
+    async def on_server_launch(self, reason: str):
+        self.reset()
+        history = self.history
+        if history and history[-1].get('restarted') is None:
+            history[-1]['restarted'] = time.time()
+            self.bot.state.set('idle_shutdowns', history)
+
+    @commands.Cog.listener()
+    async def on_server_process_exit(self, returncode: Optional[int]):
+        self.reset()
+
+    async def reconcile(self, server: ServerInstance, *, fresh: bool = False) -> bool:
+        """Checks the tracked players against `list`, returns False if RCON did not answer"""
+        self.last_reconcile = time.time()
+        if fresh:
+            server.players.invalidate()
+        try:
+            current = await server.players.get()
+        except RCON_ERRORS:
+            return False
+        if not current:
+            return False
+        players = _parse_players(current['players'])
+        if players != self.players:
+            logging.info(f'Player list was out of sync: tracked {sorted(self.players)}, server has {sorted(players)}')
+            self.players = players
+        if players:
+            self.empty_since = None
+            self.warned = None
+        elif self.empty_since is None:
+            self.empty_since = time.time()
+        return True
+
+    def resource_usage(self, server: ServerInstance, since: float) -> dict:
+        """Memory and average CPU of the server over the idle period"""
+        usage = {'rss': 0.0, 'cpu': 0.0}
+        stats = self.bot.get_cog('Stats')
+        if stats is not None:
+            data = stats.telemetry.since(since)  # type: ignore
+            _, usage['cpu'], _ = summarize(data['cpu'])
+            _, _, usage['rss'] = summarize(data['rss'])
+        if not usage['rss'] and server.tracker.process is not None:
+            try:
+                usage['rss'] = server.tracker.process.memory_info().rss
+            except psutil.Error:
+                pass
+        # summarize returns NaN without samples
+        return {k: v if v == v else 0.0 for k, v in usage.items()}
+
+    async def shutdown(self, server: ServerInstance):
+        # One last fresh check so nobody who just joined gets kicked
+        if not await self.reconcile(server, fresh=True) or self.players:
+            return
+        entry = {
+            'empty_since': self.empty_since,
+            'warned': self.warned,
+            'stopped': time.time(),
+            'restarted': None,
+            **self.resource_usage(server, self.empty_since or time.time()),
+        }
+        logging.info(f'Nobody has been online for {IDLE_SHUTDOWN} minutes, stopping the server')
+        try:
+            if not await server.request_stop('idle'):
+                return
+        except RCON_ERRORS as e:
+            logging.error(f'Failed to stop the idle server | {e}')
+            return
+        self.bot.state.set('idle_shutdowns', (self.history + [entry])[-IDLE_HISTORY:])
+        await self.notify(f'Nobody has been online for {IDLE_SHUTDOWN:g} minutes, the server has been stopped. '
+                          f'Freed {fmt_bytes(entry["rss"])} of memory.')
+        self.reset()
+
+    @tasks.loop(seconds=IDLE_CHECK_INTERVAL)
+    async def idle_loop(self):
+        server = self.server
+        # Not while it is loading, stopping or down
+        if not self.enabled or server is None or server.state != ONLINE:
+            return
+        now = time.time()
+        if now - self.last_reconcile >= IDLE_RECONCILE_INTERVAL:
+            await self.reconcile(server)
+        if self.players:
+            return
+        pregen = self.bot.get_cog('Pregen')
+        if pregen is not None and pregen.pending:  # type: ignore
+            # An empty server is when chunks get pregenerated, keep it up until that is done
+            self.empty_since = now
+            self.warned = None
+            return
+        if self.empty_since is None:
+            self.empty_since = now
+
+        idle = now - self.empty_since
+        if self.warned is None and idle >= (IDLE_SHUTDOWN - IDLE_WARNING) * 60:
+            self.warned = now
+            remaining = max(IDLE_SHUTDOWN * 60 - idle, 0)
+            logging.info(f'Server is idle, stopping in {remaining:.0f}s')
+            try:
+                await server.rcon.send(f'say Nobody is online, the server will stop in {remaining / 60:.0f} minutes')
+            except RCON_ERRORS:
+                pass
+            await self.notify(f'Nobody is online, the server will stop '
+                              f'{discord.utils.format_dt(_dt(now + remaining), "R")} '
+                              f'unless someone joins.')
+        if idle >= IDLE_SHUTDOWN * 60:
+            await self.shutdown(server)
+
+    @idle_loop.before_loop
+    async def before_idle(self):
+        await self.bot.wait_until_ready()
+
+    @commands.group(name='idle', invoke_without_command=True)
+    async def idle(self, ctx: Context):
+        """Show the idle shutdown state and how much it has saved"""
+        if not self.enabled:
+            status = 'Idle shutdown is off'
+        elif not self.bot.server_status:
+            status = 'The server is offline'
+        elif self.players:
+            status = f'{len(self.players)} players online, not idle'
+        elif self.empty_since is None:
+            status = 'Waiting for the server to finish loading'
+        else:
+            status = (f'Nobody online since {discord.utils.format_dt(_dt(self.empty_since), "R")}, '
+                      f'stopping {discord.utils.format_dt(_dt(self.empty_since + IDLE_SHUTDOWN * 60), "R")}')
+
+        now = time.time()
+        gb_hours = core_hours = offline = 0.0
+        for entry in self.history:
+            hours = ((entry['restarted'] or now) - entry['stopped']) / 3600
+            offline += hours
+            gb_hours += entry['rss'] / 2 ** 30 * hours
+            core_hours += entry['cpu'] / 100 * hours
+        await ctx.reply(f'{status}\n'
+                        f'Idle shutdowns: {len(self.history)}, {offline:.1f} hours offline, '
+                        f'saved about {gb_hours:.1f} GB-hours of memory and {core_hours:.1f} CPU core-hours',
+                        mention_author=False)
+
+    @idle.command(name='off')
+    @commands.is_owner()
+    async def idle_off(self, ctx: Context):
+        """Stop shutting the server down when idle"""
+        self.enabled = False
+        await ctx.tick(True)
+
+    @idle.command(name='on')
+    @commands.is_owner()
+    async def idle_on(self, ctx: Context):
+        """Shut the server down when idle"""
+        if IDLE_SHUTDOWN is None:
+            return await ctx.reply('Set IDLE_SHUTDOWN in the config first', mention_author=False)
+        self.enabled = True
+        self.empty_since = None
+        self.warned = None
+        await ctx.tick(True)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Idle(bot))
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional, TYPE_CHECKING
+
+from discord.ext import commands
+
+from utils.common import fmt_bytes, fmt_duration
+from utils.gclog import TPS_DROP, GCLogAnalyzer, heap_advice, tps_correlation
+from utils.logwatch import LogFollower
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+# Give other tasks a turn this often while catching up on a long log (lines)
+CATCH_UP_BATCH = 5000
+
+
+def _mb(value: float) -> str:
+    # NaN when the collector does not log heap sizes with its pauses
+    return fmt_bytes(value * 2 ** 20) if value == value else '?'
+
+
+class JVM(commands.Cog):
+    """Follows the GC log of the default server, see GC_LOGGING"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.analyzer: GCLogAnalyzer = GCLogAnalyzer()
+        self._task: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        self._task = asyncio.create_task(self.follow())
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    async def follow(self):
+        await self.bot.wait_until_ready()
+        server = self.server
+        if server is None or server.gc_log is None:
+            return
+        # Read what is already there once, after that only new lines are parsed
+        async for line in LogFollower(server.gc_log, from_start=True):
+            self.analyzer.feed(line)
+            if self.analyzer.lines % CATCH_UP_BATCH == 0:
+                await asyncio.sleep(0)
+
+    def correlation(self) -> Optional[dict]:
+        stats = self.bot.get_cog('Stats')
+        if stats is None:
+            return None
+        times = self.analyzer.pause_times.values()
+        pauses = self.analyzer.pauses.values()
+        data = stats.telemetry.since(times[0] if times else 0)  # type: ignore
+        known = [(t, ms) for t, ms in zip(times, pauses) if t == t]
+        return tps_correlation([t for t, _ in known], [ms for _, ms in known], data['time'], data['tps'],
+                               drop=TPS_DROP)
+
+    @commands.command(name='jvm')
+    @commands.is_owner()
+    async def jvm(self, ctx: Context):
+        """Show GC pauses, allocation rate and heap use, with heap size advice"""
+        server = self.server
+        if server is None or server.gc_log is None:
+            return await ctx.reply('Set GC_LOGGING in the config to analyze the GC log', mention_author=False)
+        summary = self.analyzer.summary()
+        if not summary['count']:
+            return await ctx.reply('No collections logged yet, GC logging starts with the next server start',
+                                   mention_author=False)
+
+        heap = f'heap max {_mb(summary["max_heap"])}, ' if summary['max_heap'] else ''
+        lines = [
+            f'{summary["collector"] or "Unknown collector"}, {heap}committed {_mb(summary["capacity"])}, '
+            f'JVM up {fmt_duration(summary["uptime"])}',
+            f'Collections: {summary["count"]} ({summary["full"]} full), '
+            f'{summary["overhead"] * 100:.2f}% of the time in pauses',
+            f'Pauses: p50 {summary["p50"]:.1f} ms, p95 {summary["p95"]:.1f} ms, p99 {summary["p99"]:.1f} ms, '
+            f'max {summary["max"]:.1f} ms',
+            f'Allocation rate: {_mb(summary["alloc_rate"])}/s',
+            f'Heap after GC: p50 {_mb(summary["heap_after_p50"])}, max {_mb(summary["heap_after_max"])}, '
+            f'live data about {_mb(summary["live"])}',
+        ]
+        correlation = self.correlation()
+        if correlation is not None and correlation['samples']:
+            r = correlation['r']
+            lines.append(f'TPS: {correlation["drops"]} of {correlation["samples"]} samples below {TPS_DROP:g}, '
+                         f'{correlation["drops_with_gc"]} of them with a pause over a tick'
+                         + (f', pause time vs TPS r = {r:.2f}' if r == r else ''))
+        advice = '\n'.join(f'- {line}' for line in heap_advice(summary))
+        await ctx.reply('```\n' + '\n'.join(lines) + '```\n' + advice, mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(JVM(bot))
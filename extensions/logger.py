@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import List, Optional, TYPE_CHECKING
+
+import discord
+from discord.ext import commands, tasks
+
+import config
+
+if TYPE_CHECKING:
+    from main import Bot
+
+
+logging = logging.getLogger(__name__)
+
+# Where to forward the server console, a webhook is preferred since it has its own rate limit
+CONSOLE_WEBHOOK_URL: Optional[str] = getattr(config, 'CONSOLE_WEBHOOK_URL', None)
+CONSOLE_CHANNEL_ID: Optional[int] = getattr(config, 'CONSOLE_CHANNEL_ID', None)
+# 'log' follows logs/latest.log, 'stdout' forwards the output of a server started by the bot
+CONSOLE_SOURCE: str = getattr(config, 'CONSOLE_SOURCE', 'log')
+CONSOLE_FLUSH_INTERVAL: float = getattr(config, 'CONSOLE_FLUSH_INTERVAL', 2.0)
+# Messages sent per flush, anything left over waits for the next flush
+CONSOLE_MAX_MESSAGES: int = getattr(config, 'CONSOLE_MAX_MESSAGES', 2)
+# Lines kept while waiting to be sent, the oldest are dropped when the server floods the console
+CONSOLE_MAX_BUFFER: int = getattr(config, 'CONSOLE_MAX_BUFFER', 2000)
+
+MESSAGE_LIMIT = 2000
+_fence = '```\n'
+
+
+def pack_lines(lines: deque, limit: int = MESSAGE_LIMIT, *, header: Optional[str] = None) -> str:
+    """Pops as many lines as fit into one code block message"""
+    budget = limit - len(_fence) - 3
+    parts: List[str] = []
+    size = 0
+    if header is not None:
+        parts.append(header)
+        size += len(header) + 1
+    while lines:
+        line = lines[0].replace('```', '`\u200b``')
+        if len(line) >= budget:
+            # Leaves room for the newline, so a single line always fits and is consumed
+            line = line[:budget - 5] + ' ...'
+        if size + len(line) + 1 > budget:
+            break
+        parts.append(line)
+        size += len(line) + 1
+        lines.popleft()
+    return _fence + '\n'.join(parts) + '```'
+
+
+class Logger(commands.Cog):
+    """Relays the server console to a channel"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.buffer: deque = deque(maxlen=CONSOLE_MAX_BUFFER)
+        self.dropped: int = 0
+        self.sent: int = 0
+        self.destination: Optional[discord.abc.Messageable] = None
+
+    async def cog_load(self):
+        if CONSOLE_WEBHOOK_URL:
+            self.destination = discord.Webhook.from_url(CONSOLE_WEBHOOK_URL, client=self.bot)
+        elif CONSOLE_CHANNEL_ID:
+            self.destination = self.bot.get_partial_messageable(CONSOLE_CHANNEL_ID)
+        else:
+            logging.info('No console channel configured, not forwarding the server console')
+            return
+        self.flush_loop.start()
+
+    async def cog_unload(self):
+        self.flush_loop.cancel()
+
+    def add_line(self, line: str):
+        if self.destination is None:
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(line)
+
+    @commands.Cog.listener()
+    async def on_server_log_line(self, line: str):
+        if CONSOLE_SOURCE == 'log':
+            self.add_line(line)
+
+    @commands.Cog.listener()
+    async def on_server_console_line(self, line: str):
+        if CONSOLE_SOURCE == 'stdout':
+            self.add_line(line)
+
+    @tasks.loop(seconds=CONSOLE_FLUSH_INTERVAL)
+    async def flush_loop(self):
+        if not self.buffer:
+            return
+        header = None
+        if self.dropped:
+            header = f'[... {self.dropped} lines dropped, the console is too busy ...]'
+            self.dropped = 0
+
+        for _ in range(CONSOLE_MAX_MESSAGES):
+            if not self.buffer:
+                break
+            content = pack_lines(self.buffer, header=header)
+            header = None
+            try:
+                await self.destination.send(content, allowed_mentions=discord.AllowedMentions.none())
+            except discord.HTTPException as e:
+                logging.error(f'Failed to forward console output | {e}')
+                break
+            self.sent += 1
+
+    @flush_loop.before_loop
+    async def before_flush(self):
+        await self.bot.wait_until_ready()
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Logger(bot))
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Optional, TYPE_CHECKING
+
+from aiohttp import web
+from discord.ext import commands
+
+import config
+from utils.metrics import (
+    command_latency,
+    loop_blocked,
+    loop_lag,
+    process_scan,
+    rcon_rtt,
+    registry,
+)
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+
+
+logging = logging.getLogger(__name__)
+
+# Address of the Prometheus endpoint, set METRICS_PORT to None to disable it
+METRICS_HOST: str = getattr(config, 'METRICS_HOST', '127.0.0.1')
+METRICS_PORT: Optional[int] = getattr(config, 'METRICS_PORT', 9180)
+# Event loop delays above this many seconds are logged as blocking
+LOOP_BLOCK_THRESHOLD: float = getattr(config, 'LOOP_BLOCK_THRESHOLD', 0.1)
+LOOP_LAG_INTERVAL = 0.25
+
+
+class Metrics(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._runner: Optional[web.AppRunner] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._previous_hooks = (None, None)
+
+    async def cog_load(self):
+        # Keep whatever hooks were installed before so unloading puts them back
+        self._previous_hooks = (self.bot._before_invoke, self.bot._after_invoke)
+        self.bot.before_invoke(self.before_invoke)
+        self.bot.after_invoke(self.after_invoke)
+        registry.callback_counter('satuse_player_cache_hits_total', 'Player list cache hits',
+                                  lambda: self._cache_stat('hits'))
+        registry.callback_counter('satuse_player_cache_misses_total', 'Player list cache misses',
+                                  lambda: self._cache_stat('misses'))
+        registry.callback_counter('satuse_player_cache_coalesced_total',
+                                  'Player list requests that joined an in-flight request',
+                                  lambda: self._cache_stat('coalesced'))
+        self._lag_task = asyncio.create_task(self.monitor_loop_lag())
+
+        if METRICS_PORT is not None:
+            app = web.Application()
+            app.router.add_get('/metrics', self.handle_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, METRICS_HOST, METRICS_PORT).start()
+            logging.info(f'Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics')
+
+    async def cog_unload(self):
+        # Only put back the previous hooks if nothing has replaced ours since
+        before, after = self._previous_hooks
+        if self.bot._before_invoke == self.before_invoke:
+            self.bot._before_invoke = before
+        if self.bot._after_invoke == self.after_invoke:
+            self.bot._after_invoke = after
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def cog_check(self, ctx: Context):
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner
+        return True
+
+    def _cache_stat(self, name: str) -> float:
+        server = self.bot.get_cog('Server')
+        if server is None:
+            return 0
+        return sum(getattr(instance.players, name) for instance in server.instances.values())  # type: ignore
+
+    async def before_invoke(self, ctx: Context):
+        ctx.invoked_at = time.perf_counter()  # type: ignore
+
+    async def after_invoke(self, ctx: Context):
+        start = getattr(ctx, 'invoked_at', None)
+        if start is not None and ctx.command is not None:
+            command_latency.observe(time.perf_counter() - start, ctx.command.qualified_name)
+
+    async def monitor_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, loop.time() - expected)
+            loop_lag.observe(lag)
+            if lag > LOOP_BLOCK_THRESHOLD:
+                loop_blocked.inc()
+                logging.warning(f'Event loop was blocked for {lag * 1000:.0f} ms')
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    @commands.command(name='perf')
+    async def perf(self, ctx: Context):
+        """Show command, RCON and event loop timings"""
+        def row(name, histogram, *labels):
+            return (f'{name[:24]:<24} {histogram.count(*labels):>6} '
+                    f'{histogram.quantile(0.5, *labels) * 1000:>9.1f} {histogram.quantile(0.99, *labels) * 1000:>9.1f}')
+
+        lines = [f'{"":<24} {"count":>6} {"p50 ms":>9} {"p99 ms":>9}']
+        for labels in sorted(command_latency.labels()):
+            lines.append(row(f'cmd {labels[0]}', command_latency, *labels))
+        for labels in sorted(rcon_rtt.labels()):
+            lines.append(row(f'rcon {labels[0]}', rcon_rtt, *labels))
+        lines.append(row('process scan', process_scan))
+        lines.append(row('loop lag', loop_lag))
+
+        await ctx.reply(f'```\n' + '\n'.join(lines) + '```\n'
+                        f'Event loop blocked >{LOOP_BLOCK_THRESHOLD * 1000:.0f} ms: {loop_blocked.value():.0f} times\n'
+                        f'Player cache: {self._cache_stat("hits"):.0f} hits, {self._cache_stat("misses"):.0f} misses, '
+                        f'{self._cache_stat("coalesced"):.0f} coalesced',
+                        mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Metrics(bot))
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Set, TYPE_CHECKING
+
+import discord
+from discord.ext import commands, tasks
+
+import config
+from utils.common import DATA_DIR, fmt_duration
+from utils.logs import log_files
+from utils.rcon import RCON_ERRORS
+from utils.sessions import SessionStore
+from config import SERVER_DIR
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+SESSIONS_DB: str = getattr(config, 'SESSIONS_DB', os.path.join(DATA_DIR, 'sessions.db'))
+# Processes used to read old logs on the first import, None for one per CPU
+SESSIONS_BACKFILL_WORKERS: Optional[int] = getattr(config, 'SESSIONS_BACKFILL_WORKERS', None)
+# Days counted as "recent" by playtime and peak
+SESSIONS_RECENT_DAYS: int = getattr(config, 'SESSIONS_RECENT_DAYS', 7)
+# Open sessions are closed at the last heartbeat if the bot goes down while players are online (seconds)
+HEARTBEAT_INTERVAL = 60
+
+
+def _dt(timestamp: float, style: str = 'f') -> str:
+    return discord.utils.format_dt(datetime.fromtimestamp(timestamp, timezone.utc), style)
+
+
+class Playtime(commands.Cog):
+    """Records player sessions from join/leave events"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.store: SessionStore = SessionStore(SESSIONS_DB, workers=SESSIONS_BACKFILL_WORKERS)
+        self.online: Set[str] = set()
+        self.loaded_at: float = time.time()
+        self._task: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        await self.store.open()
+        self._task = asyncio.create_task(self.catch_up())
+        self.heartbeat_loop.start()
+
+    async def cog_unload(self):
+        self.heartbeat_loop.cancel()
+        if self._task is not None:
+            self._task.cancel()
+        await self.store.close()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    async def catch_up(self):
+        """Fixes up sessions left open while the bot was down, then imports the old logs once"""
+        await self.bot.wait_until_ready()
+        open_sessions = await self.store.online()
+        current: Set[str] = set()
+        server = self.server
+        if self.bot.server_status and server is not None:
+            try:
+                players = await server.players.get()
+            except RCON_ERRORS:
+                players = {}
+            current = {p.strip() for p in players.get('players', '').split(',') if p.strip()}
+
+        if set(open_sessions) - current:
+            # Nobody can tell when they left, so close everything at the last heartbeat
+            await self.store.leave_all()
+        for player in current:
+            # Keeps the start of a session that is still open
+            await self.store.join(player, self.loaded_at, len(current))
+        self.online = current
+
+        log_dir = os.path.join(server.directory if server is not None else SERVER_DIR, 'logs')
+        if await self.store.get_meta('backfilled') is None and os.path.isdir(log_dir):
+            start = time.perf_counter()
+            running = os.path.join(log_dir, 'latest.log') if self.bot.server_status else None
+            files, sessions = await self.store.backfill(log_files(log_dir), before=self.loaded_at, running=running)
+            await self.store.set_meta('backfilled', time.time())
+            logging.info(f'Imported {sessions} sessions from {files} log files in {time.perf_counter() - start:.1f}s')
+
+    @commands.Cog.listener()
+    async def on_player_join(self, player: str):
+        self.online.add(player)
+        await self.store.join(player, time.time(), len(self.online))
+
+    @commands.Cog.listener()
+    async def on_player_leave(self, player: str):
+        self.online.discard(player)
+        await self.store.leave(player, time.time())
+
+    @commands.Cog.listener()
+    async def on_server_stopping(self):
+        self.online.clear()
+        await self.store.leave_all(time.time())
+
+    @commands.Cog.listener()
+    async def on_server_process_exit(self, returncode: Optional[int]):
+        self.online.clear()
+        await self.store.leave_all(time.time())
+
+    @tasks.loop(seconds=HEARTBEAT_INTERVAL)
+    async def heartbeat_loop(self):
+        if self.online:
+            await self.store.set_meta('heartbeat', time.time())
+
+    @commands.hybrid_command(name='playtime')
+    async def playtime(self, ctx: Context, player: str):
+        """How long a player has played on the server"""
+        since = time.time() - SESSIONS_RECENT_DAYS * 86400
+        stats = await self.store.playtime(player, since=since)
+        if stats is None:
+            return await ctx.reply(f'`{player}` has never played here', mention_author=False)
+        total, recent = stats['total'], stats['recent']
+        if stats['online_since'] is not None:
+            total += time.time() - stats['online_since']
+            recent += time.time() - max(stats['online_since'], since)
+        await ctx.reply(f'**{stats["player"]}** has played {fmt_duration(total)} over {stats["sessions"]} sessions '
+                        f'since {_dt(stats["first"], "D")}, {fmt_duration(recent)} in the last {SESSIONS_RECENT_DAYS} days',
+                        mention_author=False)
+
+    @commands.hybrid_command(name='seen')
+    async def seen(self, ctx: Context, player: str):
+        """When a player was last online"""
+        stats = await self.store.playtime(player)
+        if stats is None:
+            return await ctx.reply(f'`{player}` has never played here', mention_author=False)
+        if stats['online_since'] is not None:
+            return await ctx.reply(f'**{stats["player"]}** is online now, '
+                                   f'joined {_dt(stats["online_since"], "R")}', mention_author=False)
+        await ctx.reply(f'**{stats["player"]}** was last seen {_dt(stats["last"])} ({_dt(stats["last"], "R")})',
+                        mention_author=False)
+
+    @commands.hybrid_command(name='peak')
+    async def peak(self, ctx: Context):
+        """Most players online at once"""
+        peaks = await self.store.peak(since=time.time() - SESSIONS_RECENT_DAYS * 86400)
+        if peaks['all_time'] is None:
+            return await ctx.reply('No sessions recorded yet', mention_author=False)
+        _, players, at = peaks['all_time']
+        lines = [f'All time peak: **{players}** players on {_dt(at)}']
+        if peaks['recent'] is not None:
+            _, players, at = peaks['recent']
+            lines.append(f'Last {SESSIONS_RECENT_DAYS} days: **{players}** players on {_dt(at)}')
+        lines.append('```\n' + '\n'.join(f'{day}  {players:>3}' for day, players in peaks['days']) + '```')
+        await ctx.reply('\n'.join(lines), mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Playtime(bot))
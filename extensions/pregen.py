@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from typing import Optional, TYPE_CHECKING
+
+from discord.ext import commands, tasks
+
+import config
+from utils.common import TPS_COMMAND, fmt_duration, query_tps
+from utils.pregen import overloaded, parse_finished, parse_progress
+from utils.rcon import RCON_ERRORS
+from utils.telemetry import NAN
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+# Blocks around PREGEN_CENTER to pregenerate with Chunky while nobody is online, None to never pregenerate
+PREGEN_RADIUS: Optional[int] = getattr(config, 'PREGEN_RADIUS', None)
+PREGEN_CENTER = getattr(config, 'PREGEN_CENTER', (0, 0))
+PREGEN_WORLD: str = getattr(config, 'PREGEN_WORLD', 'minecraft:overworld')
+# Minutes the server has to be empty before generating
+PREGEN_IDLE_DELAY: float = getattr(config, 'PREGEN_IDLE_DELAY', 5)
+# Generation pauses when a tick takes longer than this (ms), or TPS drops below PREGEN_MIN_TPS when there is no MSPT,
+# and continues once it is back under PREGEN_RESUME_MSPT
+PREGEN_MAX_MSPT: float = getattr(config, 'PREGEN_MAX_MSPT', 45)
+PREGEN_RESUME_MSPT: float = getattr(config, 'PREGEN_RESUME_MSPT', 30)
+PREGEN_MIN_TPS: float = getattr(config, 'PREGEN_MIN_TPS', 18)
+# How often the tick time and progress are checked (seconds)
+PREGEN_CHECK_INTERVAL: float = getattr(config, 'PREGEN_CHECK_INTERVAL', 20)
+
+
+class Pregen(commands.Cog):
+    """Drives Chunky while the server is empty, pausing for players and for lag
+
+    Progress is kept in the state store under 'pregen' so it survives bot and server restarts,
+    Chunky keeps its own position in the task and picks it back up with `chunky continue`.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.enabled: bool = PREGEN_RADIUS is not None
+        # Whether Chunky is generating because we told it to
+        self.running: bool = False
+        # Why it is not generating right now
+        self.reason: Optional[str] = None
+        self.empty_since: Optional[float] = None
+        self.last_tick: Optional[float] = None
+        self.mspt: float = NAN
+        self.tps: float = NAN
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self.job: dict = self.load_job()
+        self.pregen_loop.start()
+
+    async def cog_unload(self):
+        self.pregen_loop.cancel()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    @property
+    def pending(self) -> bool:
+        """Whether there is generating left to do, the Idle cog keeps the server up until it is done"""
+        return self.enabled and self.job.get('radius') is not None and self.job.get('finished') is None
+
+    def load_job(self) -> dict:
+        job = {'world': PREGEN_WORLD, 'center': list(PREGEN_CENTER), 'radius': PREGEN_RADIUS}
+        saved = self.bot.state.get('pregen')
+        if saved and all(saved.get(k) == v for k, v in job.items()):
+            return saved
+        if saved:
+            logging.info(f'Pregeneration settings changed, starting a new task for {PREGEN_WORLD}')
+        return {**job, 'started': False, 'replace': bool(saved), 'chunks': 0, 'percent': 0.0, 'rate': None,
+                'generating': 0.0, 'finished': None}
+
+    def save_job(self):
+        self.bot.state.set('pregen', self.job)
+
+    def tick(self):
+        """Adds the time since the last check to the generating time"""
+        now = time.time()
+        if self.running and self.last_tick is not None:
+            self.job['generating'] += now - self.last_tick
+        self.last_tick = now
+
+    async def pause(self, server: ServerInstance, reason: str):
+        async with self._lock:
+            self.reason = reason
+            if not self.running:
+                return
+            self.tick()
+            self.running = False
+            logging.info(f'Pausing pregeneration | {reason}')
+            try:
+                await server.rcon.send('chunky pause')
+            except RCON_ERRORS as e:
+                logging.error(f'Failed to pause pregeneration | {e}')
+            self.save_job()
+
+    async def resume(self, server: ServerInstance):
+        async with self._lock:
+            if self.running:
+                return
+            # A player may have joined while the loop was waiting on RCON, pausing did nothing then
+            if self.reason == 'players' or self.empty_since is None:
+                return
+            self.reason = None
+            if self.job['started']:
+                resp = await server.rcon.send('chunky continue')
+                if 'no task' not in resp.lower():
+                    logging.info(f'Continuing pregeneration at {self.job["percent"]:.2f}%')
+                    self.running = True
+                    self.last_tick = time.time()
+                    return
+            x, z = self.job['center']
+            if self.job.get('replace'):
+                # Drop Chunky's saved task for the old settings
+                await server.rcon.send('chunky cancel')
+            for command in (f'chunky world {self.job["world"]}', f'chunky center {x} {z}',
+                            f'chunky radius {self.job["radius"]}'):
+                await server.rcon.send(command)
+            resp = await server.rcon.send('chunky start')
+            if 'confirm' in resp.lower():
+                await server.rcon.send('chunky confirm')
+            logging.info(f'Started pregenerating {self.job["world"]} with radius {self.job["radius"]} around {x}, {z}')
+            # Only now, if anything before failed the old task still needs cancelling next time
+            self.job.pop('replace', None)
+            self.job['started'] = True
+            self.running = True
+            self.last_tick = time.time()
+            self.save_job()
+
+    def finish(self):
+        self.tick()
+        self.running = False
+        self.reason = None
+        self.job['percent'] = 100.0
+        self.job['finished'] = time.time()
+        self.save_job()
+        logging.info(f'Pregeneration of {self.job["world"]} finished after {fmt_duration(self.job["generating"])}')
+
+    async def update_progress(self, server: ServerInstance):
+        progress = parse_progress(await server.rcon.send('chunky progress'))
+        self.tick()
+        if progress is None:
+            # The task is gone: finished while we were not looking, or cancelled by hand
+            if self.job['percent'] >= 99.99:
+                self.finish()
+            else:
+                self.running = False
+            return
+        if progress['world'] != self.job['world']:
+            return
+        self.job.update(chunks=progress['chunks'], percent=progress['percent'], rate=progress['rate'])
+        self.save_job()
+
+    async def players_online(self, server: ServerInstance) -> Optional[int]:
+        try:
+            players = await server.players.get()
+        except RCON_ERRORS:
+            return None
+        return int(players['count']) if players else None
+
+    @commands.Cog.listener()
+    async def on_player_join(self, player: str):
+        self.empty_since = None
+        server = self.server
+        # Also when not generating: it waits for a `resume` in progress, and stops the loop from resuming
+        if self.pending and server is not None:
+            await self.pause(server, 'players')
+
+    @commands.Cog.listener()
+    async def on_server_log_line(self, line: str):
+        if self.pending and parse_finished(line) == self.job['world']:
+            self.finish()
+
+    @commands.Cog.listener()
+    async def on_server_launch(self, reason: str):
+        self.reset()
+
+    @commands.Cog.listener()
+    async def on_server_process_exit(self, returncode: Optional[int]):
+        self.reset()
+
+    def reset(self):
+        # Chunky saves the task when the server stops
+        self.tick()
+        self.running = False
+        self.reason = None
+        self.empty_since = None
+        self.last_tick = None
+        if self.job.get('started'):
+            self.save_job()
+
+    @tasks.loop(seconds=PREGEN_CHECK_INTERVAL)
+    async def pregen_loop(self):
+        server = self.server
+        if not self.pending or server is None or not self.bot.server_status or server.loading:
+            return
+        try:
+            count = await self.players_online(server)
+            if count is None:
+                return
+            now = time.time()
+            if count:
+                self.empty_since = None
+                return await self.pause(server, 'players')
+            if self.empty_since is None:
+                self.empty_since = now
+            if now - self.empty_since < PREGEN_IDLE_DELAY * 60:
+                self.reason = 'waiting'
+                return
+            if self.reason == 'players':
+                # Everyone left, `resume` holds off while the reason is still players
+                self.reason = None
+
+            lagging = None
+            if TPS_COMMAND:
+                self.tps, self.mspt = await query_tps(server.rcon, timeout=PREGEN_CHECK_INTERVAL)
+                if self.running:
+                    lagging = overloaded(self.tps, self.mspt, max_mspt=PREGEN_MAX_MSPT, min_tps=PREGEN_MIN_TPS)
+                else:
+                    # A lower bar to continue than to pause, so it does not flap around the limit
+                    lagging = overloaded(self.tps, self.mspt, max_mspt=PREGEN_RESUME_MSPT, min_tps=PREGEN_MIN_TPS)
+            if self.running:
+                await self.update_progress(server)
+                if lagging and self.running:
+                    await self.pause(server, 'lag')
+            elif not lagging:
+                await self.resume(server)
+            else:
+                self.reason = 'lag'
+        except RCON_ERRORS as e:
+            logging.warning(f'Pregeneration check failed | {e}')
+
+    @pregen_loop.before_loop
+    async def before_pregen(self):
+        await self.bot.wait_until_ready()
+
+    @commands.group(name='pregen', invoke_without_command=True)
+    async def pregen(self, ctx: Context):
+        """Show how far chunk pregeneration is"""
+        await self.pregen_status(ctx)
+
+    @pregen.command(name='status')
+    async def pregen_status(self, ctx: Context):
+        """Show how far chunk pregeneration is"""
+        job = self.job
+        if job.get('radius') is None:
+            return await ctx.reply('Set PREGEN_RADIUS in the config to pregenerate chunks', mention_author=False)
+        x, z = job['center']
+        lines = [f'Pregenerating `{job["world"]}` {job["radius"]} blocks around {x}, {z}: '
+                 f'**{job["percent"]:.2f}%** ({job["chunks"]} chunks)']
+        if job['finished'] is not None:
+            lines.append(f'Finished after {fmt_duration(job["generating"])} of generating')
+        else:
+            if not self.enabled:
+                lines.append('Paused, turned off')
+            elif not self.bot.server_status:
+                lines.append('Waiting for the server to start')
+            elif self.running:
+                rate = f' at {job["rate"]:.1f} chunks/s' if job['rate'] else ''
+                lines.append(f'Generating now{rate}')
+            elif self.reason == 'players':
+                lines.append('Paused while players are online')
+            elif self.reason == 'lag':
+                lines.append(f'Paused while the server is lagging (MSPT {self.mspt:.1f}, TPS {self.tps:.1f})')
+            else:
+                lines.append(f'Waiting for the server to be empty for {PREGEN_IDLE_DELAY:g} minutes')
+            if job['percent'] > 0 and job['generating'] > 0:
+                remaining = job['generating'] * (100 - job['percent']) / job['percent']
+                lines.append(f'Generated for {fmt_duration(job["generating"])}, '
+                             f'about {fmt_duration(remaining)} of generating left')
+        await ctx.reply('\n'.join(lines), mention_author=False)
+
+    @pregen.command(name='off')
+    @commands.is_owner()
+    async def pregen_off(self, ctx: Context):
+        """Stop pregenerating chunks"""
+        self.enabled = False
+        server = self.server
+        if server is not None:
+            await self.pause(server, 'off')
+        await ctx.tick(True)
+
+    @pregen.command(name='on')
+    @commands.is_owner()
+    async def pregen_on(self, ctx: Context):
+        """Pregenerate chunks while the server is empty"""
+        if PREGEN_RADIUS is None:
+            return await ctx.reply('Set PREGEN_RADIUS in the config first', mention_author=False)
+        self.enabled = True
+        await ctx.tick(True)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Pregen(bot))
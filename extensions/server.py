@@ -3,16 +3,15 @@ from __future__ import annotations
 import os
 import logging
 import asyncio
-from subprocess import Popen, PIPE, DETACHED_PROCESS, CREATE_NEW_PROCESS_GROUP
-from typing import TYPE_CHECKING
+from typing import Dict, List, Optional, TYPE_CHECKING
 
-import psutil
 import discord
 from discord.ext import commands, tasks
 
-from utils.mcrcon import RCONClient
-from utils.common import parse_list_resp, cooldown_with_bypass
-from config import SERVER_DIR, OWNER_ID, SERVER_IP, RCON_PORT, RCON_PASS
+import config
+from utils.common import cooldown_with_bypass
+from utils.instance import CONFIRMING, OFFLINE, ONLINE, STARTING, STOPPING, ServerInstance
+from config import SERVER_DIR, OWNER_ID, SERVER_IP, RCON_PORT, RCON_PASS, MODPACK_NAME
 
 if TYPE_CHECKING:
     from main import Bot
@@ -20,139 +19,244 @@ if TYPE_CHECKING:
 
 
 logging = logging.getLogger(__name__)
+# Directory the server JVM runs from or is installed in (its cwd or executable is inside it), defaults to SERVER_DIR
+# Path the server JVM runs from (matched against its cwd and executable), defaults to SERVER_DIR
+SERVER_PROCESS_MATCH = getattr(config, 'SERVER_PROCESS_MATCH', SERVER_DIR)
+SERVER_PROCESS_NAMES = getattr(config, 'SERVER_PROCESS_NAMES', ('java', 'java.exe', 'javaw.exe'))
+# Command used to launch the server, run from SERVER_DIR (a program found there is run by its full path)
+SERVER_COMMAND = getattr(config, 'SERVER_COMMAND', ['start.bat'] if os.name == 'nt' else ['sh', 'start.sh'])
+# How long to wait for the `Done` line before assuming the server is up anyway
+SERVER_START_TIMEOUT = getattr(config, 'SERVER_START_TIMEOUT', 60 * 15)
+PLAYER_CACHE_TTL = getattr(config, 'PLAYER_CACHE_TTL', 30)
+# Where the Server List Ping status probe connects to, set the host when the server runs on another machine.
+# SERVER_PORT None turns the probe off and leaves only the process check.
+SERVER_HOST = getattr(config, 'SERVER_HOST', 'localhost')
+SERVER_PORT = getattr(config, 'SERVER_PORT', 25565)
+STATUS_CACHE_TTL = getattr(config, 'STATUS_CACHE_TTL', 10)
+# How often the servers are pinged to keep the player counts in the presence fresh (seconds)
+PRESENCE_INTERVAL = getattr(config, 'PRESENCE_INTERVAL', 60)
+# Have servers the bot launches write a GC log for the `jvm` command (Java 9+)
+GC_LOGGING = getattr(config, 'GC_LOGGING', False)
+# Several servers on one host, by name: {'atm9': {'dir': ..., 'rcon_port': ..., 'rcon_pass': ..., 'command': [...],
+# 'ip': ..., 'modpack': ..., 'host': ..., 'port': ..., 'gc_logging': ...}}, only 'dir' and 'rcon_port' are required, without 'port'
+# there is no status probe. The first one is the default for commands,
+# the crash watchdog, idle shutdown, backups and stats look after it and read its files from its 'dir'.
+# When unset there is a single server made from SERVER_DIR, RCON_PORT and the settings above.
+SERVER_INSTANCES: Optional[Dict[str, dict]] = getattr(config, 'SERVER_INSTANCES', None)
 
 
 class Server(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.instances: Dict[str, ServerInstance] = {}
+        for i, (name, settings) in enumerate((SERVER_INSTANCES or {'default': {}}).items()):
+            directory = settings.get('dir', SERVER_DIR)
+            self.instances[name.lower()] = ServerInstance(
+                bot, name,
+                directory=directory,
+                command=settings.get('command', SERVER_COMMAND),
+                rcon_port=settings.get('rcon_port', RCON_PORT),
+                rcon_pass=settings.get('rcon_pass', RCON_PASS),
+                ip=settings.get('ip', SERVER_IP),
+                status_host=settings.get('host', SERVER_HOST),
+                status_port=settings.get('port', SERVER_PORT if SERVER_INSTANCES is None else None),
+                status_ttl=STATUS_CACHE_TTL,
+                gc_logging=settings.get('gc_logging', GC_LOGGING),
+                modpack=settings.get('modpack', MODPACK_NAME if SERVER_INSTANCES is None else name),
+                process_match=settings.get('process_match', SERVER_PROCESS_MATCH if SERVER_INSTANCES is None else directory),
+                process_names=SERVER_PROCESS_NAMES,
+                start_timeout=SERVER_START_TIMEOUT,
+                player_cache_ttl=PLAYER_CACHE_TTL,
+                primary=i == 0,
+                on_change=self.refresh_presence,
+            )
+        # Commands without an instance name use this one, it is also the one the other cogs follow
+        self.default: ServerInstance = next(iter(self.instances.values()))
+        # Last presence sent, so the periodic refresh only talks to Discord when it changed
+        self._presence: Optional[tuple] = None
         self.server_checker_loop.start()
-        self._checker_lock: asyncio.Lock = asyncio.Lock()
+        if any(instance.probe is not None for instance in self.instances.values()):
+            self.presence_loop.start()
+
+    async def cog_load(self):
+        for instance in self.instances.values():
+            instance.start()
 
     async def cog_unload(self):
         self.server_checker_loop.cancel()
+        self.presence_loop.cancel()
+        await asyncio.gather(*(instance.close() for instance in self.instances.values()))
 
     @commands.Cog.listener()
     async def on_ready(self):
+        if any(instance.online for instance in self.instances.values()):
+            self._presence = None
+            await self.refresh_presence()
         if self.server_checker_loop.current_loop > 1:
             self.server_checker_loop.restart()
 
-    async def wait_then_online(self):
-        await asyncio.sleep(60 * 3)
-        await self.bot.set_online_status()
+    # Log events of the default server, the others handle their own
+    @commands.Cog.listener()
+    async def on_server_ready(self, time: str):
+        await self.default.handle_event('server_ready', (time,))
 
-    @commands.command(name='start')
-    @commands.max_concurrency(1, wait=True)
-    async def start_server(self, ctx: Context):
-        """Starts the server"""
-        async with ctx.typing():
-            await self.check_server_status()
-
-        async with self._checker_lock:
-            if ctx.author.id != OWNER_ID:
-                if 'uwu' not in ctx.prefix:
-                    await ctx.reply('To start the server: `uwu pls start`', mention_author=False)
-                    return
-
-            if self.bot.server_status:
-                dt = self.bot.server_start_time
-                await ctx.reply(f'Server is already running! The server was last started at {discord.utils.format_dt(dt)} ({discord.utils.format_dt(dt, "R")})\n'
-                                f'If it has been more than a few minutes and the server is still down, please message me!')
-                return
+    @commands.Cog.listener()
+    async def on_server_stopping(self):
+        await self.default.handle_event('server_stopping', ())
 
-            _confirm = 'uwu yes pls'
+    @commands.Cog.listener()
+    async def on_player_join(self, player: str):
+        await self.default.handle_event('player_join', (player,))
 
-            def confirm_check(msg: discord.Message):
-                if msg.author.id != ctx.author.id or msg.channel.id != ctx.channel.id:
-                    return False
+    @commands.Cog.listener()
+    async def on_player_leave(self, player: str):
+        await self.default.handle_event('player_leave', (player,))
+
+    def label(self, instance: ServerInstance) -> str:
+        """Prefix for replies, so it is clear which server they are about"""
+        return f'**{instance.name}**: ' if len(self.instances) > 1 else ''
+
+    async def get_instance(self, ctx: Context, name: Optional[str]) -> Optional[ServerInstance]:
+        if name is None:
+            return self.default
+        instance = self.instances.get(name.lower())
+        if instance is None:
+            await ctx.reply(f'There is no server called `{name}`, try one of: '
+                            + ', '.join(f'`{n}`' for n in self.instances), mention_author=False)
+        return instance
+
+    async def refresh_presence(self):
+        """Shows the online servers and their player counts in the bot status, idle while they are all still loading"""
+        online: List[ServerInstance] = [i for i in self.instances.values() if i.online]
+        names = []
+        for instance in online:
+            status = instance.probe.last if instance.probe is not None else None
+            if instance.loading:
+                names.append(f'{instance.modpack} (loading)')
+            elif status is not None:
+                names.append(f'{instance.modpack} ({status["online"]}/{status["max"]})')
+            else:
+                names.append(instance.modpack)
 
-                if ctx.author.id == OWNER_ID:
-                    return msg.content.lower() in (_confirm, 'confirm', 'cancel')
-                else:
-                    return msg.content.lower() in (_confirm, 'cancel')
+        if not online:
+            presence = ('offline',)
+        elif all(i.loading for i in online):
+            presence = ('starting', ', '.join(i.modpack for i in online))
+        else:
+            presence = ('online', ', '.join(names))
+        if presence == self._presence:
+            return
+        self._presence = presence
+        if presence[0] == 'offline':
+            await self.bot.set_offline_status()
+        elif presence[0] == 'starting':
+            await self.bot.set_starting_status(presence[1])
+        else:
+            await self.bot.set_online_status(presence[1])
 
-            prompt = await ctx.reply(f'Are you sure you want to start the server? Please type `{_confirm}` within 1 minute to confirm.')
+    async def check_server_status(self):
+        """Checks every instance at once"""
+        await asyncio.gather(*(instance.check_status() for instance in self.instances.values()))
 
-            try:
-                answer = await self.bot.wait_for('message', check=confirm_check, timeout=60)
-            except asyncio.TimeoutError:
+    @commands.hybrid_command(name='start')
+    async def start_server(self, ctx: Context, instance: Optional[str] = None):
+        """Starts the server"""
+        server = await self.get_instance(ctx, instance)
+        if server is None:
+            return
+        label = self.label(server)
+        if ctx.author.id != OWNER_ID and ctx.interaction is None:
+            if 'uwu' not in ctx.prefix:
+                await ctx.reply('To start the server: `/start` or `uwu pls start`', mention_author=False)
+                return
+        async with ctx.typing():
+            await server.check_status()
+
+        # Nothing is held while the prompt is open, a second start joins the one in progress instead of queueing
+        if server.state == CONFIRMING:
+            await ctx.reply(f'{label}{server.prompt_by} is already confirming a server start.', mention_author=False)
+            return
+        if server.state == STARTING:
+            await ctx.reply(f'{label}Server is already starting... I will let you know once all mods have loaded.',
+                            mention_author=False)
+            if server.launcher.running:
+                server.wait_in_background(ctx, prefix=label)
+            return
+        if server.state == STOPPING:
+            await ctx.reply(f'{label}The server is shutting down, please try again once it is offline.',
+                            mention_author=False)
+            return
+        if server.state == ONLINE:
+            dt = server.start_time
+            await ctx.reply(f'{label}Server is already running! The server was last started at {discord.utils.format_dt(dt)} ({discord.utils.format_dt(dt, "R")})\n'
+                            f'If it has been more than a few minutes and the server is still down, please message me!')
+            return
+
+        server.transition(CONFIRMING, OFFLINE)
+        server.prompt_by = str(ctx.author)
+        launched = False
+        try:
+            confirmed = await ctx.confirm_prompt(f'{label}Are you sure you want to start the server? Please confirm within 1 minute.')
+            if confirmed:
+                async with ctx.typing():
+                    logging.info(f'Starting server {server.name}... | {ctx.author}')
+                    # Fails if it came up some other way while the prompt was open
+                    launched = await server.launch(str(ctx.author), expected=(CONFIRMING,))
+        finally:
+            server.prompt_by = None
+            # Every way of not launching (cancelled, timed out, the prompt or the launch failing) ends up offline
+            server.transition(OFFLINE, CONFIRMING)
+        if not confirmed:
+            if confirmed is None:
                 await ctx.reply('Did not receive a confirmation within 1 minute. Cancelling server start',
                                 mention_author=False)
-                return
             else:
-                if answer.content.lower() == 'cancel':
-                    await ctx.reply('Cancelling server start',
-                                    mention_author=False)
-                    return
-            finally:
-                try:
-                    await prompt.delete()
-                except discord.HTTPException:
-                    pass
-
-            async with ctx.typing():
-                logging.info(f'Starting server... | {ctx.author}')
-                oldcwd = os.getcwd()
-                os.chdir(SERVER_DIR)
-
-                CMD_ARGS = ['start.bat']
-
-                Popen(
-                    CMD_ARGS,
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    creationflags=DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
-                )
-
-                os.chdir(oldcwd)
-
-                self.bot.server_status = True
-                self.bot.server_start_time = discord.utils.utcnow()
-
-            await ctx.reply(f'Server is starting now... Please allow a few minutes to fully load all mods.')
-
-            await self.bot.set_online_status()
-            logging.info(f'Server successfully started')
-
-    @staticmethod
-    def check_server_exe():
-        for p in psutil.process_iter(['name']):
-            try:
-                if p.name() == 'java.exe':
-                    if r'Desktop\Minecraft' in p.cwd() or r'Desktop\Minecraft' in p.exe():
-                        return True
-            except psutil.AccessDenied:
-                continue
-        return False
+                await ctx.reply('Cancelling server start',
+                                mention_author=False)
+            return
+        if not launched:
+            await ctx.reply(f'{label}The server was started while you were confirming, it is {server.state} now.',
+                            mention_author=False)
+            return
 
-    async def check_server_status(self):
-        async with self._checker_lock:
-            logging.debug('Checking server status...')
-            _status = self.check_server_exe()
-            if _status:
-                if self.bot.server_status:
-                    return
-                logging.info('Server is running, changing status...')
-                self.bot.server_status = True
-                self.bot.server_start_time = discord.utils.utcnow()
-                await self.bot.set_online_status()
-            else:
-                if not self.bot.server_status:
-                    return
-                logging.info('Server is not running, changing status...')
-                self.bot.server_status = False
-                await self.bot.set_offline_status()
+        msg = f'{label}Server is starting now... I will let you know once all mods have loaded.'
+        # Startup profiles are only recorded for the default server
+        startup = self.bot.get_cog('Startup') if server.primary else None
+        expected = startup.expected_duration() if startup is not None else None  # type: ignore
+        if expected is not None:
+            eta = f'{expected / 60:.0f} minutes' if expected >= 90 else f'{expected:.0f} seconds'
+            msg += f'\nThis usually takes about {eta}.'
+        await ctx.reply(msg)
+
+        server.wait_in_background(ctx, prefix=label)
+        logging.info(f'Server {server.name} successfully started')
 
-    @tasks.loop(minutes=15)
+    # Process exit and log events update the status right away, this is just a safety net
+    @tasks.loop(hours=1)
     async def server_checker_loop(self):
         await self.check_server_status()
 
+    @tasks.loop(seconds=PRESENCE_INTERVAL)
+    async def presence_loop(self):
+        probed = [i for i in self.instances.values() if i.probe is not None]
+        answers = await asyncio.gather(*(i.probe_status() for i in probed))
+        # Answering while marked offline or loading, or silent while marked up: let the full check sort it out.
+        # Servers that are still loading or shutting down are left alone.
+        changed = [i for i, answer in zip(probed, answers)
+                   if (answer is not None) != (i.state == ONLINE) and i.state != STOPPING
+                   and not (answer is None and i.loading)]
+        await asyncio.gather(*(i.check_status() for i in changed))
+        await self.refresh_presence()
+
+    @presence_loop.before_loop
+    async def before_presence(self):
+        await self.bot.wait_until_ready()
+
     @server_checker_loop.before_loop
     async def sleep_before(self):
-        async with self._checker_lock:
-            await self.bot.wait_until_ready()
-            # await asyncio.sleep(5)
-            logging.info('Server status checker started')
+        await self.bot.wait_until_ready()
+        # await asyncio.sleep(5)
+        logging.info('Server status checker started')
 
     @commands.command(hidden=True)
     @commands.is_owner()
@@ -160,11 +264,18 @@ class Server(commands.Cog):
         await self.check_server_status()
         await ctx.tick(True)
 
-    @commands.command()
-    async def ip(self, ctx: Context):
+    @commands.hybrid_command()
+    async def ip(self, ctx: Context, instance: Optional[str] = None):
         """Get the server IP"""
+        server = await self.get_instance(ctx, instance)
+        if server is None:
+            return
+        msg = f'{self.label(server)}The server IP is: `{server.ip}`'
+        if ctx.interaction is not None:
+            await ctx.send(msg, ephemeral=True)
+            return
         try:
-            await ctx.author.send(f'The server IP is: `{SERVER_IP}`')
+            await ctx.author.send(msg)
         except discord.Forbidden:
             await ctx.reply('I cannot DM you. Please enable DMs from server members to receive the server IP.')
         else:
@@ -172,84 +283,108 @@ class Server(commands.Cog):
                 await ctx.reply('I have sent you the server IP via DM.')
             await ctx.tick(True)
 
-    @commands.command(name='uptime')
-    async def server_uptime(self, ctx: Context):
+    @commands.hybrid_command(name='uptime')
+    async def server_uptime(self, ctx: Context, instance: Optional[str] = None):
         """Check server uptime"""
-        if not self.bot.server_status:
-            await ctx.reply('The server is currently offline')
+        server = await self.get_instance(ctx, instance)
+        if server is None:
+            return
+        label = self.label(server)
+        if not server.online:
+            await ctx.reply(f'{label}The server is currently offline')
             return
 
-        dt = self.bot.server_start_time
-        await ctx.reply(f'The server was last started at {discord.utils.format_dt(dt)} ({discord.utils.format_dt(dt, "R")})')
-
-    @commands.command(name='list')
-    @commands.max_concurrency(1, wait=True)
-    async def list_players(self, ctx: Context):
+        dt = server.start_time
+        msg = f'{label}The server was last started at {discord.utils.format_dt(dt)} ({discord.utils.format_dt(dt, "R")})'
+        status = await server.probe_status()
+        if status is not None:
+            msg += f'\nRunning {status["version"]} with {status["online"]}/{status["max"]} players online'
+            if status['motd']:
+                msg += f': {status["motd"]}'
+        elif server.loading:
+            msg += '\nIt is still loading'
+        await ctx.reply(msg)
+
+    @commands.hybrid_command(name='list')
+    async def list_players(self, ctx: Context, instance: Optional[str] = None):
         """List online players"""
-        if not self.bot.server_status:
-            await ctx.reply('The server is currently offline')
+        server = await self.get_instance(ctx, instance)
+        if server is None:
+            return
+        label = self.label(server)
+        if not server.online:
+            await ctx.reply(f'{label}The server is currently offline')
             return
 
-        async with ctx.typing(), RCONClient('localhost', RCON_PORT, RCON_PASS) as rcon:
-            resp = await rcon.send('list')
-            current_online = parse_list_resp(resp)
+        async with ctx.typing():
+            current_online = await server.players.get()
             if not current_online:
-                await ctx.reply('Unable to get player list. Please try again later.', mention_author=False)
+                await ctx.reply(f'{label}Unable to get player list. Please try again later.', mention_author=False)
                 await ctx.tick(False)
                 return
 
             if current_online['count'] == '0':
-                await ctx.reply('There are currently no players online.', mention_author=False)
+                await ctx.reply(f'{label}There are currently no players online.', mention_author=False)
             else:
                 if current_online['count'] == '1':
-                    await ctx.reply(f'There is currently {current_online["count"]} player online:\n'
+                    await ctx.reply(f'{label}There is currently {current_online["count"]} player online:\n'
                                     f'{current_online["players"]}', mention_author=False)
                 else:
-                    await ctx.reply(f'There are currently {current_online["count"]} players online:\n'
+                    await ctx.reply(f'{label}There are currently {current_online["count"]} players online:\n'
                                     f'{current_online["players"]}', mention_author=False)
             await ctx.tick(True)
 
-    @commands.command(name='stop')
+    @commands.hybrid_command(name='stop')
     @commands.dynamic_cooldown(cooldown_with_bypass, type=commands.BucketType.user)
-    @commands.max_concurrency(1, wait=True)
-    async def stop_server(self, ctx: Context):
+    async def stop_server(self, ctx: Context, instance: Optional[str] = None):
         """Stop the server"""
-        if not self.bot.server_status:
-            await ctx.reply('The server is currently offline')
+        server = await self.get_instance(ctx, instance)
+        if server is None:
+            return
+        label = self.label(server)
+        if server.state == STOPPING:
+            await ctx.reply(f'{label}The server is already shutting down.', mention_author=False)
+            return
+        if not server.online:
+            await ctx.reply(f'{label}The server is currently offline')
             return
 
-        async with ctx.typing(), RCONClient('localhost', RCON_PORT, RCON_PASS) as rcon:
-            list_resp = await rcon.send('list')
-            current_online = parse_list_resp(list_resp)
+        async with ctx.typing():
+            current_online = await server.players.get()
             if not current_online:
-                await ctx.reply('Unable to get player list. Please try again later.', mention_author=False)
+                await ctx.reply(f'{label}Unable to get player list. Please try again later.', mention_author=False)
                 return
 
             if int(current_online['count']) > 0:
                 if current_online['count'] == '1':
-                    await ctx.reply(f'There is currently {current_online["count"]} player online.\n'
+                    await ctx.reply(f'{label}There is currently {current_online["count"]} player online.\n'
                                     f'Please wait for them to leave before stopping the server.', mention_author=False)
                 else:
-                    await ctx.reply(f'There are currently {current_online["count"]} players online.\n'
+                    await ctx.reply(f'{label}There are currently {current_online["count"]} players online.\n'
                                     f'Please wait for them to leave before stopping the server.', mention_author=False)
                 await ctx.tick(False)
                 return
 
-            if not await ctx.confirm_prompt('Shutdown server?'):
-                await ctx.tick(False)
-                return
-
-            await rcon.send('stop')
+        if server.prompt_by is not None:
+            await ctx.reply(f'{label}{server.prompt_by} is already confirming a shutdown.', mention_author=False)
+            return
+        server.prompt_by = str(ctx.author)
+        try:
+            confirmed = await ctx.confirm_prompt(f'{label}Shutdown server?')
+        finally:
+            server.prompt_by = None
+        if not confirmed:
+            await ctx.tick(False)
+            return
 
-        logging.info(f'Stopping server... | {ctx.author}')
-        await ctx.reply('Shutting down server...', mention_author=False)
+        async with ctx.typing():
+            stopping = await server.request_stop(str(ctx.author))
+        if not stopping:
+            await ctx.reply(f'{label}The server is {server.state} already.', mention_author=False)
+            return
+        await ctx.reply(f'{label}Shutting down server...', mention_author=False)
         await ctx.tick(True)
-        async with self._checker_lock:
-            await asyncio.sleep(10)
-        await self.check_server_status()
 
 
 async def setup(bot: Bot):
-    if not hasattr(bot, 'server_status'):
-        bot.server_status = False
     await bot.add_cog(Server(bot))
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+import statistics
+from typing import List, Optional, TYPE_CHECKING
+
+import discord
+from discord.ext import commands
+
+import config
+from utils.startup import compare, profile_file
+from config import SERVER_DIR
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+# In the server's logs folder: debug.log has millisecond timestamps and far more mod lines, latest.log is the fallback
+STARTUP_LOGS = ('debug.log', 'latest.log')
+# Number of past startup profiles to keep
+STARTUP_HISTORY: int = getattr(config, 'STARTUP_HISTORY', 20)
+# Mods kept per profile
+STARTUP_MODS = 100
+
+
+def _fmt_delta(delta: Optional[float]) -> str:
+    return f'{delta:+.1f}s' if delta is not None else 'new'
+
+
+class Startup(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._task: Optional[asyncio.Task] = None
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    @property
+    def history(self) -> List[dict]:
+        return self.bot.state.get('startup_profiles', [])
+
+    def expected_duration(self) -> Optional[float]:
+        """Median load time of the last few starts"""
+        totals = [p['total'] for p in self.history[-3:] if p['complete']]
+        return statistics.median(totals) if totals else None
+
+    @commands.Cog.listener()
+    async def on_server_ready(self, time: str):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.record_profile())
+
+    async def record_profile(self):
+        started = self.bot.server_start_time
+        server = self.server
+        log_dir = os.path.join(server.directory if server is not None else SERVER_DIR, 'logs')
+        for path in (os.path.join(log_dir, name) for name in STARTUP_LOGS):
+            if not os.path.isfile(path):
+                continue
+            if started is not None and os.path.getmtime(path) < started.timestamp():
+                # Left over from an earlier start, e.g. debug logging was turned off since
+                continue
+            profile = await asyncio.to_thread(profile_file, path)
+            if profile['complete']:
+                break
+        else:
+            logging.warning('Could not find a complete server startup in the logs')
+            return
+
+        profile['mods'] = dict(list(profile['mods'].items())[:STARTUP_MODS])
+        profile['time'] = discord.utils.utcnow().isoformat()
+        profile['source'] = os.path.basename(path)
+        self.bot.state.set('startup_profiles', (self.history + [profile])[-STARTUP_HISTORY:])
+        logging.info(f'Server startup took {profile["total"]:.1f}s ({profile["source"]}), '
+                     + ', '.join(f'{k} {v:.1f}s' for k, v in profile['phases'].items()))
+
+    @commands.command(name='startprofile')
+    async def start_profile(self, ctx: Context, count: int = 10):
+        """Show where the last server start spent its time"""
+        count = min(count, 30)
+        history = self.history
+        if not history:
+            return await ctx.reply('No server start has been profiled yet', mention_author=False)
+        current = history[-1]
+        previous = history[-2] if len(history) > 1 else None
+
+        lines = [f'{"Phase":<28} {"time":>8} {"change":>8}']
+        for name, seconds, delta in compare(current, previous, 'phases', len(current['phases'])):
+            lines.append(f'{name[:28]:<28} {seconds:>7.1f}s {_fmt_delta(delta):>8}')
+        lines.append('')
+        lines.append(f'{"Slowest mods":<28} {"time":>8} {"change":>8}')
+        for name, seconds, delta in compare(current, previous, 'mods', count):
+            lines.append(f'{name[:28]:<28} {seconds:>7.1f}s {_fmt_delta(delta):>8}')
+
+        total = f'Last start took {current["total"]:.1f}s'
+        if previous is not None:
+            total += f' ({current["total"] - previous["total"]:+.1f}s since the start before)'
+        dt = discord.utils.format_dt(discord.utils.parse_time(current['time']), 'R')
+        await ctx.reply(f'{total}, {dt} from `{current["source"]}`\n```\n' + '\n'.join(lines) + '```',
+                        mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Startup(bot))
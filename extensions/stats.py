@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import math
+import time
+import logging
+from typing import Optional, TYPE_CHECKING
+
+import psutil
+from discord.ext import commands, tasks
+
+import config
+from utils.common import TPS_COMMAND, fmt_bytes, query_tps
+from utils.rcon import RCON_ERRORS
+from utils.telemetry import NAN, Telemetry, sparkline, summarize
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+STATS_INTERVAL: float = getattr(config, 'STATS_INTERVAL', 5.0)
+# How many seconds of samples to keep
+STATS_HISTORY: int = getattr(config, 'STATS_HISTORY', 60 * 60)
+
+
+class Stats(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.telemetry: Telemetry = Telemetry(int(STATS_HISTORY / STATS_INTERVAL))
+        self._last_io: Optional[tuple] = None
+        self._sample_time: float = 0.0
+        self._samples: int = 0
+        self.sample_loop.start()
+
+    async def cog_unload(self):
+        self.sample_loop.cancel()
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    def sample_process(self, process: psutil.Process) -> dict:
+        sample = {}
+        try:
+            with process.oneshot():
+                sample['cpu'] = process.cpu_percent()
+                sample['rss'] = process.memory_info().rss
+                sample['threads'] = process.num_threads()
+                try:
+                    io = process.io_counters()
+                except (AttributeError, psutil.AccessDenied):
+                    io = None
+        except psutil.Error:
+            return sample
+
+        now = time.monotonic()
+        if io is not None:
+            if self._last_io is not None and self._last_io[0] == process.pid:
+                _, last_time, last_read, last_write = self._last_io
+                elapsed = now - last_time
+                sample['read_rate'] = (io.read_bytes - last_read) / elapsed
+                sample['write_rate'] = (io.write_bytes - last_write) / elapsed
+            self._last_io = (process.pid, now, io.read_bytes, io.write_bytes)
+        return sample
+
+    async def sample_tps(self, server: ServerInstance) -> dict:
+        try:
+            tps, mspt = await query_tps(server.rcon, timeout=STATS_INTERVAL)
+        except RCON_ERRORS:
+            return {}
+        return {'tps': tps, 'mspt': mspt}
+
+    @tasks.loop(seconds=STATS_INTERVAL)
+    async def sample_loop(self):
+        server = self.server
+        if server is None or not self.bot.server_status:
+            return
+
+        start = time.perf_counter()
+        # Only sample the process the tracker already knows about, never trigger a scan from here
+        process = server.tracker.process
+        sample = self.sample_process(process) if process is not None else {}
+        cost = time.perf_counter() - start
+        if TPS_COMMAND:
+            sample.update(await self.sample_tps(server))
+        self._sample_time += cost
+        self._samples += 1
+        self.telemetry.record(time=time.time(), **sample)
+
+    @sample_loop.before_loop
+    async def before_sample(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command(name='stats')
+    async def stats(self, ctx: Context, minutes: int = 60):
+        """Show server resource usage"""
+        data = self.telemetry.since(time.time() - minutes * 60)
+        if not data['time']:
+            await ctx.reply('No samples yet. Is the server running?', mention_author=False)
+            return
+
+        rows = (
+            ('CPU', 'cpu', lambda v: f'{v:.0f}%'),
+            ('RAM', 'rss', fmt_bytes),
+            ('Threads', 'threads', lambda v: f'{v:.0f}'),
+            ('Disk read', 'read_rate', lambda v: f'{fmt_bytes(v)}/s'),
+            ('Disk write', 'write_rate', lambda v: f'{fmt_bytes(v)}/s'),
+            ('TPS', 'tps', lambda v: f'{v:.1f}'),
+            ('MSPT', 'mspt', lambda v: f'{v:.1f}'),
+        )
+        lines = []
+        for name, field, fmt in rows:
+            low, avg, high = summarize(data[field])
+            if math.isnan(avg):
+                continue
+            lines.append(f'{name:<10} min {fmt(low):>10}  avg {fmt(avg):>10}  max {fmt(high):>10}\n'
+                         f'{"":<10} {sparkline(data[field])}')
+
+        per_sample = self._sample_time / self._samples if self._samples else NAN
+        await ctx.reply(f'Last {minutes} minutes ({len(data["time"])} samples, every {STATS_INTERVAL:g}s)\n'
+                        f'```\n' + '\n'.join(lines) + '```\n'
+                        f'-# Sampling cost: {per_sample * 1000:.2f} ms per sample '
+                        f'({per_sample / STATS_INTERVAL * 100:.3f}% of a core)',
+                        mention_author=False)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Stats(bot))
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional, TYPE_CHECKING
+
+import discord
+from discord.ext import commands
+
+import config
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+    from utils.instance import ServerInstance
+
+
+logging = logging.getLogger(__name__)
+
+# Restart the server automatically after a crash
+AUTO_RESTART: bool = getattr(config, 'AUTO_RESTART', True)
+# Delay before the first restart, doubled for every further crash in the window, capped at the max (seconds)
+RESTART_BACKOFF: float = getattr(config, 'RESTART_BACKOFF', 30)
+RESTART_BACKOFF_MAX: float = getattr(config, 'RESTART_BACKOFF_MAX', 60 * 10)
+# Stop restarting after this many crashes within CRASH_LOOP_WINDOW seconds
+CRASH_LOOP_LIMIT: int = getattr(config, 'CRASH_LOOP_LIMIT', 3)
+CRASH_LOOP_WINDOW: float = getattr(config, 'CRASH_LOOP_WINDOW', 60 * 30)
+# Channel for crash summaries, the owner is sent a DM when unset
+WATCHDOG_CHANNEL_ID: Optional[int] = getattr(config, 'WATCHDOG_CHANNEL_ID', None)
+
+
+def newest_crash_report(server_dir: str, since: float) -> Optional[str]:
+    """Path of the newest crash report in the server directory written after `since` (a unix timestamp)"""
+    try:
+        entries = [e for e in os.scandir(os.path.join(server_dir, 'crash-reports')) if e.is_file() and e.name.endswith('.txt')]
+    except FileNotFoundError:
+        return None
+    entries = [e for e in entries if e.stat().st_mtime >= since]
+    if not entries:
+        return None
+    return max(entries, key=lambda e: e.stat().st_mtime).path
+
+
+def summarize_crash_report(path: str) -> str:
+    """The description and the exception line of a crash report"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        head = f.read(8192).splitlines()
+    for i, line in enumerate(head):
+        if line.startswith('Description:'):
+            rest = [l.strip() for l in head[i + 1:] if l.strip()]
+            exception = rest[0] if rest else ''
+            return f'{line[len("Description:"):].strip()}\n{exception}'[:500]
+    return ''
+
+
+class Watchdog(commands.Cog):
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.crashes: Deque[float] = deque()
+        self.restart_task: Optional[asyncio.Task] = None
+        # Set when the crash loop breaker tripped, cleared by a manual start or `watchdog reset`
+        self.tripped: bool = False
+
+    async def cog_unload(self):
+        self.cancel_restart()
+
+    async def cog_check(self, ctx: Context):
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner
+        return True
+
+    @property
+    def server(self) -> Optional[ServerInstance]:
+        cog = self.bot.get_cog('Server')
+        return cog.default if cog is not None else None  # type: ignore
+
+    def cancel_restart(self) -> bool:
+        if self.restart_task is not None and not self.restart_task.done():
+            self.restart_task.cancel()
+            return True
+        return False
+
+    def recent_crashes(self) -> int:
+        cutoff = time.monotonic() - CRASH_LOOP_WINDOW
+        while self.crashes and self.crashes[0] < cutoff:
+            self.crashes.popleft()
+        return len(self.crashes)
+
+    async def notify(self, message: str):
+        try:
+            if WATCHDOG_CHANNEL_ID is not None:
+                await self.bot.get_partial_messageable(WATCHDOG_CHANNEL_ID).send(message)
+            else:
+                owner = await self.bot.errors.owner()
+                await owner.send(message)
+        except discord.HTTPException as e:
+            logging.error(f'Failed to send crash summary | {e}')
+
+    @commands.Cog.listener()
+    async def on_server_launch(self, reason: str):
+        if reason != 'watchdog':
+            # Someone started it by hand, start counting from scratch
+            self.cancel_restart()
+            self.crashes.clear()
+            self.tripped = False
+
+    @commands.Cog.listener()
+    async def on_server_process_exit(self, returncode: Optional[int]):
+        server = self.server
+        if server is None or server.intentional_stop:
+            return
+
+        started = self.bot.server_start_time
+        report = await asyncio.to_thread(newest_crash_report, server.directory, started.timestamp() if started else time.time() - 60)
+        # Without an exit code (a process we did not launch) a shutdown that never logged `Stopping server` counts
+        unclean = returncode not in (0, None) or (returncode is None and not server.saw_stopping)
+        if report is None and not unclean:
+            logging.info('Server exited cleanly without being asked to, not restarting')
+            return
+
+        self.crashes.append(time.monotonic())
+        crashes = self.recent_crashes()
+        lines = [f'**Server crashed** {discord.utils.format_dt(discord.utils.utcnow(), "R")} (exit code {returncode})']
+        if report is not None:
+            summary = await asyncio.to_thread(summarize_crash_report, report)
+            lines.append(f'Crash report `{os.path.basename(report)}`')
+            if summary:
+                lines.append(f'```\n{summary}```')
+        logging.warning(f'Server crashed with exit code {returncode}, crash report: {report}')
+
+        if not AUTO_RESTART:
+            lines.append('Automatic restarts are disabled.')
+        elif crashes >= CRASH_LOOP_LIMIT:
+            self.tripped = True
+            lines.append(f'Crashed {crashes} times in {CRASH_LOOP_WINDOW / 60:.0f} minutes, '
+                         f'not restarting until it is started by hand.')
+        else:
+            delay = min(RESTART_BACKOFF * 2 ** (crashes - 1), RESTART_BACKOFF_MAX)
+            lines.append(f'Restarting in {delay:.0f}s (crash {crashes}/{CRASH_LOOP_LIMIT}).')
+            self.cancel_restart()
+            self.restart_task = asyncio.create_task(self.restart_after(delay))
+        await self.notify('\n'.join(lines))
+
+    async def restart_after(self, delay: float):
+        await asyncio.sleep(delay)
+        server = self.server
+        if server is None or self.tripped:
+            return
+        await server.check_status()
+        if server.launcher.running:
+            return
+        try:
+            # Only launches from offline, a start someone is confirming or already running wins
+            launched = await server.launch('watchdog')
+        except OSError as e:
+            logging.error(f'Failed to restart the server | {e}')
+            await self.notify(f'Failed to restart the server: {e}')
+            return
+        if launched:
+            logging.info('Restarted server after a crash')
+            server.wait_in_background()
+
+    @commands.group(name='watchdog', invoke_without_command=True)
+    async def watchdog(self, ctx: Context):
+        """Show the crash watchdog state"""
+        pending = self.restart_task is not None and not self.restart_task.done()
+        state = 'tripped, waiting for a manual start' if self.tripped else 'restart pending' if pending else 'armed'
+        await ctx.reply(f'Watchdog: {state if AUTO_RESTART else "auto restart disabled"}\n'
+                        f'Crashes in the last {CRASH_LOOP_WINDOW / 60:.0f} minutes: {self.recent_crashes()}',
+                        mention_author=False)
+
+    @watchdog.command(name='reset')
+    async def watchdog_reset(self, ctx: Context):
+        """Forget recent crashes and cancel a pending restart"""
+        self.cancel_restart()
+        self.crashes.clear()
+        self.tripped = False
+        await ctx.tick(True)
+
+
+async def setup(bot: Bot):
+    await bot.add_cog(Watchdog(bot))
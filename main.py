@@ -1,15 +1,42 @@
 from __future__ import annotations
 
+import os
+import logging
 import traceback
 from datetime import datetime, timedelta
 from typing import Optional
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 
+import config
+from utils.common import DATA_DIR
 from utils.context import Context
+from utils.errors import ErrorReporter
+from utils.extensions import ExtensionLoader
 from utils.help import MinimalHelp
-from config import BOT_TOKEN, WHITELIST, PREFIX, MODPACK_NAME
+from utils.state import StateStore
+from config import BOT_TOKEN, WHITELIST, PREFIX, MODPACK_NAME, OWNER_ID
+
+logging = logging.getLogger(__name__)
+
+# Let everyone on the whitelist use prefix commands in servers, this needs the message content intent.
+# When disabled they use slash commands, the owner can still use prefix commands in DMs.
+PREFIX_COMMANDS = getattr(config, 'PREFIX_COMMANDS', False)
+# Repeats of an already reported error are sent to the owner as a digest this often (seconds)
+ERROR_DIGEST_INTERVAL = getattr(config, 'ERROR_DIGEST_INTERVAL', 60 * 5)
+# Rate limits longer than this raise discord.RateLimited instead of waiting inside the request, so broadcasts
+# can pause and commands fail instead of hanging (seconds, discord.py allows 30 at least)
+MAX_RATELIMIT_TIMEOUT = getattr(config, 'MAX_RATELIMIT_TIMEOUT', 30)
+
+
+class CommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id in self.client.whitelist:  # type: ignore
+            return True
+        await interaction.response.send_message('You cannot use this', ephemeral=True)
+        return False
 
 
 class Bot(commands.Bot):
@@ -17,30 +44,57 @@ class Bot(commands.Bot):
         intents = discord.Intents(
             guilds=True,
             # members=True,
-            messages=True,
-            message_content=True,
+            dm_messages=True,
+            guild_messages=PREFIX_COMMANDS,
+            message_content=PREFIX_COMMANDS,
         )
         super().__init__(command_prefix=PREFIX,
                          intents=intents,
+                         tree_cls=CommandTree,
                          description='Hello, I am a bot that helps start the server',
                          allowed_mentions=discord.AllowedMentions.none(),
                          help_command=MinimalHelp(),
                          status=discord.Status.dnd,
-                         activity=discord.Activity(type=discord.ActivityType.listening, name="start")
+                         activity=discord.Activity(type=discord.ActivityType.listening, name="start"),
+                         max_ratelimit_timeout=MAX_RATELIMIT_TIMEOUT,
                          )
-        self.server_status: bool = False
-        self.server_start_time: Optional[datetime] = None
+        self.whitelist: frozenset = frozenset(WHITELIST)
+        self.state: StateStore = StateStore(os.path.join(DATA_DIR, 'state.db'))
+        self.errors: ErrorReporter = ErrorReporter(self, interval=ERROR_DIGEST_INTERVAL)
+        self.loader: ExtensionLoader = ExtensionLoader(
+            self,
+            # Needed to answer the first command after startup
+            eager=('extensions.server',),
+            # Loaded once connected
+            background=('extensions.metrics', 'extensions.logger', 'extensions.stats', 'extensions.admin',
+                        'extensions.backup', 'extensions.startup', 'extensions.watchdog',
+                        'extensions.idle', 'extensions.playtime', 'extensions.pregen',
+                        'extensions.jvm'),
+            # Only the owner uses these, load them the first time they are needed
+            on_demand={'jishaku': ('jishaku', 'jsk')},
+        )
 
     async def setup_hook(self) -> None:
-        extensions = (
-            'jishaku',
-            'extensions.server',
-            'extensions.admin',
-            'extensions.logger',
-        )
-        for ext in extensions:
-            await self.load_extension(ext)
-            print(f'Loaded {ext}')
+        await self.state.open()
+        self.errors.start()
+        await self.loader.start()
+
+    async def close(self) -> None:
+        await self.loader.close()
+        await self.errors.close()
+        await super().close()
+        await self.state.close()
+
+    @property
+    def server_status(self) -> bool:
+        """Whether the default server is online"""
+        server = self.get_cog('Server')
+        return server is not None and server.default.online  # type: ignore
+
+    @property
+    def server_start_time(self) -> Optional[datetime]:
+        server = self.get_cog('Server')
+        return server.default.start_time if server is not None else None  # type: ignore
 
     async def on_ready(self):
         print(f'{self.user} Ready: {datetime.now()}')
@@ -59,30 +113,29 @@ class Bot(commands.Bot):
         elif isinstance(error, commands.DisabledCommand):
             await ctx.send('This command is disabled.')
             return
+        elif isinstance(error, discord.RateLimited):
+            # Discord asked for a wait longer than MAX_RATELIMIT_TIMEOUT, not a bug
+            logging.warning(f'Rate limited for {error.retry_after:.0f}s in {ctx.command}')
+            dt = discord.utils.utcnow() + timedelta(seconds=error.retry_after)
+            try:
+                await ctx.send(f'Discord is rate limiting me, please try again {discord.utils.format_dt(dt, "R")}')
+            except discord.DiscordException:
+                # The reply may be rate limited too
+                pass
+            return
 
         # Unhandled error, so just return the traceback
-        tb = traceback.format_exception(type(error), error, error.__traceback__)
+        logging.error(f'Unhandled error in {ctx.command}', exc_info=error)
+        self.errors.report(error, ctx)
+        tb = traceback.format_exception_only(type(error), error)
         await ctx.send(f'An unexpected error has occurred! My owner has been notified.\n'
                        f'If you really want to know what went wrong:\n'
                        f'||```py\n{tb[-1][:150]}```||')
 
-        e = discord.Embed(title=f'An unhandled error occurred in {ctx.guild} | #{ctx.channel}',
-                          description=f'Invocation message: {ctx.message.content}\n'
-                                      f'[Jump to message]({ctx.message.jump_url})',
-                          color=discord.Color.red())
-        e.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
-
-        app_info = await self.application_info()
-        owner = app_info.owner
-        await owner.send(embed=e)
-        fmt = "".join(tb)
-        if len(fmt) >= 1980:
-            await owner.send(f'Traceback too long. See logs')
-        else:
-            await owner.send(f'```py\n{fmt}```')
-
     async def on_message(self, message: discord.Message):
-        if message.author.id not in WHITELIST:
+        if message.author.id not in self.whitelist:
+            return
+        if not PREFIX_COMMANDS and message.author.id != OWNER_ID:
             return
 
         if message.content.startswith(('<@1078131779543765052>', '<@!1078131779543765052>')):
@@ -94,15 +147,25 @@ class Bot(commands.Bot):
         await self.process_commands(message)
 
     async def get_context(self, message, *, cls=Context):
-        return await super().get_context(message, cls=cls)
+        ctx = await super().get_context(message, cls=cls)
+        if ctx.command is None and ctx.prefix is not None and await self.loader.resolve(ctx.invoked_with):
+            ctx = await super().get_context(message, cls=cls)
+        return ctx
 
-    async def set_online_status(self):
+    async def set_online_status(self, name: str = MODPACK_NAME):
         """Server is online, set status to online"""
         await self.change_presence(
-            activity=discord.Activity(type=discord.ActivityType.playing, name=MODPACK_NAME),
+            activity=discord.Activity(type=discord.ActivityType.playing, name=name),
             status=discord.Status.online
         )
 
+    async def set_starting_status(self, name: str = MODPACK_NAME):
+        """Server is loading, set status to idle"""
+        await self.change_presence(
+            activity=discord.Activity(type=discord.ActivityType.playing, name=f'{name} (loading)'),
+            status=discord.Status.idle
+        )
+
     async def set_offline_status(self):
         """Server is offline, set status to dnd"""
         await self.change_presence(
@@ -111,6 +174,6 @@ class Bot(commands.Bot):
         )
 
 
-bot = Bot()
-
-bot.run(BOT_TOKEN, root_logger=True)
+if __name__ == '__main__':
+    bot = Bot()
+    bot.run(BOT_TOKEN, root_logger=True)
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from utils.metrics import registry
+
+if TYPE_CHECKING:
+    from utils.rcon import RCONPool
+
+logging = logging.getLogger(__name__)
+
+# Region files are written in 4 KiB sectors, so a chunk only changes when a sector inside it does
+CHUNK_SIZE = 256 * 1024
+# Files the server keeps locked or rewrites constantly, not worth backing up
+SKIP_FILES = frozenset({'session.lock'})
+
+backup_save_off = registry.histogram('satuse_backup_save_off_seconds', 'Time world saving was turned off for a backup',
+                                     buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+backup_duration = registry.histogram('satuse_backup_seconds', 'Total time a backup took',
+                                     buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0))
+
+
+def _object_path(objects_dir: str, digest: str) -> str:
+    return os.path.join(objects_dir, digest[:2], digest[2:])
+
+
+def _store_file(path: str, objects_dir: str, chunk_size: int, level: int) -> Tuple[List[str], int]:
+    """Splits a file into chunks and stores the ones we do not have yet, runs in a worker process
+
+    Returns the chunk hashes and how many bytes were written to the store.
+    """
+    hashes = []
+    written = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest = hashlib.sha256(chunk).hexdigest()
+            hashes.append(digest)
+            obj = _object_path(objects_dir, digest)
+            if os.path.exists(obj):
+                continue
+            compressed = zlib.compress(chunk, level)
+            # Region files are mostly compressed already, keep the raw bytes when zlib does not help
+            blob = b'z' + compressed if len(compressed) < len(chunk) else b'r' + chunk
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            tmp = f'{obj}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as out:
+                out.write(blob)
+            os.replace(tmp, obj)
+            written += len(blob)
+    return hashes, written
+
+
+def _read_object(objects_dir: str, digest: str) -> bytes:
+    with open(_object_path(objects_dir, digest), 'rb') as f:
+        blob = f.read()
+    return zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+
+
+def _restore_file(objects_dir: str, chunks: List[str], target: str, mtime: int) -> None:
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        for digest in chunks:
+            f.write(_read_object(objects_dir, digest))
+    # Keep the original mtime so the next backup sees the file as unchanged
+    os.utime(target, ns=(mtime, mtime))
+
+
+class BackupRepository:
+    """Incremental, content addressed backups of a world directory
+
+    Files are split into chunks stored once under `objects/` by their SHA-256, each snapshot is a
+    manifest in `snapshots/` listing the chunks of every file. A file whose size and mtime match the
+    previous snapshot is not read at all.
+
+    While saving is off only the changed files are copied to a staging directory,
+    hashing and compressing them happens afterwards in a process pool.
+    """
+
+    def __init__(self, root: str, *, chunk_size: int = CHUNK_SIZE, workers: Optional[int] = None, level: int = 3):
+        self.root: str = root
+        self.objects_dir: str = os.path.join(root, 'objects')
+        self.snapshots_dir: str = os.path.join(root, 'snapshots')
+        self.chunk_size: int = chunk_size
+        self.workers: Optional[int] = workers
+        self.level: int = level
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def snapshots(self) -> List[str]:
+        """Snapshot names, oldest first"""
+        return sorted(name[:-5] for name in os.listdir(self.snapshots_dir) if name.endswith('.json'))
+
+    def load_manifest(self, name: str) -> dict:
+        with open(os.path.join(self.snapshots_dir, f'{name}.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        path = os.path.join(self.snapshots_dir, f'{manifest["name"]}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+    def _new_name(self) -> str:
+        name = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+        existing = set(self.snapshots())
+        candidate, n = name, 1
+        while candidate in existing:
+            candidate = f'{name}-{n}'
+            n += 1
+        return candidate
+
+    @staticmethod
+    def _snapshot(world: str, staging: str, previous: Dict[str, dict]) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """Copies files that changed since the previous snapshot, returns (changed, unchanged)"""
+        changed, unchanged = {}, {}
+        for root, _, files in os.walk(world):
+            for name in files:
+                if name in SKIP_FILES:
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, world).replace(os.sep, '/')
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                prev = previous.get(rel)
+                if prev is not None and prev['size'] == st.st_size and prev['mtime'] == st.st_mtime_ns:
+                    unchanged[rel] = prev
+                    continue
+                dest = os.path.join(staging, rel)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copyfile(path, dest)
+                changed[rel] = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+        return changed, unchanged
+
+    async def backup(self, world: str, *, rcon: Optional[RCONPool] = None) -> Optional[dict]:
+        """Takes a snapshot of `world`, returns its manifest or None if nothing changed
+
+        With `rcon` the server's autosave is turned off while changed files are copied.
+        """
+        async with self._lock:
+            start = time.perf_counter()
+            snapshots = self.snapshots()
+            previous = self.load_manifest(snapshots[-1])['files'] if snapshots else {}
+            name = self._new_name()
+            staging = os.path.join(self.root, f'staging-{name}')
+
+            try:
+                if rcon is not None:
+                    await rcon.send('save-off')
+                    save_off = time.perf_counter()
+                    try:
+                        await rcon.send('save-all flush', timeout=300)
+                        changed, unchanged = await asyncio.to_thread(self._snapshot, world, staging, previous)
+                    finally:
+                        await rcon.send('save-on')
+                        backup_save_off.observe(time.perf_counter() - save_off)
+                    save_off_time = time.perf_counter() - save_off
+                else:
+                    changed, unchanged = await asyncio.to_thread(self._snapshot, world, staging, previous)
+                    save_off_time = 0.0
+
+                if not changed and len(unchanged) == len(previous):
+                    logging.info('World has not changed since the last backup')
+                    return None
+
+                loop = asyncio.get_running_loop()
+                pool = self._get_pool()
+                rels = list(changed)
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(pool, _store_file, os.path.join(staging, rel), self.objects_dir,
+                                         self.chunk_size, self.level)
+                    for rel in rels
+                ))
+            finally:
+                await asyncio.to_thread(shutil.rmtree, staging, True)
+
+            written = 0
+            for rel, (chunks, n) in zip(rels, results):
+                changed[rel]['chunks'] = chunks
+                written += n
+            files = {**unchanged, **changed}
+            manifest = {
+                'name': name,
+                'time': datetime.now(timezone.utc).isoformat(),
+                'world': world,
+                'files': files,
+                'stats': {
+                    'files': len(files),
+                    'changed': len(changed),
+                    'size': sum(f['size'] for f in files.values()),
+                    'changed_size': sum(f['size'] for f in changed.values()),
+                    'written': written,
+                    'save_off': save_off_time,
+                    'duration': time.perf_counter() - start,
+                },
+            }
+            await asyncio.to_thread(self._write_manifest, manifest)
+            backup_duration.observe(manifest['stats']['duration'])
+            logging.info(f'Backup {name}: {len(changed)}/{len(files)} files changed, {written} bytes written, '
+                         f'saving was off for {save_off_time:.2f}s')
+            return manifest
+
+    async def restore(self, name: str, target: str) -> dict:
+        """Restores a snapshot into `target`, which must not exist yet"""
+        if os.path.exists(target):
+            raise FileExistsError(target)
+        async with self._lock:
+            manifest = await asyncio.to_thread(self.load_manifest, name)
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            staging = f'{target}.partial'
+            await asyncio.gather(*(
+                loop.run_in_executor(pool, _restore_file, self.objects_dir, entry['chunks'],
+                                     os.path.join(staging, *rel.split('/')), entry['mtime'])
+                for rel, entry in manifest['files'].items()
+            ))
+            await asyncio.to_thread(os.replace, staging, target)
+            return manifest
+
+    def _prune(self, keep_last: int, keep_daily: int) -> Tuple[List[str], int]:
+        snapshots = self.snapshots()
+        keep = set(snapshots[-keep_last:]) if keep_last > 0 else set()
+        days = {}
+        for name in reversed(snapshots):
+            # Names start with the UTC date, the newest snapshot of each day is kept
+            days.setdefault(name[:8], name)
+        keep.update(list(days.values())[:keep_daily])
+
+        removed = [name for name in snapshots if name not in keep]
+        for name in removed:
+            os.remove(os.path.join(self.snapshots_dir, f'{name}.json'))
+
+        referenced = set()
+        for name in keep:
+            for entry in self.load_manifest(name)['files'].values():
+                referenced.update(entry['chunks'])
+        deleted = 0
+        for prefix in os.listdir(self.objects_dir):
+            directory = os.path.join(self.objects_dir, prefix)
+            for rest in os.listdir(directory):
+                if prefix + rest not in referenced:
+                    os.remove(os.path.join(directory, rest))
+                    deleted += 1
+        return removed, deleted
+
+    async def prune(self, *, keep_last: int, keep_daily: int = 0) -> Tuple[List[str], int]:
+        """Deletes snapshots outside the retention policy and chunks nothing refers to anymore
+
+        Returns the removed snapshot names and the number of deleted chunks.
+        """
+        async with self._lock:
+            return await asyncio.to_thread(self._prune, keep_last, keep_daily)
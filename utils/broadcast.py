@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import discord
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.state import StateStore
+
+logging = logging.getLogger(__name__)
+
+
+def _dump_json(path: str, data) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+class BroadcastJob:
+    def __init__(self, message: str, pending: List[int], *, silent: bool = False,
+                 channel_id: Optional[int] = None, progress_message_id: Optional[int] = None):
+        self.message: str = message
+        self.pending: List[int] = pending
+        self.silent: bool = silent
+        self.channel_id: Optional[int] = channel_id
+        self.progress_message_id: Optional[int] = progress_message_id
+        self.success: List[int] = []
+        self.failed: List[int] = []
+        self.not_found: List[int] = []
+
+    @property
+    def total(self) -> int:
+        return len(self.pending) + self.done
+
+    @property
+    def done(self) -> int:
+        return len(self.success) + len(self.failed) + len(self.not_found)
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> BroadcastJob:
+        job = cls(data['message'], data['pending'], silent=data['silent'],
+                  channel_id=data['channel_id'], progress_message_id=data['progress_message_id'])
+        job.success, job.failed, job.not_found = data['success'], data['failed'], data['not_found']
+        return job
+
+    def summary(self) -> str:
+        def fmt(ids):
+            return ', '.join(f'<@{i}>' for i in ids)
+        return (f'Successfully sent to {len(self.success)} users: {fmt(self.success)}\n'
+                f'Failed to send to {len(self.failed)} users: {fmt(self.failed)}\n'
+                f'Not found {len(self.not_found)} users: {", ".join(map(str, self.not_found))}\n'
+                f'Total: {self.done} users')
+
+
+class Broadcaster:
+    """Sends a DM to many users in the background
+
+    DM channel IDs are kept in the state store, so repeat broadcasts skip both `fetch_user` and opening the DM.
+    Sends run with bounded concurrency. Short rate limits are waited out inside discord.py, one longer than the
+    bot's `max_ratelimit_timeout` raises instead and every worker pauses for its `retry_after`.
+    The job is saved after every user, so it resumes after a restart.
+    """
+
+    def __init__(self, bot: Bot, data_dir: str, store: StateStore, *,
+                 concurrency: int = 3, progress_interval: float = 5.0):
+        self.bot: Bot = bot
+        self.store: StateStore = store
+        self.concurrency: int = concurrency
+        self.progress_interval: float = progress_interval
+        self.job_path: str = os.path.join(data_dir, 'broadcast.json')
+        os.makedirs(data_dir, exist_ok=True)
+        self.dm_channels: Dict[int, int] = {int(k): v for k, v in store.get('dm_channels', {}).items()}
+        self.job: Optional[BroadcastJob] = None
+        self.task: Optional[asyncio.Task] = None
+        self._resume_at: float = 0.0
+        self._save_lock: asyncio.Lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def load_unfinished(self) -> Optional[BroadcastJob]:
+        data = _load_json(self.job_path, None)
+        if not data or not data['pending']:
+            return None
+        return BroadcastJob.from_dict(data)
+
+    def start(self, job: BroadcastJob) -> asyncio.Task:
+        if self.running:
+            raise RuntimeError('A broadcast is already running')
+        self.job = job
+        self.task = asyncio.create_task(self._run(job))
+        return self.task
+
+    async def _save(self) -> None:
+        async with self._save_lock:
+            job = self.job.to_dict() if self.job is not None else None
+            self.store.set('dm_channels', {str(k): v for k, v in self.dm_channels.items()})
+            await asyncio.to_thread(_dump_json, self.job_path, job)
+
+    async def _get_channel(self, user_id: int) -> discord.abc.Messageable:
+        channel_id = self.dm_channels.get(user_id)
+        if channel_id is not None:
+            return self.bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+        user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+        channel = user.dm_channel or await user.create_dm()
+        self.dm_channels[user_id] = channel.id
+        return channel
+
+    async def _pace(self) -> None:
+        delay = self._resume_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, job: BroadcastJob, user_id: int) -> None:
+        kwargs = {'silent': True} if job.silent else {}
+        for _ in range(3):
+            await self._pace()
+            try:
+                channel = await self._get_channel(user_id)
+                await channel.send(job.message, **kwargs)
+            except discord.RateLimited as e:
+                logging.warning(f'Rate limited while broadcasting, pausing for {e.retry_after:.1f}s')
+                self._resume_at = asyncio.get_running_loop().time() + e.retry_after
+                continue
+            except discord.NotFound:
+                if self.dm_channels.pop(user_id, None) is not None:
+                    # Stale DM channel, look the user up again
+                    continue
+                logging.info(f'User {user_id} not found')
+                job.not_found.append(user_id)
+            except discord.HTTPException as e:
+                logging.error(f'Failed to send broadcast to {user_id} | {e}')
+                job.failed.append(user_id)
+            else:
+                logging.info(f'Sent broadcast to {user_id}')
+                job.success.append(user_id)
+            return
+        job.failed.append(user_id)
+
+    async def _report_progress(self, job: BroadcastJob) -> None:
+        if job.channel_id is None or job.progress_message_id is None:
+            return
+        channel = self.bot.get_partial_messageable(job.channel_id)
+        reported = -1
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if job.done == reported:
+                continue
+            reported = job.done
+            try:
+                await channel.get_partial_message(job.progress_message_id).edit(
+                    content=f'Sending broadcast... {job.done}/{job.total}')
+            except discord.HTTPException:
+                pass
+
+    async def _run(self, job: BroadcastJob) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in job.pending:
+            queue.put_nowait(user_id)
+
+        async def worker():
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                await self._send(job, user_id)
+                job.pending.remove(user_id)
+                await self._save()
+
+        progress = asyncio.create_task(self._report_progress(job))
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            progress.cancel()
+
+        if job.channel_id is not None:
+            channel = self.bot.get_partial_messageable(job.channel_id)
+            try:
+                if job.progress_message_id is not None:
+                    await channel.get_partial_message(job.progress_message_id).edit(
+                        content=f'Broadcast finished {job.done}/{job.total}')
+                await channel.send(job.summary())
+            except discord.HTTPException as e:
+                logging.error(f'Failed to send broadcast summary | {e}')
+        self.job = None
+        await self._save()
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
 import re
-from typing import Optional, TYPE_CHECKING
+from typing import Optional, Tuple, TYPE_CHECKING
 
 import discord
 from discord.ext import commands
 
+import config
 from config import OWNER_ID
+from utils.telemetry import parse_tps
 
 if TYPE_CHECKING:
     from utils.context import Context
+    from utils.rcon import RCONPool
+
+# Where the bot keeps its own state
+DATA_DIR = getattr(config, 'DATA_DIR', 'data')
+# Command used to get TPS/MSPT over RCON, None to disable (`tps` on Paper, `neoforge tps` on NeoForge)
+TPS_COMMAND: Optional[str] = getattr(config, 'TPS_COMMAND', 'forge tps')
 
 list_re = re.compile(r'There are (?P<count>\d+) of a max of (?P<max>\d+) players online: (?P<players>.*)')
 
@@ -21,6 +29,27 @@ def parse_list_resp(resp: str) -> dict:
     return {}
 
 
+async def query_tps(rcon: RCONPool, *, timeout: Optional[float] = None) -> Tuple[float, float]:
+    """Sends TPS_COMMAND and parses the answer into (tps, mspt), missing values are NaN"""
+    return parse_tps(await rcon.send(TPS_COMMAND, timeout=timeout))
+
+
+def fmt_bytes(n: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024:
+            return f'{n:.1f} {unit}'
+        n /= 1024
+    return f'{n:.1f} TB'
+
+
+def fmt_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}h {minutes}m'
+    return f'{minutes}m'
+
+
 def cooldown_with_bypass(ctx: Context) -> Optional[commands.Cooldown]:
     if ctx.author.id == OWNER_ID:
         return None
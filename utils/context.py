@@ -12,6 +12,10 @@ class Context(commands.Context):
                   None:  '<:greyTick:602811779810328596>'}
         emoji = emojis.get(value, '<:redTick:602811779474522113>')
         if reaction:
+            if self.interaction is not None:
+                # There is no message to react to for slash commands
+                await self.send(emoji, ephemeral=True)
+                return
             try:
                 await self.message.add_reaction(emoji)
             except discord.HTTPException:
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import traceback
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import discord
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+
+logging = logging.getLogger(__name__)
+
+
+def fingerprint(error: BaseException) -> str:
+    """Identifies an error by its type and the frames it went through, ignoring the message"""
+    frames = traceback.extract_tb(error.__traceback__)
+    key = '|'.join(f'{f.filename}:{f.name}:{f.lineno}' for f in frames)
+    return hashlib.sha1(f'{type(error).__qualname__}|{key}'.encode()).hexdigest()[:12]
+
+
+class _Entry:
+    __slots__ = ('title', 'count', 'last_message')
+
+    def __init__(self, title: str, message: str):
+        self.title: str = title
+        # Repeats since the last report
+        self.count: int = 0
+        self.last_message: str = message
+
+
+class ErrorReporter:
+    """Reports unhandled errors to the owner without flooding their DMs
+
+    The first occurrence of an error is sent right away, repeats of the same fingerprint
+    are counted and sent as a single digest every `interval` seconds.
+    All sending happens in a background task, `report` itself never waits.
+    """
+
+    def __init__(self, bot: Bot, *, interval: float = 300.0, max_queue: int = 50):
+        self.bot: Bot = bot
+        self.interval: float = interval
+        self._owner: Optional[discord.User] = None
+        self._seen: Dict[str, _Entry] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def window(self) -> str:
+        return f'{self.interval:.0f} s' if self.interval < 120 else f'{self.interval / 60:.0f} min'
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()), asyncio.create_task(self._digest_loop())]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    async def owner(self) -> discord.User:
+        if self._owner is None:
+            app_info = await self.bot.application_info()
+            self._owner = app_info.owner
+        return self._owner
+
+    def report(self, error: BaseException, ctx: Optional[Context] = None) -> None:
+        key = fingerprint(error)
+        message = str(error)[:200]
+        entry = self._seen.get(key)
+        if entry is not None:
+            entry.count += 1
+            entry.last_message = message
+            return
+
+        self._seen[key] = _Entry(type(error).__name__, message)
+        try:
+            self._queue.put_nowait((error, ctx))
+        except asyncio.QueueFull:
+            logging.warning(f'Error report queue is full, dropping {type(error).__name__}')
+
+    async def _worker(self) -> None:
+        while True:
+            error, ctx = await self._queue.get()
+            try:
+                await self._send_report(error, ctx)
+            except discord.HTTPException as e:
+                logging.error(f'Failed to report error to owner | {e}')
+            except Exception:
+                logging.exception('Error while reporting an error')
+
+    async def _send_report(self, error: BaseException, ctx: Optional[Context]) -> None:
+        owner = await self.owner()
+        tb = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+
+        if ctx is not None:
+            if ctx.interaction is not None:
+                invocation = f'Invocation: /{ctx.command}'
+            else:
+                invocation = (f'Invocation message: {ctx.message.content}\n'
+                              f'[Jump to message]({ctx.message.jump_url})')
+            e = discord.Embed(title=f'An unhandled error occurred in {ctx.guild} | #{ctx.channel}',
+                              description=invocation,
+                              color=discord.Color.red())
+            e.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+        else:
+            e = discord.Embed(title='An unhandled error occurred', color=discord.Color.red())
+        e.set_footer(text=f'Fingerprint {fingerprint(error)}, repeats are sent every {self.window}')
+
+        if len(tb) >= 1980:
+            await owner.send(embed=e, file=discord.File(io.BytesIO(tb.encode()), filename='traceback.txt'))
+        else:
+            await owner.send(f'```py\n{tb}```', embed=e)
+
+    def _digest(self) -> Optional[str]:
+        lines = []
+        for key, entry in list(self._seen.items()):
+            if entry.count == 0:
+                # Quiet for a whole interval, report it in full next time it happens
+                del self._seen[key]
+                continue
+            lines.append(f'`{entry.title}` ×{entry.count} in {self.window} ({key}): {entry.last_message}')
+            entry.count = 0
+        if not lines:
+            return None
+        return '\n'.join(['Repeated errors:', *lines])[:2000]
+
+    async def _digest_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            digest = self._digest()
+            if digest is None:
+                continue
+            try:
+                owner = await self.owner()
+                await owner.send(digest)
+            except discord.HTTPException as e:
+                logging.error(f'Failed to send error digest | {e}')
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import psutil
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from main import Bot
+
+logging = logging.getLogger(__name__)
+
+
+class ExtensionLoader:
+    """Loads extensions in stages and records what each one costs
+
+    Eager extensions load in `setup_hook`, background ones once the bot has connected and
+    on-demand ones the first time one of their commands is used.
+    Per extension the load time and the change in resident memory are kept in `stats`.
+    """
+
+    def __init__(self, bot: Bot, *, eager: Iterable[str], background: Iterable[str] = (),
+                 on_demand: Optional[Dict[str, Iterable[str]]] = None):
+        self.bot: Bot = bot
+        self.eager: Tuple[str, ...] = tuple(eager)
+        self.background: Tuple[str, ...] = tuple(background)
+        # extension -> command names that trigger loading it
+        self.on_demand: Dict[str, Tuple[str, ...]] = {ext: tuple(names) for ext, names in (on_demand or {}).items()}
+        self._triggers: Dict[str, str] = {name: ext for ext, names in self.on_demand.items() for name in names}
+        # extension -> (seconds, rss delta in bytes)
+        self.stats: Dict[str, Tuple[float, int]] = {}
+        self.failed: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self._process: psutil.Process = psutil.Process()
+
+    @property
+    def pending(self) -> bool:
+        """Whether background extensions are still loading"""
+        return self._task is not None and not self._task.done()
+
+    async def load(self, name: str) -> bool:
+        async with self._lock:
+            if name in self.bot.extensions:
+                return True
+            rss = self._process.memory_info().rss
+            start = time.perf_counter()
+            try:
+                await self.bot.load_extension(name)
+            except commands.ExtensionError as e:
+                logging.exception(f'Failed to load {name}', exc_info=e)
+                self.failed.append(name)
+                return False
+            elapsed = time.perf_counter() - start
+            delta = self._process.memory_info().rss - rss
+            self.stats[name] = (elapsed, delta)
+            logging.info(f'Loaded {name} in {elapsed * 1000:.0f} ms (+{delta / 2 ** 20:.1f} MiB)')
+            return True
+
+    async def start(self) -> None:
+        """Loads the eager extensions and schedules the background ones, call from `setup_hook`"""
+        for name in self.eager:
+            await self.load(name)
+        if self.background:
+            self._task = asyncio.create_task(self._load_background())
+
+    async def _load_background(self) -> None:
+        await self.bot.wait_until_ready()
+        for name in self.background:
+            await self.load(name)
+            # Imports block the loop, let queued events through between extensions
+            await asyncio.sleep(0)
+
+    async def resolve(self, invoked_with: Optional[str]) -> bool:
+        """Loads whatever could provide a command that was not found, returns whether anything was loaded"""
+        if invoked_with is None:
+            return False
+        loaded = False
+        if self.pending:
+            await asyncio.shield(self._task)
+            loaded = True
+        ext = self._triggers.get(invoked_with)
+        if ext is not None and ext not in self.bot.extensions:
+            loaded = await self.load(ext) or loaded
+        return loaded
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import bisect
+import math
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from utils.telemetry import NAN, RingBuffer
+
+# Where the JVM writes the GC log, relative to the server directory it is launched in
+GC_LOG_PATH = 'logs/gc.log'
+# One tick, a pause longer than this is a visible stutter
+TICK_MS = 50.0
+# TPS samples below this count as a drop
+TPS_DROP = 18.0
+
+# `[2024-05-01T12:34:56.789+0000][12.345s][info ][gc          ] GC(3) ...`, the level and tags are padded
+_line_re = re.compile(r'^\[(?P<time>[^\]]+)\]\[(?P<uptime>[\d.,]+)s\]\[\w+\s*\]\[(?P<tags>[\w,+]+)\s*\] (?P<message>.*)$')
+# `GC(3) Pause Young (Normal) (G1 Evacuation Pause) 1024M->256M(4096M) 12.345ms`, Shenandoah pauses have no heap sizes
+_pause_re = re.compile(r'GC\(\d+\) (?P<kind>Pause .*?) (?:(?P<before>\d+)(?P<before_unit>[KMG])->(?P<after>\d+)'
+                       r'(?P<after_unit>[KMG])\((?P<capacity>\d+)(?P<capacity_unit>[KMG])\) )?(?P<ms>[\d.,]+)ms$')
+_max_heap_re = re.compile(r'Heap Max Capacity: (?P<size>\d+)(?P<unit>[KMG])')
+_UNITS = {'K': 1 / 1024, 'M': 1.0, 'G': 1024.0}
+
+
+def gc_log_options(path: str = GC_LOG_PATH, *, filecount: int = 5, filesize: str = '20M') -> str:
+    """JVM flags for unified GC logging (Java 9+) with the decorations `GCLogAnalyzer` reads
+
+    Only the `gc` and `gc+init` tags are logged, about one line per collection.
+    """
+    return f'-Xlog:gc,gc+init:file={path}:time,uptime,level,tags:filecount={filecount},filesize={filesize}'
+
+
+def _mb(value: str, unit: str) -> float:
+    return int(value) * _UNITS[unit]
+
+
+def _number(value: str) -> float:
+    return float(value.replace(',', '.'))
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return NAN
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class GCLogAnalyzer:
+    """Running GC statistics, fed one log line at a time as the log grows
+
+    Everything is a running total or a fixed-size ring buffer, so following a log for days
+    costs the same per line as the first minute. A JVM restart (uptime going back) starts over.
+    Pauses are understood for G1, Parallel, Serial and Shenandoah, ZGC has no pauses in the `gc` tag.
+    """
+
+    def __init__(self, history: int = 4096):
+        self.history: int = history
+        self.lines: int = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.collector: Optional[str] = None
+        # Sizes are in MB
+        self.max_heap: Optional[float] = None
+        self.capacity: float = NAN
+        self.pauses: RingBuffer = RingBuffer(self.history)
+        self.pause_times: RingBuffer = RingBuffer(self.history)
+        self.heap_after: RingBuffer = RingBuffer(self.history)
+        self.heap_after_full: RingBuffer = RingBuffer(64)
+        self.count: int = 0
+        self.full: int = 0
+        # Full collections someone asked for with System.gc(), not a sign of a small heap
+        self.system_gc: int = 0
+        self.total_pause: float = 0.0
+        self.allocated: float = 0.0
+        self.start_uptime: float = NAN
+        self.uptime: float = NAN
+        # Wall clock time of uptime 0, so only the first line of a run needs its timestamp parsed
+        self._epoch: float = NAN
+        self.max_pause: float = 0.0
+        self._last_after: Optional[float] = None
+        self._alloc_start: float = NAN
+        self._alloc_end: float = NAN
+
+    def feed(self, line: str) -> bool:
+        """Takes one log line, returns whether it was a pause"""
+        self.lines += 1
+        # Most lines are skipped with a substring check, only the ones we want see a regex
+        if 'Pause' not in line and 'Using ' not in line and 'Heap Max' not in line:
+            return False
+        match = _line_re.match(line)
+        if match is None:
+            return False
+        uptime = _number(match['uptime'])
+        if uptime < self.uptime:
+            self.reset()
+        if self.start_uptime != self.start_uptime:
+            self.start_uptime = uptime
+            try:
+                self._epoch = datetime.fromisoformat(match['time']).timestamp() - uptime
+            except ValueError:
+                pass
+        self.uptime = uptime
+
+        message = match['message']
+        if message.startswith('Using '):
+            self.collector = message[6:].strip()
+            return False
+        if 'Heap Max' in message:
+            heap = _max_heap_re.search(message)
+            if heap is not None:
+                self.max_heap = _mb(heap['size'], heap['unit'])
+            return False
+        pause = _pause_re.search(message)
+        if pause is None:
+            return False
+        self.record(pause, uptime)
+        return True
+
+    def record(self, pause: re.Match, uptime: float) -> None:
+        kind, before, before_unit, after, after_unit, capacity, capacity_unit, ms = pause.groups()
+        ms = float(ms.replace(',', '.'))
+        self.count += 1
+        self.total_pause += ms
+        if ms > self.max_pause:
+            self.max_pause = ms
+        self.pauses.append(ms)
+        self.pause_times.append(self._epoch + uptime)
+        full = 'Pause Full' in kind
+        if full:
+            if 'System.gc()' in kind:
+                self.system_gc += 1
+            else:
+                self.full += 1
+        if before is None:
+            return
+        before = int(before) * _UNITS[before_unit]
+        after = int(after) * _UNITS[after_unit]
+        self.capacity = int(capacity) * _UNITS[capacity_unit]
+        # Whatever the heap grew by since the last collection was allocated in between
+        if self._last_after is None:
+            self._alloc_start = uptime
+        elif before >= self._last_after:
+            self.allocated += before - self._last_after
+        self._alloc_end = uptime
+        self._last_after = after
+        self.heap_after.append(after)
+        if full:
+            self.heap_after_full.append(after)
+
+    def summary(self) -> dict:
+        pauses = self.pauses.values()
+        heap_after = self.heap_after.values()
+        after_full = self.heap_after_full.values()
+        elapsed = self.uptime - self.start_uptime
+        alloc_elapsed = self._alloc_end - self._alloc_start
+        if after_full:
+            # What is left after a full collection is the live data
+            live = percentile(after_full, 0.5)
+        elif heap_after:
+            # Without one, the emptiest the heap got is the closest we have
+            live = min(heap_after[-256:])
+        else:
+            live = NAN
+        return {
+            'collector': self.collector,
+            'max_heap': self.max_heap,
+            'capacity': self.capacity,
+            'uptime': elapsed,
+            'count': self.count,
+            'full': self.full,
+            'system_gc': self.system_gc,
+            'p50': percentile(pauses, 0.5),
+            'p95': percentile(pauses, 0.95),
+            'p99': percentile(pauses, 0.99),
+            'max': self.max_pause if self.count else NAN,
+            'overhead': self.total_pause / 1000 / elapsed if elapsed > 0 else NAN,
+            'alloc_rate': self.allocated / alloc_elapsed if alloc_elapsed > 0 else NAN,
+            'heap_after_p50': percentile(heap_after, 0.5),
+            'heap_after_max': max(heap_after, default=NAN),
+            'live': live,
+        }
+
+
+def _pearson(xs: Sequence[float], ys: Sequence[float]) -> float:
+    n = len(xs)
+    if n < 3:
+        return NAN
+    mx, my = sum(xs) / n, sum(ys) / n
+    sx = math.sqrt(sum((x - mx) ** 2 for x in xs))
+    sy = math.sqrt(sum((y - my) ** 2 for y in ys))
+    if not sx or not sy:
+        return NAN
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / (sx * sy)
+
+
+def tps_correlation(pause_times: Sequence[float], pauses: Sequence[float],
+                    sample_times: Sequence[float], tps: Sequence[float], *, drop: float = TPS_DROP) -> Dict[str, float]:
+    """Lines GC pauses up with TPS samples, each sample gets the pause time since the sample before it
+
+    Returns the number of samples, how many were TPS drops, how many of those had a pause longer than
+    a tick in their window, and the correlation between pause time and TPS (negative when GC costs ticks).
+    """
+    gc_ms: List[float] = []
+    values: List[float] = []
+    drops = drops_with_gc = 0
+    # Pauses are logged in order, so each window is a slice found by bisecting
+    cumulative = [0.0]
+    for ms in pauses:
+        cumulative.append(cumulative[-1] + ms)
+    for prev, t, value in zip(sample_times, sample_times[1:], tps[1:]):
+        if value != value:
+            continue
+        lo, hi = bisect.bisect_right(pause_times, prev), bisect.bisect_right(pause_times, t)
+        paused = cumulative[hi] - cumulative[lo]
+        gc_ms.append(paused)
+        values.append(value)
+        if value < drop:
+            drops += 1
+            if any(pauses[i] >= TICK_MS for i in range(lo, hi)):
+                drops_with_gc += 1
+    return {'samples': len(values), 'drops': drops, 'drops_with_gc': drops_with_gc, 'r': _pearson(gc_ms, values)}
+
+
+def heap_advice(summary: dict) -> List[str]:
+    """Rules of thumb: the heap should hold 3-4x the live data, no full collections, pauses under a tick"""
+    live = summary['live']
+    if summary['count'] == 0 or live != live:
+        return ['Not enough GC data yet']
+    advice = []
+    heap = summary['max_heap'] or summary['capacity']
+    suggested = max(2, math.ceil(live * 3 / 1024))
+    if summary['full']:
+        full = summary['full']
+        advice.append(f'{full} full collection{"s" if full != 1 else ""}: the heap ran out of room, '
+                      f'raise -Xmx to about {suggested}G')
+    elif heap < live * 2:
+        advice.append(f'The live data ({live / 1024:.1f} GB) fills over half the heap, raise -Xmx to about {suggested}G')
+    elif heap > live * 6 and summary['p99'] < TICK_MS:
+        advice.append(f'The heap is over 6x the live data ({live / 1024:.1f} GB), '
+                      f'-Xmx{max(2, math.ceil(live * 4 / 1024))}G would free memory and still leave plenty of room')
+    if summary['p99'] >= TICK_MS:
+        advice.append(f'p99 pause of {summary["p99"]:.0f} ms is longer than a tick, players will notice: '
+                      f'lower -XX:MaxGCPauseMillis (G1) or try ZGC on Java 17+')
+    if summary['overhead'] > 0.05:
+        advice.append(f'{summary["overhead"] * 100:.1f}% of the time is spent in GC pauses, a bigger heap collects less often')
+    if summary['system_gc']:
+        system_gc = summary['system_gc']
+        advice.append(f'{system_gc} full collection{"s" if system_gc != 1 else ""} came from System.gc(), '
+                      f'-XX:+DisableExplicitGC stops mods from forcing them')
+    return advice or ['The heap size looks right']
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+import discord
+
+from utils.rcon import RCONPool
+from utils.process import ProcessTracker
+from utils.logwatch import LogFollower, parse_event
+from utils.launcher import ServerLauncher
+from utils.players import PlayerCache
+from utils.metrics import registry
+from utils.slp import StatusProbe
+from utils.gclog import GC_LOG_PATH, gc_log_options
+
+if TYPE_CHECKING:
+    from main import Bot
+    from utils.context import Context
+
+
+logging = logging.getLogger(__name__)
+
+# Lifecycle of a server: offline -> confirming -> starting -> online -> stopping -> offline.
+# Confirming is a start waiting for someone to press the button, the server itself is still offline.
+OFFLINE = 'offline'
+CONFIRMING = 'confirming'
+STARTING = 'starting'
+ONLINE = 'online'
+STOPPING = 'stopping'
+
+lifecycle_transitions = registry.counter('satuse_lifecycle_transitions_total', 'Server lifecycle state changes',
+                                         ('instance', 'from', 'to'))
+
+
+class ServerInstance:
+    """One server the bot manages: its directory, launch command, RCON endpoint and lifecycle state
+
+    State changes go through `transition`, which checks and sets without awaiting in between, so
+    nothing has to hold a lock while waiting on a confirmation or the server, and reading the state
+    never waits. Only the primary instance dispatches bot events (and is what `bot.server_status`
+    reports), the watchdog, idle, backup and stats cogs follow that one.
+    """
+
+    def __init__(self, bot: Bot, name: str, *,
+                 directory: str,
+                 command: Sequence[str],
+                 rcon_port: int,
+                 rcon_pass: str,
+                 rcon_host: str = 'localhost',
+                 ip: str,
+                 status_host: str = 'localhost',
+                 status_port: Optional[int] = None,
+                 status_ttl: float = 10.0,
+                 gc_logging: bool = False,
+                 modpack: str,
+                 process_match: str,
+                 process_names: Iterable[str],
+                 start_timeout: float,
+                 player_cache_ttl: float,
+                 primary: bool,
+                 on_change: Callable[[], Awaitable[None]]):
+        self.bot = bot
+        self.name: str = name
+        self.directory: str = directory
+        self.ip: str = ip
+        self.modpack: str = modpack
+        self.primary: bool = primary
+        self.start_timeout: float = start_timeout
+        # Refreshes the bot presence after a status change
+        self.on_change: Callable[[], Awaitable[None]] = on_change
+        self.state_key: str = 'server' if primary else f'server:{name}'
+        self.players_key: str = 'players' if primary else f'players:{name}'
+        self.rcon: RCONPool = RCONPool(rcon_host, rcon_port, rcon_pass)
+        self.players: PlayerCache = PlayerCache(self.rcon, ttl=player_cache_ttl,
+                                                on_update=lambda players: self.bot.state.set(self.players_key, players))
+        self.tracker: ProcessTracker = ProcessTracker(process_match, process_names)
+        # Server List Ping, the cheapest way to tell the server is up and done loading
+        self.probe: Optional[StatusProbe] = None
+        if status_port is not None:
+            self.probe = StatusProbe(status_host, status_port, ttl=status_ttl)
+        # GC log of servers we launch, the flags go in through JDK_JAVA_OPTIONS so start scripts need no changes
+        self.gc_log: Optional[str] = os.path.join(directory, *GC_LOG_PATH.split('/')) if gc_logging else None
+        env = None
+        if gc_logging:
+            options = os.environ.get('JDK_JAVA_OPTIONS', '')
+            env = {'JDK_JAVA_OPTIONS': f'{options} {gc_log_options()}'.strip()}
+        self.launcher: ServerLauncher = ServerLauncher(command, directory, on_line=self.on_console_line, env=env)
+        self.log_file: str = os.path.join(directory, 'logs', 'latest.log')
+        self.state: str = OFFLINE
+        # Who has a start or stop confirmation open, a second request is told instead of prompting again
+        self.prompt_by: Optional[str] = None
+        self.start_time: Optional[datetime] = None
+        # Set when we asked the server to stop, so its exit is not treated as a crash
+        self.intentional_stop: bool = False
+        # Set when the log shows the server shutting down by itself
+        self.saw_stopping: bool = False
+        self._log_task: Optional[asyncio.Task] = None
+        self._exit_watcher: Optional[asyncio.Task] = None
+        self._check: Optional[asyncio.Task] = None
+        self._stop_check: Optional[asyncio.Task] = None
+        # `wait_then_online` calls running in the background for start commands
+        self._waiters: Set[asyncio.Task] = set()
+
+    def __repr__(self) -> str:
+        return f'<ServerInstance {self.name!r} state={self.state}>'
+
+    @property
+    def online(self) -> bool:
+        """Running and not shutting down, loading counts"""
+        return self.state in (STARTING, ONLINE)
+
+    @property
+    def loading(self) -> bool:
+        """Launched but not done loading yet"""
+        return self.state == STARTING
+
+    def transition(self, new: str, *expected: str) -> bool:
+        """Moves to `new` if the current state is one of `expected` (or from any state), returns whether it did"""
+        if expected and self.state not in expected:
+            return False
+        if self.state != new:
+            logging.debug(f'[{self.name}] {self.state} -> {new}')
+            lifecycle_transitions.inc(self.name, self.state, new)
+            self.state = new
+        if new == ONLINE:
+            # Up again however it was started, so its next exit is a crash unless we stop it again
+            self.intentional_stop = False
+        return True
+
+    def start(self):
+        self.restore_state()
+        self._log_task = asyncio.create_task(self.watch_log())
+
+    async def close(self):
+        for task in (self._log_task, self._exit_watcher, self._stop_check, *self._waiters):
+            if task is not None:
+                task.cancel()
+        await self.rcon.close()
+
+    def dispatch(self, event: str, *args):
+        if self.primary:
+            self.bot.dispatch(event, *args)
+
+    def restore_state(self):
+        """Picks the server back up after a bot restart, validated with a single PID check instead of a scan"""
+        state = self.bot.state.get(self.state_key)
+        if not state or state.get('pid') is None:
+            return
+        if not self.tracker.restore(state['pid'], state['create_time']):
+            logging.info(f'[{self.name}] Server process {state["pid"]} from the last run is gone')
+            self.bot.state.delete(self.state_key)
+            self.bot.state.delete(self.players_key)
+            return
+        logging.info(f'[{self.name}] Restored running server process {state["pid"]}')
+        self.transition(ONLINE)
+        self.start_time = datetime.fromisoformat(state['start_time']) if state['start_time'] else None
+        players = self.bot.state.get(self.players_key)
+        if players:
+            self.players.seed(players)
+        self.watch_process()
+
+    def save_state(self):
+        if not self.online:
+            self.bot.state.delete(self.state_key)
+            return
+        start = self.start_time
+        state = {
+            'pid': self.tracker.pid,
+            'create_time': self.tracker.create_time,
+            'start_time': start.isoformat() if start is not None else None,
+        }
+        if state != self.bot.state.get(self.state_key):
+            self.bot.state.set(self.state_key, state)
+
+    def on_console_line(self, line: str):
+        self.dispatch('server_console_line', line)
+
+    async def launch(self, reason: str, *, expected: Tuple[str, ...] = (OFFLINE,)) -> bool:
+        """Starts the server process, returns False without launching when it is not in one of the `expected` states"""
+        if not self.transition(STARTING, *expected):
+            return False
+        self.start_time = discord.utils.utcnow()
+        try:
+            if self.gc_log is not None:
+                # The JVM will not start if it cannot open its log file
+                os.makedirs(os.path.dirname(self.gc_log), exist_ok=True)
+            await self.launcher.start()
+        except BaseException:
+            # Nothing is running, whichever state we came from (a confirmed start is CONFIRMING)
+            self.transition(OFFLINE, STARTING)
+            raise
+        self.intentional_stop = False
+        self.saw_stopping = False
+        if self.probe is not None:
+            self.probe.invalidate()
+        self.save_state()
+        self.watch_process()
+        await self.on_change()
+        self.dispatch('server_launch', reason)
+        return True
+
+    async def wait_then_online(self, ctx: Optional[Context] = None, *, prefix: str = ''):
+        # Several callers can wait on the same start, only the first one to wake up changes the state
+        if await self.launcher.wait_ready(timeout=self.start_timeout):
+            if self.transition(ONLINE, STARTING):
+                logging.info(f'[{self.name}] Server finished loading in {self.launcher.ready_time}s')
+                await self.on_change()
+            msg = 'The server has finished loading!'
+        elif self.launcher.running:
+            if self.transition(ONLINE, STARTING):
+                logging.warning(f'[{self.name}] Server has not finished loading after {self.start_timeout} seconds')
+                await self.on_change()
+            return
+        else:
+            msg = 'The server stopped before it finished loading. Please message me!'
+        if ctx is None:
+            return
+        try:
+            await ctx.reply(f'{prefix}{msg}', mention_author=False)
+        except discord.HTTPException:
+            # The interaction token may have expired while the server was loading
+            pass
+
+    def wait_in_background(self, ctx: Optional[Context] = None, *, prefix: str = '') -> asyncio.Task:
+        """Runs `wait_then_online` as a task that is kept until it finishes and cancelled on close"""
+        task = asyncio.create_task(self.wait_then_online(ctx, prefix=prefix))
+        self._waiters.add(task)
+        task.add_done_callback(self._waiter_done)
+        return task
+
+    def _waiter_done(self, task: asyncio.Task):
+        self._waiters.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f'[{self.name}] Failed to report the server start', exc_info=task.exception())
+
+    async def request_stop(self, reason: str) -> bool:
+        """Asks the server to stop, its exit will not count as a crash
+
+        Returns False when it is already stopping or not running.
+        """
+        previous = self.state
+        if not self.transition(STOPPING, STARTING, ONLINE):
+            return False
+        logging.info(f'[{self.name}] Stopping server... | {reason}')
+        self.intentional_stop = True
+        try:
+            await self.rcon.send('stop')
+        except Exception:
+            self.intentional_stop = False
+            self.transition(previous, STOPPING)
+            raise
+        await self.on_change()
+        if not self.watching_process:
+            # Nothing will tell us when it is gone, keep checking until it is
+            self._stop_check = asyncio.create_task(self._check_until_stopped())
+        return True
+
+    async def _check_until_stopped(self, interval: float = 10, attempts: int = 30):
+        for _ in range(attempts):
+            await asyncio.sleep(interval)
+            if self.state != STOPPING:
+                return
+            await self.check_status()
+
+    async def set_online(self):
+        self.transition(ONLINE)
+        self.start_time = discord.utils.utcnow()
+        self.save_state()
+        await self.on_change()
+
+    async def set_offline(self):
+        # A start waiting for confirmation stays, the server was not running for it either
+        self.transition(OFFLINE, STARTING, ONLINE, STOPPING)
+        if self.probe is not None:
+            self.probe.invalidate()
+        self.save_state()
+        await self.on_change()
+
+    async def watch_log(self):
+        """Follows the server log and dispatches events for the lines we care about"""
+        async for line in LogFollower(self.log_file):
+            self.dispatch('server_log_line', line)
+            event = parse_event(line)
+            if event is not None:
+                name, args = event
+                if self.primary:
+                    # The Server cog hands these back to `handle_event`
+                    self.bot.dispatch(name, *args)
+                else:
+                    await self.handle_event(name, args)
+
+    async def handle_event(self, event: str, args: Sequence[str]):
+        if event == 'server_ready':
+            logging.info(f'[{self.name}] Server finished loading in {args[0]}s')
+            if self.probe is not None:
+                self.probe.invalidate()
+            if self.state in (OFFLINE, CONFIRMING):
+                await self.set_online()
+            elif self.transition(ONLINE, STARTING):
+                await self.on_change()
+            if await self.tracker.is_running():
+                self.save_state()
+                self.watch_process()
+        elif event == 'server_stopping':
+            self.saw_stopping = True
+            if not self.online:
+                return
+            logging.info(f'[{self.name}] Server is stopping, changing status...')
+            if self.watching_process:
+                # Offline once the process is gone, so nobody launches a second one while it saves
+                self.transition(STOPPING)
+                await self.on_change()
+            else:
+                await self.set_offline()
+        elif event in ('player_join', 'player_leave'):
+            self.players.invalidate()
+
+    @property
+    def watching_process(self) -> bool:
+        return self._exit_watcher is not None and not self._exit_watcher.done()
+
+    def watch_process(self):
+        if self._exit_watcher is None or self._exit_watcher.done():
+            self._exit_watcher = asyncio.create_task(self._wait_for_exit())
+
+    async def _wait_for_exit(self):
+        # Only a process we launched ourselves can be awaited directly and has an exit code
+        returncode = None
+        if self.launcher.running:
+            returncode = await self.launcher.wait()
+        else:
+            await self.tracker.wait()
+        logging.info(f'[{self.name}] Server process exited with code {returncode}')
+        self.tracker.forget()
+        self.players.invalidate()
+        self.bot.state.delete(self.players_key)
+        self.dispatch('server_process_exit', returncode)
+        if self.state in (STARTING, ONLINE, STOPPING):
+            await self.set_offline()
+
+    async def probe_status(self) -> Optional[dict]:
+        """Server List Ping status, None if it is not answering or there is no probe"""
+        if self.probe is None:
+            return None
+        return await self.probe.get()
+
+    async def check_status(self):
+        """Makes sure the state matches the server, concurrent calls share a single check"""
+        if self._check is None or self._check.done():
+            self._check = asyncio.create_task(self._check_status())
+        # Shielded so a cancelled caller does not cancel the check for everyone else
+        await asyncio.shield(self._check)
+
+    async def _check_status(self):
+        logging.debug(f'[{self.name}] Checking server status...')
+        # A ping answer means it is up, loaded, and saves a process scan (which cannot see another machine)
+        answer = await self.probe_status()
+        if answer is not None or await self.tracker.is_running():
+            if self.launcher.running or self.tracker.process is not None:
+                self.watch_process()
+            if self.state == STOPPING:
+                return
+            if self.online:
+                if answer is not None and self.transition(ONLINE, STARTING):
+                    await self.on_change()
+                self.save_state()
+                return
+            logging.info(f'[{self.name}] Server is running, changing status...')
+            await self.set_online()
+        elif self.state in (STARTING, ONLINE, STOPPING) and not self.launcher.running:
+            logging.info(f'[{self.name}] Server is not running, changing status...')
+            await self.set_offline()
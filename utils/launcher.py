@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import subprocess
+from typing import Callable, Dict, List, Optional, Sequence
+
+logging = logging.getLogger(__name__)
+
+ready_re = re.compile(r'\]: Done \((?P<time>[\d.,]+)s\)!')
+
+
+class ServerLauncher:
+    """Starts the server as a child process and drains its output
+
+    stdout/stderr are read line by line for as long as the server runs, so the
+    server can never block on a full pipe. The `Done (...)!` line sets `ready`.
+    """
+
+    def __init__(self, command: Sequence[str], cwd: str, *,
+                 on_line: Optional[Callable[[str], None]] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.command: List[str] = list(command)
+        self.cwd: str = cwd
+        self.on_line: Optional[Callable[[str], None]] = on_line
+        self.env: Optional[Dict[str, str]] = env
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.ready: asyncio.Event = asyncio.Event()
+        self.ready_time: Optional[str] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> asyncio.subprocess.Process:
+        if self.running:
+            raise RuntimeError('Server process is already running')
+
+        kwargs = {}
+        if os.name == 'nt':
+            kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # Do not forward signals meant for the bot (e.g. Ctrl+C) to the server
+            kwargs['start_new_session'] = True
+
+        env = None
+        if self.env:
+            env = {**os.environ, **self.env}
+
+        command = list(self.command)
+        # Windows does not look for the program in `cwd`, so a script there is passed by its full path
+        program = os.path.join(self.cwd, command[0])
+        if not os.path.isabs(command[0]) and os.path.isfile(program):
+            command[0] = program
+
+        self.ready.clear()
+        self.ready_time = None
+        self.process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=self.cwd,
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=1024 * 1024,
+            **kwargs,
+        )
+        logging.info(f'Launched {self.command} in {self.cwd} (pid {self.process.pid})')
+        self._reader_task = asyncio.create_task(self._read_output(self.process.stdout))
+        return self.process
+
+    async def _read_output(self, stream: asyncio.StreamReader) -> None:
+        # Inside a line longer than the buffer limit, dropped up to its newline
+        skipping = False
+        while True:
+            try:
+                raw = await stream.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                # The last line may not end with a newline, empty at the end of the output
+                raw = e.partial
+            except asyncio.LimitOverrunError as e:
+                await stream.readexactly(e.consumed)
+                skipping = True
+                continue
+            if not raw:
+                break
+            if skipping:
+                skipping = False
+                continue
+            line = raw.rstrip(b'\r\n').decode('utf-8', errors='replace')
+            if not self.ready.is_set():
+                match = ready_re.search(line)
+                if match:
+                    self.ready_time = match.group('time')
+                    self.ready.set()
+            if self.on_line is not None:
+                try:
+                    self.on_line(line)
+                except Exception:
+                    logging.exception('Error in server output handler')
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the server to finish loading, returns False if it exited or timed out first"""
+        if self.process is None:
+            return False
+        ready = asyncio.create_task(self.ready.wait())
+        exited = asyncio.create_task(self.process.wait())
+        try:
+            await asyncio.wait((ready, exited), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready.cancel()
+            exited.cancel()
+        return self.ready.is_set()
+
+    async def wait(self) -> Optional[int]:
+        """Waits for the server process to exit and returns its exit code"""
+        if self.process is None:
+            return None
+        returncode = await self.process.wait()
+        if self._reader_task is not None:
+            await self._reader_task
+        return returncode
+
+    async def write(self, line: str) -> None:
+        """Writes a line to the server console"""
+        if not self.running or self.process.stdin is None:
+            raise RuntimeError('Server process is not running')
+        self.process.stdin.write(line.encode('utf-8') + b'\n')
+        await self.process.stdin.drain()
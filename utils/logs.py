@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import gzip
+import os
+import re
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+BLOCK_SIZE = 64 * 1024
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def tail(path: str, lines: int) -> List[str]:
+    """Returns the last `lines` lines of a file, reading backwards from the end in blocks"""
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        data = b''
+        # One extra newline since the file usually ends with one
+        while pos > 0 and data.count(b'\n') <= lines:
+            read = min(BLOCK_SIZE, pos)
+            pos -= read
+            f.seek(pos)
+            data = f.read(read) + data
+    return [line.decode('utf-8', errors='replace') for line in data.splitlines()[-lines:]]
+
+
+class LogCursor:
+    """Remembers how far into a log file we have read
+
+    `read_new` returns whatever was written since the previous call, if the file was
+    rotated (new inode or shorter than our offset) it starts again from the top.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.offset: Optional[int] = None
+        self._inode: Optional[int] = None
+
+    def read_new(self, *, max_bytes: int = 1024 * 1024) -> Tuple[str, bool]:
+        """Returns (text, truncated), at most the last `max_bytes` of new data are returned"""
+        st = os.stat(self.path)
+        if self.offset is None or st.st_ino != self._inode or st.st_size < self.offset:
+            self.offset, self._inode = 0, st.st_ino
+
+        start = max(self.offset, st.st_size - max_bytes)
+        truncated = start > self.offset
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            data = f.read(st.st_size - start)
+        self.offset = st.st_size
+        if truncated:
+            # Do not start in the middle of a line
+            data = data[data.find(b'\n') + 1:]
+        return data.decode('utf-8', errors='replace'), truncated
+
+
+def open_log(path: str):
+    """Opens a log for reading bytes, gzipped if it ends in .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def grep_file(path: str, pattern: re.Pattern) -> Iterator[str]:
+    """Yields the lines of a (possibly gzipped) file matching a bytes pattern
+
+    The file is read in large chunks and the regex runs over a whole chunk at once,
+    so only matching lines are ever split out and decoded.
+    """
+    with open_log(path) as f:
+        leftover = b''
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                data, leftover = leftover, b''
+            else:
+                data = leftover + chunk
+                cut = data.rfind(b'\n') + 1
+                if cut == 0:
+                    leftover = data
+                    continue
+                data, leftover = data[:cut], data[cut:]
+
+            pos = 0
+            while True:
+                match = pattern.search(data, pos)
+                if match is None:
+                    break
+                start = data.rfind(b'\n', 0, match.start()) + 1
+                end = data.find(b'\n', match.end())
+                if end == -1:
+                    end = len(data)
+                yield data[start:end].rstrip(b'\r').decode('utf-8', errors='replace')
+                pos = end + 1
+            if not chunk:
+                break
+
+
+# `2024-01-01-3.log.gz`, Forge's debug logs repeat latest.log and are left out
+rotated_re = re.compile(r'^(?P<date>\d{4}-\d{2}-\d{2})-(?P<n>\d+)\.log(?:\.gz)?$')
+
+
+def log_files(log_dir: str) -> List[str]:
+    """Returns rotated logs oldest first, followed by latest.log"""
+    rotated = []
+    for name in os.listdir(log_dir):
+        match = rotated_re.match(name)
+        if match is not None:
+            rotated.append((match['date'], int(match['n']), name))
+    files = [os.path.join(log_dir, name) for _, _, name in sorted(rotated)]
+    latest = os.path.join(log_dir, 'latest.log')
+    if os.path.isfile(latest):
+        files.append(latest)
+    return files
+
+
+def grep(paths: Iterable[str], pattern: str, *, limit: int = 500) -> Tuple[List[str], int]:
+    """Searches files for a case-insensitive regex, returns (last `limit` matches, total match count)"""
+    regex = re.compile(pattern.encode('utf-8'), re.IGNORECASE | re.MULTILINE)
+    matches: deque = deque(maxlen=limit)
+    total = 0
+    for path in paths:
+        name = os.path.basename(path)
+        for line in grep_file(path, regex):
+            total += 1
+            matches.append(f'{name}: {line}')
+    return list(matches), total
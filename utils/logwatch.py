@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+from typing import AsyncIterator, List, Optional, Tuple
+
+# Server log lines look like `[12:34:56] [Server thread/INFO] [minecraft/DedicatedServer]: message`
+_events = (
+    ('server_ready', re.compile(r'\]: Done \((?P<time>[\d.,]+)s\)!')),
+    ('server_stopping', re.compile(r'\]: Stopping (?:the )?server$')),
+    ('player_join', re.compile(r'\]: (?P<player>\w{1,16}) joined the game$')),
+    ('player_leave', re.compile(r'\]: (?P<player>\w{1,16}) left the game$')),
+)
+
+
+def parse_event(line: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """Returns (event name, args) if the log line is one we dispatch an event for"""
+    if ']: ' not in line:
+        return None
+    for event, regex in _events:
+        match = regex.search(line)
+        if match:
+            return event, match.groups()
+    return None
+
+
+class LogFollower:
+    """Follows a log file like `tail -F`
+
+    The file is only opened while reading new data, so the server can still rotate it
+    (on Windows an open handle would stop `latest.log` from being renamed on startup).
+    A new inode or a file shorter than our offset means it was rotated, so we read it from the start.
+    """
+
+    def __init__(self, path: str, *, interval: float = 1.0, from_start: bool = False):
+        self.path: str = path
+        self.interval: float = interval
+        self.offset: Optional[int] = 0 if from_start else None
+        self._inode: Optional[int] = None
+        self._partial: bytes = b''
+
+    def _read(self) -> List[str]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.offset is None:
+                # Anything written once it shows up is new
+                self.offset = 0
+            return []
+
+        if self.offset is None:
+            # First look at the file, only follow what is written from now on
+            self.offset, self._inode = st.st_size, st.st_ino
+            return []
+        if st.st_ino != self._inode or st.st_size < self.offset:
+            self.offset, self._inode, self._partial = 0, st.st_ino, b''
+        if st.st_size == self.offset:
+            return []
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        data = self._partial + data
+        *lines, self._partial = data.split(b'\n')
+        return [line.rstrip(b'\r').decode('utf-8', errors='replace') for line in lines]
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            for line in await asyncio.to_thread(self._read):
+                yield line
+            await asyncio.sleep(self.interval)
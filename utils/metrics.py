@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, values)) + '}'
+
+
+class Histogram:
+    """A Prometheus style histogram with fixed buckets, one set of counts per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def labels(self) -> List[Tuple[str, ...]]:
+        return list(self._series)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Estimates a quantile by interpolating inside the bucket it falls in"""
+        series = self._series.get(labels)
+        if not series:
+            return float('nan')
+        counts = series[:-1]
+        rank = q * sum(counts)
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series[:-1]):
+                cumulative += count
+                le = _labels((*self.labelnames, 'le'), (*values, str(bound)))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label = _labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{label} {series[-1]}')
+            lines.append(f'{self.name}_count{label} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for values, value in self._values.items():
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {value}')
+        return lines
+
+
+class Gauge:
+    """A value read from a callback whenever the metrics are rendered"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.func: Callable[[], float] = func
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {self.func()}']
+
+
+class CallbackCounter(Gauge):
+    """A running total kept elsewhere and read from a callback whenever the metrics are rendered"""
+
+    kind = 'counter'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, documentation, labelnames, **kwargs))  # type: ignore
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, documentation, labelnames))  # type: ignore
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+        # Gauges are replaced so a reloaded extension can register its new callback
+        gauge = self.metrics[name] = Gauge(name, documentation, func)
+        return gauge
+
+    def callback_counter(self, name: str, documentation: str, func: Callable[[], float]) -> CallbackCounter:
+        # Replaced like gauges, the callback reads a total that only ever increases
+        counter = self.metrics[name] = CallbackCounter(name, documentation, func)
+        return counter
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())  # type: ignore
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+command_latency = registry.histogram('satuse_command_seconds', 'Time spent running a command', ('command',))
+rcon_rtt = registry.histogram('satuse_rcon_seconds', 'RCON command round trip time', ('command',))
+process_scan = registry.histogram('satuse_process_scan_seconds', 'Time spent scanning the process table')
+loop_lag = registry.histogram('satuse_loop_lag_seconds', 'Event loop scheduling delay',
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+loop_blocked = registry.counter('satuse_loop_blocked_total', 'Times the event loop was blocked above the threshold')
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Optional, TYPE_CHECKING
+
+from utils.common import parse_list_resp
+
+if TYPE_CHECKING:
+    from utils.rcon import RCONPool
+
+
+class PlayerCache:
+    """Caches the parsed `list` response for a short time
+
+    Concurrent callers share a single in-flight RCON request instead of each sending their own.
+    Join/leave events should call `invalidate` so the cached list never lags behind the server.
+    """
+
+    def __init__(self, rcon: RCONPool, *, ttl: float = 30.0, on_update: Optional[Callable[[dict], None]] = None):
+        self.rcon: RCONPool = rcon
+        self.ttl: float = ttl
+        # Called with every freshly fetched player list
+        self.on_update: Optional[Callable[[dict], None]] = on_update
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self._value: Optional[dict] = None
+        self._fetched_at: float = 0.0
+        self._generation: int = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    @property
+    def players(self) -> Optional[dict]:
+        """The last known player list, regardless of age"""
+        return self._value
+
+    def seed(self, value: dict) -> None:
+        """Sets the last known player list without treating it as fresh"""
+        self._value = value
+        self._fetched_at = float('-inf')
+
+    def invalidate(self) -> None:
+        self._value = None
+        self._generation += 1
+
+    async def _fetch(self) -> dict:
+        generation = self._generation
+        try:
+            resp = await self.rcon.send('list')
+        finally:
+            self._inflight = None
+        value = parse_list_resp(resp)
+        # Do not cache a response that raced with a join/leave, or one we could not parse
+        if value and generation == self._generation:
+            self._value = value
+            self._fetched_at = time.monotonic()
+            if self.on_update is not None:
+                self.on_update(value)
+        return value
+
+    async def get(self) -> dict:
+        """Returns the parsed `list` response, see `parse_list_resp`"""
+        if self._value is not None and time.monotonic() - self._fetched_at < self.ttl:
+            self.hits += 1
+            return self._value
+
+        if self._inflight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # Shielded so a cancelled caller does not cancel the request for everyone else
+        return await asyncio.shield(self._inflight)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+_color_re = re.compile(r'§.')
+# Chunky formats numbers with the server locale, so the decimal separator may be a comma
+_progress_re = re.compile(r'Task running for (?P<world>\S+?)\. Processed: (?P<chunks>\d+) chunks '
+                          r'\((?P<percent>[\d.,]+)%\)(?:, ETA: (?P<eta>[\d:]+))?(?:, Rate: (?P<rate>[\d.,]+) cps)?')
+_finished_re = re.compile(r'Task finished for (?P<world>\S+?)\. Processed: (?P<chunks>\d+) chunks')
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    return float(value.replace(',', '.'))
+
+
+def parse_progress(resp: str) -> Optional[dict]:
+    """Parses `chunky progress` into {'world', 'chunks', 'percent', 'rate'}, None when no task is running
+
+    `[Chunky] Task running for minecraft:overworld. Processed: 1234 chunks (5.67%), ETA: 1:02:03, Rate: 45.6 cps, ...`
+    """
+    match = _progress_re.search(_color_re.sub('', resp))
+    if match is None:
+        return None
+    return {
+        'world': match['world'],
+        'chunks': int(match['chunks']),
+        'percent': _number(match['percent']),
+        'rate': _number(match['rate']),
+    }
+
+
+def parse_finished(line: str) -> Optional[str]:
+    """The world a `Task finished for ...` log line is about"""
+    if 'Task finished for' not in line:
+        return None
+    match = _finished_re.search(_color_re.sub('', line))
+    return match['world'] if match else None
+
+
+def overloaded(tps: float, mspt: float, *, max_mspt: float, min_tps: float) -> Optional[bool]:
+    """Whether the server is struggling, None when the sample has neither value (NaN)"""
+    if mspt == mspt:
+        return mspt > max_mspt
+    if tps == tps:
+        return tps < min_tps
+    return None
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Iterable, Optional, Union
+
+import psutil
+
+from utils.metrics import process_scan
+
+logging = logging.getLogger(__name__)
+
+
+class ProcessTracker:
+    """Keeps track of the server JVM
+
+    Once the process is found its handle is kept, so later checks only look at that one
+    process (psutil compares the create time too, so a reused PID is not mistaken for it).
+    A full scan of the process table only happens in a worker thread when the handle is gone.
+    """
+
+    def __init__(self, match: str, names: Iterable[str] = ('java', 'java.exe', 'javaw.exe')):
+        self.match: str = os.path.normcase(os.path.abspath(match))
+        self.names: frozenset = frozenset(n.lower() for n in names)
+        self.process: Optional[psutil.Process] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    @property
+    def create_time(self) -> Optional[float]:
+        return self.process.create_time() if self.process is not None else None
+
+    def track(self, process: Union[psutil.Process, int]) -> None:
+        if isinstance(process, int):
+            process = psutil.Process(process)
+        self.process = process
+        logging.debug(f'Tracking server process {process.pid}')
+
+    def restore(self, pid: int, create_time: float) -> bool:
+        """Tracks a previously seen process again if it is still the same one, without a scan"""
+        try:
+            process = psutil.Process(pid)
+            if abs(process.create_time() - create_time) > 1:
+                return False
+        except psutil.Error:
+            return False
+        self.track(process)
+        return self._alive()
+
+    def forget(self) -> None:
+        self.process = None
+
+    def _alive(self) -> bool:
+        if self.process is None:
+            return False
+        try:
+            return self.process.is_running() and self.process.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+    def _within(self, path: str) -> bool:
+        """Whether `path` is the match directory or inside it, by whole path components
+
+        So the server in /srv/atm9 does not also claim a JVM running in /srv/atm9-test.
+        """
+        path = os.path.normcase(os.path.normpath(path))
+        return path == self.match or path.startswith(self.match.rstrip(os.sep) + os.sep)
+
+    def _matches(self, p: psutil.Process) -> bool:
+        try:
+            if p.info['name'] is None or p.info['name'].lower() not in self.names:
+                return False
+            return self._within(p.cwd()) or self._within(p.exe())
+        except psutil.Error:
+            return False
+
+    def _scan(self) -> Optional[psutil.Process]:
+        for p in psutil.process_iter(['name']):
+            if self._matches(p):
+                return p
+        return None
+
+    async def find(self) -> Optional[psutil.Process]:
+        """Returns the server process, or None if it is not running"""
+        if self._alive():
+            return self.process
+        self.process = None
+        with process_scan.time():
+            process = await asyncio.to_thread(self._scan)
+        if process is not None:
+            self.track(process)
+        return process
+
+    async def is_running(self) -> bool:
+        return await self.find() is not None
+
+    async def wait(self, *, interval: float = 2.0) -> None:
+        """Waits until the tracked process exits
+
+        Checking the handle is a single cheap syscall, unlike `psutil.Process.wait`
+        this never ties up a worker thread for the lifetime of the server.
+        """
+        while self._alive():
+            await asyncio.sleep(interval)
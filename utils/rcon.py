@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import struct
+from typing import List, Optional, Tuple
+
+from utils.metrics import rcon_rtt
+
+logging = logging.getLogger(__name__)
+
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_AUTH = 3
+
+# Minecraft splits command responses into packets of at most this many bytes of payload
+MAX_RESPONSE_PAYLOAD = 4096
+
+_header = struct.Struct('<iii')
+
+
+class RCONError(Exception):
+    pass
+
+
+class RCONAuthError(RCONError):
+    pass
+
+
+# Everything a command can fail with: the server down or too slow, a dropped connection, a rejected password
+RCON_ERRORS = (OSError, asyncio.TimeoutError, EOFError, RCONError)
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    payload = body.encode('utf-8') + b'\x00\x00'
+    return _header.pack(len(payload) + 8, request_id, packet_type) + payload
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, str]:
+    """Reads a single packet, returns (request_id, type, body)"""
+    length, request_id, packet_type = _header.unpack(await reader.readexactly(_header.size))
+    payload = await reader.readexactly(length - 8)
+    return request_id, packet_type, payload[:-2].decode('utf-8', errors='replace')
+
+
+class RCONConnection:
+    """A single authenticated RCON connection
+
+    One command at a time: vanilla and Forge read one packet per socket read and drop the
+    connection when a read holds more than one, so nothing may be pipelined. Concurrency comes
+    from `RCONPool`. Responses are split into packets of MAX_RESPONSE_PAYLOAD characters, so a
+    shorter first packet is the whole response. A full one may be followed by more, then an empty
+    marker packet is sent once it arrived: the server answers in order, so the marker's reply
+    tells us the response is complete.
+    """
+
+    def __init__(self, host: str, port: int, password: str, *, timeout: float = 10.0):
+        self.host: str = host
+        self.port: int = port
+        self.password: str = password
+        self.timeout: float = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        # Commands running or waiting for this connection
+        self._queued: int = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def in_flight(self) -> int:
+        return self._queued
+
+    def _next_id(self) -> int:
+        request_id = next(self._ids)
+        if request_id >= 2 ** 31 - 1:
+            self._ids = itertools.count(1)
+            request_id = next(self._ids)
+        return request_id
+
+    async def connect(self) -> None:
+        if self.connected:
+            return
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            await asyncio.wait_for(self._authenticate(reader, writer), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        self._reader, self._writer = reader, writer
+        logging.debug(f'RCON connected to {self.host}:{self.port}')
+
+    async def _authenticate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        auth_id = self._next_id()
+        writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password))
+        await writer.drain()
+        while True:
+            # Some servers send an empty RESPONSE_VALUE before the actual auth response
+            request_id, packet_type, _ = await read_packet(reader)
+            if packet_type == SERVERDATA_AUTH_RESPONSE:
+                break
+        if request_id == -1:
+            raise RCONAuthError('RCON authentication failed')
+
+    async def _exchange(self, command: str) -> str:
+        assert self._reader is not None and self._writer is not None
+        command_id = self._next_id()
+        marker_id: Optional[int] = None
+        self._writer.write(encode_packet(command_id, SERVERDATA_EXECCOMMAND, command))
+        await self._writer.drain()
+        fragments: List[str] = []
+        while True:
+            request_id, _, body = await read_packet(self._reader)
+            if request_id == marker_id:
+                return ''.join(fragments)
+            if request_id != command_id:
+                continue
+            fragments.append(body)
+            if marker_id is None:
+                # Servers split by characters, some by bytes: only short in both is certainly the last packet
+                if len(body) < MAX_RESPONSE_PAYLOAD and len(body.encode('utf-8')) < MAX_RESPONSE_PAYLOAD:
+                    return body
+                marker_id = self._next_id()
+                self._writer.write(encode_packet(marker_id, SERVERDATA_RESPONSE_VALUE, ''))
+                await self._writer.drain()
+
+    def _teardown(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def send(self, command: str, *, timeout: Optional[float] = None) -> str:
+        self._queued += 1
+        try:
+            async with self._lock:
+                if not self.connected:
+                    await self.connect()
+                try:
+                    with rcon_rtt.time(command.split(' ', 1)[0]):
+                        return await asyncio.wait_for(self._exchange(command), timeout or self.timeout)
+                except asyncio.IncompleteReadError as e:
+                    self._teardown()
+                    raise ConnectionResetError('RCON connection closed') from e
+                except BaseException:
+                    # A late response would be read as the answer to the next command
+                    self._teardown()
+                    raise
+        finally:
+            self._queued -= 1
+
+    async def close(self) -> None:
+        writer = self._writer
+        self._teardown()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class RCONPool:
+    """A small pool of persistent RCON connections
+
+    Connections are opened lazily and reopened after the server restarts, each runs one
+    command at a time and a command goes to the connection with the fewest commands queued.
+    """
+
+    def __init__(self, host: str, port: int, password: str, *, size: int = 2, timeout: float = 10.0):
+        self.host: str = host
+        self.port: int = port
+        self._connections: List[RCONConnection] = [
+            RCONConnection(host, port, password, timeout=timeout) for _ in range(size)
+        ]
+
+    async def __aenter__(self) -> RCONPool:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def _pick(self) -> RCONConnection:
+        # Prefer an already open connection so a single caller does not open the whole pool
+        return min(self._connections, key=lambda c: (c.in_flight, not c.connected))
+
+    async def send(self, command: str, *, timeout: Optional[float] = None) -> str:
+        conn = self._pick()
+        was_connected = conn.connected
+        try:
+            return await conn.send(command, timeout=timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not was_connected:
+                raise
+            # The socket went stale (e.g. the server restarted), retry once on a fresh connection
+            logging.info(f'RCON connection to {self.host}:{self.port} lost, reconnecting...')
+            return await conn.send(command, timeout=timeout)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(c.close() for c in self._connections))
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.logs import CHUNK_SIZE, open_log, rotated_re
+
+logging = logging.getLogger(__name__)
+
+# Join, leave and server stop lines
+_session_line = re.compile(
+    rb'\[(?:\d{1,2}\w{3}\d{4} )?(\d\d):(\d\d):(\d\d)(?:[.,]\d{3})?\] \[[^\]\n]*\](?: \[[^\]\n]*\])?: '
+    rb'(?:(\w{1,16}) (joined|left) the game|Stopping (?:the )?server)\r?$'
+)
+# Only lines containing one of these are run through the regex
+_literals = (b' the game', b'Stopping ')
+_line_time = re.compile(rb'\[(?:\d{1,2}\w{3}\d{4} )?(\d\d):(\d\d):(\d\d)')
+
+Session = Tuple[str, float, float]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    player TEXT NOT NULL COLLATE NOCASE,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    PRIMARY KEY (player, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_end ON sessions (end);
+CREATE TABLE IF NOT EXISTS players (
+    player TEXT PRIMARY KEY COLLATE NOCASE,
+    total REAL NOT NULL,
+    sessions INTEGER NOT NULL,
+    first REAL NOT NULL,
+    last REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS peaks (
+    day TEXT PRIMARY KEY,
+    players INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS online (
+    player TEXT PRIMARY KEY COLLATE NOCASE,
+    start REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+'''
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).date().isoformat()
+
+
+def _candidates(data: bytes) -> List[int]:
+    """Start offsets of the lines containing any of the literals"""
+    starts = set()
+    for literal in _literals:
+        i = data.find(literal)
+        while i != -1:
+            starts.add(data.rfind(b'\n', 0, i) + 1)
+            i = data.find(literal, i + len(literal))
+    return sorted(starts)
+
+
+def parse_sessions(path: str, *, anchor: Optional[date] = None,
+                   running: bool = False) -> Tuple[List[Session], Dict[str, Tuple[int, float]]]:
+    """Reads the play sessions out of one server log, returns (sessions, {day: (peak players, when)})
+
+    A log covers a single run of the server, so players still online when it ends were
+    disconnected by the server stopping (or crashing) and are closed at its last line,
+    unless the log is `running`, then they are still playing and left out.
+    Log lines only have the time of day: the date comes from the rotated file name, or for
+    `latest.log` from `anchor` (the day it was last written) counting back over midnights.
+    """
+    # Rotated logs are named after the day they were started on
+    match = rotated_re.match(os.path.basename(path))
+    events: List[Tuple[float, Optional[str], bool]] = []
+    day = 0
+    last: Optional[float] = None
+
+    def seconds(m: re.Match) -> float:
+        nonlocal day, last
+        t = int(m[1]) * 3600 + int(m[2]) * 60 + int(m[3]) + day * 86400
+        if last is not None and t < last - 43200:
+            # Went past midnight
+            day += 1
+            t += 86400
+        last = t
+        return t
+
+    with open_log(path) as f:
+        leftover = b''
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            data = leftover + chunk
+            cut = data.rfind(b'\n') + 1 if chunk else len(data)
+            data, leftover = data[:cut], data[cut:]
+            for start in _candidates(data):
+                end = data.find(b'\n', start)
+                m = _session_line.match(data, start, end if end != -1 else len(data))
+                if m is not None:
+                    events.append((seconds(m), m[4] and m[4].decode(), m[5] == b'joined'))
+            # The last line of each chunk keeps midnights counted through quiet stretches without events
+            if data:
+                tail = _line_time.match(data, data.rfind(b'\n', 0, len(data) - 1) + 1)
+                if tail is not None:
+                    seconds(tail)
+            if not chunk:
+                break
+
+    if match is not None:
+        base = datetime.fromisoformat(match['date'])
+    else:
+        end_day = anchor or datetime.fromtimestamp(os.path.getmtime(path)).date()
+        base = datetime.combine(end_day, datetime.min.time()) - timedelta(days=day)
+
+    def timestamp(t: float) -> float:
+        return (base + timedelta(seconds=t)).timestamp()
+
+    sessions: List[Session] = []
+    peaks: Dict[str, Tuple[int, float]] = {}
+    online: Dict[str, float] = {}
+    for t, player, joined in events:
+        ts = timestamp(t)
+        if player is None:
+            # Stopping the server
+            sessions.extend((p, start, ts) for p, start in online.items())
+            online.clear()
+        elif joined:
+            online.setdefault(player, ts)
+            peak = peaks.get(_day(ts))
+            if peak is None or len(online) > peak[0]:
+                peaks[_day(ts)] = (len(online), ts)
+        elif player in online:
+            sessions.append((player, online.pop(player), ts))
+    if online and last is not None and not running:
+        end = timestamp(last)
+        sessions.extend((p, start, end) for p, start in online.items())
+    return sessions, peaks
+
+
+class SessionStore:
+    """Player sessions in SQLite, append-only, with per player totals kept up to date on insert
+
+    `playtime`, `seen` and `peak` read a single row from the `players`/`peaks` tables,
+    a time window only range scans the sessions index, so nothing ever re-reads the logs.
+    Players online right now are kept in `online` so a session survives a bot restart.
+    """
+
+    def __init__(self, path: str, *, workers: Optional[int] = None):
+        self.path: str = path
+        self.workers: Optional[int] = workers
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._open)
+
+    async def _run(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _add(self, sessions: Iterable[Session], peaks: Dict[str, Tuple[int, float]]) -> None:
+        assert self._conn is not None
+        with self._conn:
+            for player, start, end in sessions:
+                inserted = self._conn.execute('INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)',
+                                              (player, start, end)).rowcount
+                if not inserted:
+                    continue
+                self._conn.execute(
+                    'INSERT INTO players VALUES (?, ?, 1, ?, ?) ON CONFLICT (player) DO UPDATE SET '
+                    'total = total + excluded.total, sessions = sessions + 1, '
+                    'first = min(first, excluded.first), last = max(last, excluded.last)',
+                    (player, end - start, start, end))
+            for day, (players, at) in peaks.items():
+                self._conn.execute('INSERT INTO peaks VALUES (?, ?, ?) ON CONFLICT (day) DO UPDATE SET '
+                                   'players = excluded.players, at = excluded.at '
+                                   'WHERE excluded.players > peaks.players', (day, players, at))
+
+    def _join(self, player: str, start: float, count: int) -> None:
+        assert self._conn is not None
+        with self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO online VALUES (?, ?)', (player, start))
+        self._add((), {_day(start): (count, start)})
+
+    def _leave(self, player: str, end: float) -> None:
+        assert self._conn is not None
+        row = self._conn.execute('SELECT player, start FROM online WHERE player = ?', (player,)).fetchone()
+        if row is None:
+            return
+        with self._conn:
+            self._conn.execute('DELETE FROM online WHERE player = ?', (player,))
+        self._add([(row[0], row[1], end)], {})
+
+    def _leave_all(self, end: Optional[float]) -> int:
+        assert self._conn is not None
+        rows = self._conn.execute('SELECT player, start FROM online').fetchall()
+        if end is None:
+            # The bot was not running when they left, the last heartbeat is the best guess
+            end = self._get_meta('heartbeat')
+        with self._conn:
+            self._conn.execute('DELETE FROM online')
+        self._add([(p, start, max(start, end or start)) for p, start in rows], {})
+        return len(rows)
+
+    async def join(self, player: str, start: float, count: int) -> None:
+        """Opens a session, `count` is the number of players online including them"""
+        await self._run(self._join, player, start, count)
+
+    async def leave(self, player: str, end: float) -> None:
+        await self._run(self._leave, player, end)
+
+    async def leave_all(self, end: Optional[float] = None) -> int:
+        """Closes every open session, at the last heartbeat if no time is given"""
+        return await self._run(self._leave_all, end)
+
+    def _get_meta(self, key: str) -> Optional[float]:
+        assert self._conn is not None
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: float) -> None:
+        assert self._conn is not None
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    async def get_meta(self, key: str) -> Optional[float]:
+        return await self._run(self._get_meta, key)
+
+    async def set_meta(self, key: str, value: float) -> None:
+        await self._run(self._set_meta, key, value)
+
+    def _online(self) -> Dict[str, float]:
+        assert self._conn is not None
+        return dict(self._conn.execute('SELECT player, start FROM online'))
+
+    async def online(self) -> Dict[str, float]:
+        """Players with an open session and when it started"""
+        return await self._run(self._online)
+
+    def _playtime(self, player: str, since: float) -> Optional[dict]:
+        assert self._conn is not None
+        row = self._conn.execute('SELECT player, total, sessions, first, last FROM players WHERE player = ?',
+                                 (player,)).fetchone()
+        online = self._conn.execute('SELECT player, start FROM online WHERE player = ?', (player,)).fetchone()
+        if row is None and online is None:
+            return None
+        # Sessions ending in the window, the one that started before it is cut at `since`
+        recent = self._conn.execute('SELECT coalesce(sum(end - max(start, ?)), 0) FROM sessions '
+                                    'WHERE player = ? AND end > ?', (since, player, since)).fetchone()[0]
+        name, total, sessions, first, last = row or (online[0], 0.0, 0, online[1], online[1])
+        return {'player': name, 'total': total, 'sessions': sessions, 'first': first, 'last': last,
+                'recent': recent, 'online_since': online[1] if online else None}
+
+    async def playtime(self, player: str, *, since: float = 0.0) -> Optional[dict]:
+        """Totals for a player (case insensitive), `recent` is the playtime after `since`"""
+        return await self._run(self._playtime, player, since)
+
+    def _peak(self, since_day: str) -> dict:
+        assert self._conn is not None
+        best = self._conn.execute('SELECT day, players, at FROM peaks ORDER BY players DESC, at LIMIT 1').fetchone()
+        recent = self._conn.execute('SELECT day, players, at FROM peaks WHERE day >= ? '
+                                    'ORDER BY players DESC, at LIMIT 1', (since_day,)).fetchone()
+        days = self._conn.execute('SELECT day, players FROM peaks ORDER BY day DESC LIMIT 7').fetchall()
+        return {'all_time': best, 'recent': recent, 'days': days}
+
+    async def peak(self, *, since: float) -> dict:
+        """The all time peak, the peak since `since` and the last few days, as (day, players, at)"""
+        return await self._run(self._peak, _day(since))
+
+    def _stats(self) -> Tuple[int, int]:
+        assert self._conn is not None
+        players, sessions = self._conn.execute('SELECT count(*), coalesce(sum(sessions), 0) FROM players').fetchone()
+        return players, sessions
+
+    async def stats(self) -> Tuple[int, int]:
+        """(players, sessions) in the store"""
+        return await self._run(self._stats)
+
+    async def backfill(self, paths: List[str], *, before: float, running: Optional[str] = None) -> Tuple[int, int]:
+        """Imports the sessions in old logs that ended before `before`, one file per process
+
+        `running` is the log of a server that is still up, whoever is online in it is left out.
+        Returns (files read, sessions imported). Sessions already in the store are skipped,
+        so running it twice over the same files is harmless.
+        """
+        # Only logs we can date: anything else (e.g. Forge's debug logs, which repeat latest.log) would be
+        # dated by its mtime and count every session twice
+        paths = [p for p in paths if rotated_re.match(os.path.basename(p)) or os.path.basename(p) == 'latest.log']
+        loop = asyncio.get_running_loop()
+        sessions: List[Session] = []
+        peaks: Dict[str, Tuple[int, float]] = {}
+        read = 0
+        pool = ProcessPoolExecutor(self.workers)
+        try:
+            futures = [loop.run_in_executor(pool, partial(parse_sessions, path, running=path == running))
+                       for path in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    file_sessions, file_peaks = await future
+                except (OSError, EOFError) as e:
+                    logging.warning(f'Skipping {os.path.basename(path)} | {e}')
+                    continue
+                read += 1
+                sessions.extend(s for s in file_sessions if s[2] < before)
+                for day, peak in file_peaks.items():
+                    if peak[1] < before and (day not in peaks or peak[0] > peaks[day][0]):
+                        peaks[day] = peak
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        await self._run(self._add, sessions, peaks)
+        return read, len(sessions)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            async with self._lock:
+                await asyncio.to_thread(conn.close)
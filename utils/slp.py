@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import struct
+import time
+from typing import Any, List, Optional, Tuple
+
+from utils.metrics import registry
+
+logging = logging.getLogger(__name__)
+
+slp_rtt = registry.histogram('satuse_slp_seconds', 'Server List Ping round trip time')
+
+# Any protocol version gets a status response, -1 is what clients send when they do not know it
+PROTOCOL_VERSION = -1
+# The JSON status response is capped at 32767 characters by the protocol, leave room for the UTF-8 encoding
+MAX_PACKET = 3 * 32767 + 16
+
+
+class SLPError(Exception):
+    pass
+
+
+def encode_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int = 0) -> Tuple[int, int]:
+    """Returns (value, position after it)"""
+    value = 0
+    for shift in range(0, 35, 7):
+        if pos >= len(data):
+            raise SLPError('Truncated VarInt')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            if value & 0x80000000:
+                value -= 1 << 32
+            return value, pos
+    raise SLPError('VarInt is too long')
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+    raise SLPError('VarInt is too long')
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return encode_varint(len(data)) + data
+
+
+def decode_string(data: bytes, pos: int = 0) -> Tuple[str, int]:
+    length, pos = decode_varint(data, pos)
+    if length < 0 or pos + length > len(data):
+        raise SLPError('Truncated string')
+    return data[pos:pos + length].decode('utf-8', errors='replace'), pos + length
+
+
+def encode_packet(packet_id: int, payload: bytes = b'') -> bytes:
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Reads a single packet, returns (packet id, payload)"""
+    length = await read_varint(reader)
+    if not 0 < length <= MAX_PACKET:
+        raise SLPError(f'Bad packet length {length}')
+    body = await reader.readexactly(length)
+    packet_id, pos = decode_varint(body)
+    return packet_id, body[pos:]
+
+
+def handshake(host: str, port: int) -> bytes:
+    """Handshake asking for the status state, followed by the status request"""
+    payload = encode_varint(PROTOCOL_VERSION) + encode_string(host) + struct.pack('>H', port) + encode_varint(1)
+    return encode_packet(0x00, payload) + encode_packet(0x00)
+
+
+def _text(component: Any) -> str:
+    """Flattens a chat component (a string, a dict with `text`/`extra`, or a list of them) to plain text"""
+    if isinstance(component, str):
+        return component
+    if isinstance(component, list):
+        return ''.join(_text(c) for c in component)
+    if isinstance(component, dict):
+        return str(component.get('text', '')) + ''.join(_text(c) for c in component.get('extra', ()))
+    return ''
+
+
+def _strip_codes(text: str) -> str:
+    """Removes legacy `§` formatting codes"""
+    out: List[str] = []
+    skip = False
+    for char in text:
+        if skip:
+            skip = False
+        elif char == '§':
+            skip = True
+        else:
+            out.append(char)
+    return ''.join(out)
+
+
+def parse_status(raw: str) -> dict:
+    """The parts of a status response we use"""
+    data = json.loads(raw)
+    players = data.get('players') or {}
+    version = data.get('version') or {}
+    return {
+        'version': _strip_codes(str(version.get('name', ''))),
+        'protocol': version.get('protocol'),
+        'motd': _strip_codes(_text(data.get('description', ''))).strip(),
+        'online': int(players.get('online', 0)),
+        'max': int(players.get('max', 0)),
+        'sample': [p.get('name', '') for p in players.get('sample') or () if isinstance(p, dict)],
+    }
+
+
+async def _ping(host: str, port: int) -> str:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(handshake(host, port))
+        await writer.drain()
+        packet_id, payload = await read_packet(reader)
+        if packet_id != 0x00:
+            raise SLPError(f'Unexpected packet {packet_id:#x}')
+        return decode_string(payload)[0]
+    except asyncio.IncompleteReadError as e:
+        raise SLPError('Connection closed mid response') from e
+    finally:
+        writer.close()
+
+
+async def server_list_ping(host: str, port: int = 25565, *, timeout: float = 3.0) -> dict:
+    """Asks a server for its status, no login or RCON password needed
+
+    Raises OSError/asyncio.TimeoutError when nothing answers (the server is down or still loading,
+    it only starts listening once the world is loaded) and SLPError on a garbled response.
+    """
+    start = time.perf_counter()
+    raw = await asyncio.wait_for(_ping(host, port), timeout)
+    elapsed = time.perf_counter() - start
+    slp_rtt.observe(elapsed)
+    try:
+        status = parse_status(raw)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise SLPError(f'Bad status response: {e}') from e
+    status['latency'] = elapsed
+    return status
+
+
+class StatusProbe:
+    """Caches the Server List Ping status of one server for a short time
+
+    Concurrent callers share a single in-flight ping. `get` returns None when the server
+    does not answer, which is cached too so a down server is not hammered with connects.
+    """
+
+    def __init__(self, host: str, port: int, *, ttl: float = 10.0, timeout: float = 3.0):
+        self.host: str = host
+        self.port: int = port
+        self.ttl: float = ttl
+        self.timeout: float = timeout
+        self.hits: int = 0
+        self.misses: int = 0
+        self._value: Optional[dict] = None
+        self._fetched_at: float = float('-inf')
+        self._inflight: Optional[asyncio.Future] = None
+
+    @property
+    def last(self) -> Optional[dict]:
+        """The last known status, regardless of age"""
+        return self._value
+
+    def invalidate(self) -> None:
+        self._fetched_at = float('-inf')
+
+    async def _fetch(self) -> Optional[dict]:
+        try:
+            value = await server_list_ping(self.host, self.port, timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError, SLPError) as e:
+            logging.debug(f'No status from {self.host}:{self.port} | {e!r}')
+            value = None
+        finally:
+            self._inflight = None
+        self._value = value
+        self._fetched_at = time.monotonic()
+        return value
+
+    async def get(self) -> Optional[dict]:
+        """The server status, or None if it is not answering"""
+        if time.monotonic() - self._fetched_at < self.ttl:
+            self.hits += 1
+            return self._value
+        if self._inflight is None:
+            self.misses += 1
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # Shielded so a cancelled caller does not cancel the ping for everyone else
+        return await asyncio.shield(self._inflight)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# `[12:34:56] [thread/LEVEL] [logger/MARKER]: msg` in latest.log, debug.log adds the date and milliseconds:
+# `[15Jan2024 12:34:56.789] [thread/LEVEL] [logger/MARKER]: msg`
+_line = (rb'\[(?:\d{1,2}\w{3}\d{4} )?(?P<h>\d\d):(?P<m>\d\d):(?P<s>\d\d)(?:[.,](?P<ms>\d{3}))?\] '
+         rb'\[(?P<thread>[^\]/]+)/\w+\](?: \[[^\]]*\])?: ')
+
+# Lines marking the start of each load phase, in order, the last one marks the end of startup
+PHASES: Tuple[Tuple[str, bytes], ...] = (
+    ('bootstrap', b'ModLauncher running'),
+    ('mod loading', b'Launching target'),
+    ('server init', b'Starting minecraft server version'),
+    ('world load', b'Preparing level'),
+    ('done', b'Done ('),
+)
+
+# Lines that say which mod a mod loading thread is working on, as (literal to search for, regex)
+MOD_PATTERNS: Tuple[Tuple[bytes, bytes], ...] = (
+    (b'Loading mod ', rb'Loading mod (?:instance )?(?P<mod>[\w.\-]+)'),
+    (b'for modid ', rb'for modid (?P<mod>[\w.\-]+)'),
+    (b'into the eventbus for ', rb'into the eventbus for (?P<mod>[\w.\-]+)'),
+    (b'Dispatching ', rb'Dispatching \w+ (?:event )?to (?P<mod>[\w.\-]+)'),
+)
+
+
+def _compile(patterns: Tuple[Tuple[bytes, bytes], ...]) -> re.Pattern:
+    phases = b'|'.join(re.escape(marker) for _, marker in PHASES)
+    mods = b'|'.join(p.replace(b'(?P<mod>', f'(?P<mod{i}>'.encode()) for i, (_, p) in enumerate(patterns))
+    return re.compile(_line + rb'(?:(?P<phase>' + phases + rb')|[^\n]*?(?:' + mods + rb'))')
+
+
+class StartupProfiler:
+    """Attributes server startup time to load phases and mods from its log
+
+    Lines are found with plain substring searches for the marker literals, the line regex only
+    runs on those, so the bulk of a debug log is never parsed. The time between a mod's line
+    and the next marker on the same thread is counted for that mod, so mods loading in parallel
+    on several worker threads are each charged their own time.
+    Data can be fed in chunks of any size, which keeps memory flat on huge debug logs.
+    """
+
+    def __init__(self, mod_patterns: Tuple[Tuple[bytes, bytes], ...] = MOD_PATTERNS):
+        self._regex: re.Pattern = _compile(mod_patterns)
+        self._mod_groups: Tuple[str, ...] = tuple(f'mod{i}' for i in range(len(mod_patterns)))
+        self._literals: Tuple[bytes, ...] = tuple(marker for _, marker in PHASES) + tuple(lit for lit, _ in mod_patterns)
+        self._partial: bytes = b''
+        self._day: float = 0.0
+        self._last_time: Optional[float] = None
+        self._markers: Dict[bytes, str] = {marker: name for name, marker in PHASES}
+        # phase name -> time its marker was seen
+        self.phase_start: Dict[str, float] = {}
+        self.mods: Dict[str, float] = {}
+        # thread -> (mod, since)
+        self._current: Dict[bytes, Tuple[str, float]] = {}
+        self.first: Optional[float] = None
+        self.done: bool = False
+
+    def _time(self, match: re.Match) -> float:
+        t = int(match['h']) * 3600 + int(match['m']) * 60 + int(match['s'])
+        if match['ms']:
+            t += int(match['ms']) / 1000
+        t += self._day
+        if self._last_time is not None and t < self._last_time - 43200:
+            # Went past midnight
+            self._day += 86400
+            t += 86400
+        self._last_time = t
+        return t
+
+    def _close(self, thread: bytes, now: float) -> None:
+        current = self._current.pop(thread, None)
+        if current is not None:
+            mod, since = current
+            self.mods[mod] = self.mods.get(mod, 0.0) + now - since
+
+    def _handle(self, match: re.Match) -> None:
+        now = self._time(match)
+        if self.first is None:
+            self.first = now
+        phase = match['phase']
+        if phase is not None:
+            name = self._markers[phase]
+            if name not in self.phase_start:
+                self.phase_start[name] = now
+            for thread in list(self._current):
+                self._close(thread, now)
+            if name == PHASES[-1][0]:
+                self.done = True
+            return
+
+        thread = match['thread']
+        self._close(thread, now)
+        mod = next(match[g] for g in self._mod_groups if match[g] is not None)
+        self._current[thread] = (mod.decode('utf-8', errors='replace'), now)
+
+    def _candidates(self, data: bytes, end: int) -> List[int]:
+        """Start offsets of the lines containing any marker literal"""
+        starts = set()
+        for literal in self._literals:
+            i = data.find(literal, 0, end)
+            while i != -1:
+                starts.add(data.rfind(b'\n', 0, i) + 1)
+                i = data.find(b'\n', i, end)
+                if i == -1:
+                    break
+                i = data.find(literal, i, end)
+        return sorted(starts)
+
+    def feed(self, data: bytes) -> None:
+        if self.done:
+            return
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        for start in self._candidates(data, end):
+            match = self._regex.match(data, start, data.find(b'\n', start, end))
+            if match is None:
+                continue
+            self._handle(match)
+            if self.done:
+                return
+
+    def result(self) -> dict:
+        """Phase durations and time per mod, in seconds"""
+        phases = {}
+        names = [name for name, _ in PHASES]
+        seen = [name for name in names if name in self.phase_start]
+        for name, after in zip(seen, seen[1:]):
+            phases[name] = self.phase_start[after] - self.phase_start[name]
+        end = self.phase_start.get(names[-1], self._last_time)
+        total = end - self.first if end is not None and self.first is not None else 0.0
+        return {
+            'complete': self.done,
+            'total': total,
+            'phases': phases,
+            'mods': dict(sorted(self.mods.items(), key=lambda kv: kv[1], reverse=True)),
+        }
+
+
+def profile_file(path: str, *, chunk_size: int = 4 * 1024 * 1024, start_offset: int = 0) -> dict:
+    """Profiles a log file in fixed size chunks"""
+    profiler = StartupProfiler()
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        while not profiler.done:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            profiler.feed(chunk)
+        # The last line may not have a newline yet
+        profiler.feed(b'\n')
+    return profiler.result()
+
+
+def compare(current: dict, previous: Optional[dict], key: str, limit: int) -> List[Tuple[str, float, Optional[float]]]:
+    """Returns the `limit` largest entries of `current[key]` with the change since `previous`"""
+    items = sorted(current[key].items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    rows = []
+    for name, value in items:
+        before = previous[key].get(name) if previous is not None else None
+        rows.append((name, value, value - before if before is not None else None))
+    return rows
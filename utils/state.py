@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Optional, Set
+
+logging = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Small key/value store in SQLite (WAL mode) for state that should survive a bot restart
+
+    Everything is loaded into memory on `open`, so reads never touch the disk.
+    `set` only marks a key dirty, dirty keys are written in a single transaction
+    from a worker thread at most once every `flush_interval` seconds.
+    """
+
+    def __init__(self, path: str, *, flush_interval: float = 1.0):
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data: Dict[str, Any] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock: asyncio.Lock = asyncio.Lock()
+
+    def _open(self) -> Dict[str, Any]:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        conn.commit()
+        self._conn = conn
+        data = {}
+        for key, value in conn.execute('SELECT key, value FROM state'):
+            try:
+                data[key] = json.loads(value)
+            except json.JSONDecodeError:
+                logging.warning(f'Ignoring corrupt state entry {key!r}')
+        return data
+
+    async def open(self) -> None:
+        self._data = await asyncio.to_thread(self._open)
+        logging.info(f'Loaded {len(self._data)} state entries from {self.path}')
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """Updates a key in memory, it is written to disk with the next batch"""
+        self._data[key] = value
+        self._mark_dirty(key)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+        self._mark_dirty(key)
+
+    def _mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _write(self, rows: Dict[str, Optional[str]]) -> None:
+        assert self._conn is not None
+        with self._conn:
+            for key, value in rows.items():
+                if value is None:
+                    self._conn.execute('DELETE FROM state WHERE key = ?', (key,))
+                else:
+                    self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            if not self._dirty or self._conn is None:
+                return
+            # Serialize on the loop so later `set` calls cannot change a value while it is being written
+            rows = {}
+            for key in self._dirty:
+                value = self._data.get(key)
+                rows[key] = json.dumps(value) if value is not None else None
+            self._dirty.clear()
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except sqlite3.Error as e:
+                logging.error(f'Failed to write state | {e}')
+                self._dirty.update(rows)
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NAN = float('nan')
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+_color_re = re.compile(r'§.')
+_tps_res = (
+    # Forge: `Overall: Mean tick time: 12.345 ms. Mean TPS: 20.000`
+    re.compile(r'Overall.*?Mean tick time: (?P<mspt>[\d.]+) ms\. Mean TPS: (?P<tps>[\d.]+)'),
+    # NeoForge: `Overall: 20.000 TPS (12.345 ms/tick)`
+    re.compile(r'Overall: (?P<tps>[\d.]+) TPS \((?P<mspt>[\d.]+) ms/tick\)'),
+    # Paper/Spigot: `TPS from last 1m, 5m, 15m: 20.0, 20.0, 20.0`
+    re.compile(r'TPS from last 1m, 5m, 15m: \*?(?P<tps>[\d.]+)'),
+)
+
+
+def parse_tps(resp: str) -> Tuple[float, float]:
+    """Parses the response of a tps command into (tps, mspt), missing values are NaN"""
+    resp = _color_re.sub('', resp)
+    for regex in _tps_res:
+        match = regex.search(resp)
+        if match:
+            values = match.groupdict()
+            return float(values['tps']), float(values.get('mspt') or NAN)
+    return NAN, NAN
+
+
+class RingBuffer:
+    """A fixed-size circular buffer of floats backed by an `array`"""
+
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self._data: array = array('d', [NAN]) * capacity
+        self._next: int = 0
+        self._len: int = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, value: float) -> None:
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._len < self.capacity:
+            self._len += 1
+
+    def values(self, last: Optional[int] = None) -> List[float]:
+        """Returns the buffered values oldest first, optionally only the last `last` of them"""
+        n = self._len if last is None else min(last, self._len)
+        start = (self._next - n) % self.capacity
+        if start + n <= self.capacity:
+            return self._data[start:start + n].tolist()
+        return self._data[start:].tolist() + self._data[:self._next].tolist()
+
+    @property
+    def last(self) -> float:
+        if not self._len:
+            return NAN
+        return self._data[self._next - 1]
+
+
+class Telemetry:
+    """One ring buffer per field, all appended to together"""
+
+    FIELDS = ('time', 'cpu', 'rss', 'threads', 'read_rate', 'write_rate', 'tps', 'mspt')
+
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.buffers: Dict[str, RingBuffer] = {field: RingBuffer(capacity) for field in self.FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.buffers['time'])
+
+    def record(self, **sample: float) -> None:
+        for field, buffer in self.buffers.items():
+            buffer.append(sample.get(field, NAN))
+
+    def latest(self, field: str) -> float:
+        return self.buffers[field].last
+
+    def since(self, timestamp: float) -> Dict[str, List[float]]:
+        """Returns every field for the samples taken at or after `timestamp`"""
+        times = self.buffers['time'].values()
+        n = len(times) - next((i for i, t in enumerate(times) if t >= timestamp), len(times))
+        return {field: buffer.values(n) for field, buffer in self.buffers.items()}
+
+
+def summarize(values: Iterable[float]) -> Tuple[float, float, float]:
+    """Returns (min, avg, max) ignoring NaN, all NaN if there is nothing to summarize"""
+    values = [v for v in values if not math.isnan(v)]
+    if not values:
+        return NAN, NAN, NAN
+    return min(values), sum(values) / len(values), max(values)
+
+
+def sparkline(values: List[float], width: int = 40) -> str:
+    """Renders values as a unicode sparkline, averaging them into at most `width` buckets"""
+    if not values:
+        return ''
+    buckets = []
+    size = max(1, math.ceil(len(values) / width))
+    for i in range(0, len(values), size):
+        chunk = [v for v in values[i:i + size] if not math.isnan(v)]
+        buckets.append(sum(chunk) / len(chunk) if chunk else NAN)
+
+    low, _, high = summarize(buckets)
+    if math.isnan(low):
+        return ' ' * len(buckets)
+    span = (high - low) or 1
+    return ''.join(
+        ' ' if math.isnan(v) else SPARK_CHARS[min(len(SPARK_CHARS) - 1, int((v - low) / span * len(SPARK_CHARS)))]
+        for v in buckets
+    )